@@ -5,48 +5,161 @@ import argparse
 import threading
 import traceback
 import datetime
-from queue import Queue, Full
-from flask import Flask, request, jsonify
+import urllib.parse
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory
+from werkzeug.security import safe_join
+
+# shared/ (modules both apps use) lives in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
 
 import cv2
 from gesture import GestureRecognizer
 from capture_modes import CaptureManager, CaptureMode
-from filters import FilterType, get_filter_from_string
+from shared.animation import ANIMATION_FORMATS
+from capture_pipeline import CapturePipeline
+from frame_ring import FrameRing
+from parallel_filters import ParallelFilterExecutor
+from filters import FilterQuality, FilterType, get_filter_from_string, set_filter_quality
 from supabase_manager import SupabaseManager
-from printer import PrinterWorker
+from printer import PrinterWorker, CupsSink, FileSink, Win32Sink, default_sink
+from job_journal import JobJournal, JournaledQueue
+from shared.derivatives import DerivativeStore
+from shared.photo_index import PhotoIndex, encode_cursor, parse_cursor
+from storage_manager import MB, StorageClass, StorageManager
+from remote_fetch import RemoteFetcher
+from rerender import RAW_ROOT, VARIANTS_ROOT, raw_capture_files, raw_manifest_for, remove_raw_capture, save_raw_capture
+import metrics
 
 # Parse Arguments
 parser = argparse.ArgumentParser()
 parser.add_argument("--event-mode", action="store_true", help="Enable event mode (auto-restart, less logging)")
-args = parser.parse_args()
-EVENT_MODE = args.event_mode
+parser.add_argument("--filter-workers", type=int, default=2, help="Background threads filtering captured frames")
+parser.add_argument("--filter-queue-depth", type=int, default=8, help="Max raw frames waiting to be filtered")
+parser.add_argument("--gesture-every", type=int, default=2, help="Run hand detection every Nth preview frame")
+parser.add_argument("--gesture-hz", type=float, default=0, help="Cap hand detection rate (0 = no cap)")
+parser.add_argument("--gesture-width", type=int, default=480, help="Downscale frames to this width for hand detection")
+parser.add_argument("--gesture-confirm", type=int, default=3, help="Consecutive THUMBS_UP detections needed to capture")
+parser.add_argument("--upload-workers", type=int, default=3, help="Concurrent Supabase uploads")
+parser.add_argument("--print-sink", choices=["auto", "win32", "cups", "file"], default="auto", help="Where print jobs go")
+parser.add_argument("--print-layout", default=None, help="Print layout frame, e.g. stranger_things (default: none)")
+parser.add_argument("--animation-format", choices=sorted(ANIMATION_FORMATS), default="gif", help="Output format for GIF mode captures")
+parser.add_argument("--animation-width", type=int, default=640, help="Width animations are downscaled to (0 = camera resolution)")
+parser.add_argument("--boomerang", action="store_true", help="Play animations forward then backward")
+parser.add_argument("--filter-quality", choices=[q.value for q in FilterQuality], default="balanced",
+                    help="full = reference output; balanced/fast blur on a downscaled copy for speed on large sensors")
+parser.add_argument("--parallel-filters", type=int, default=0, help="Filter burst/GIF frames across N processes (0 = off)")
+parser.add_argument("--save-raw", action="store_true", help="Also keep each capture's unfiltered frames, for rerender.py")
+parser.add_argument("--derivative-max-age", type=int, default=86400, help="Cache lifetime (s) for /photos/<file>?size= responses")
+parser.add_argument("--budget-originals-mb", type=int, default=0, help="Local budget for saved captures; only uploaded ones are evicted (0 = none)")
+parser.add_argument("--budget-derivatives-mb", type=int, default=2048, help="Local budget for thumb/web/print copies (0 = none)")
+parser.add_argument("--budget-raw-mb", type=int, default=0, help="Local budget for --save-raw frames (0 = none)")
+parser.add_argument("--budget-variants-mb", type=int, default=1024, help="Local budget for rerender.py output (0 = none)")
+parser.add_argument("--budget-print-cache-mb", type=int, default=1024, help="Local budget for rendered print pages (0 = none)")
+parser.add_argument("--budget-temp-mb", type=int, default=512, help="Local budget for photos fetched for /print (0 = none)")
+parser.add_argument("--min-free-mb", type=int, default=1024, help="Evict to keep this much disk free (0 = off)")
+parser.add_argument("--fetch-workers", type=int, default=2, help="Concurrent downloads for /print of remote images")
+parser.add_argument("--fetch-timeout", type=float, default=15.0, help="Socket timeout (s) for /print downloads")
+parser.add_argument("--fetch-fresh-for", type=float, default=3600.0, help="Reuse a downloaded /print image without revalidating for this long (s)")
+# Set by setup(). On Windows, spawned filter workers import this module as
+# __mp_main__, so nothing below may open databases, start threads or touch printers at import time
+args = None
+EVENT_MODE = False
 
 # Global State
 shutdown_event = threading.Event()
 state_lock = threading.Lock()
 current_mode = CaptureMode.SINGLE
 current_filter = FilterType.STRANGER_THEME
+active_recognizer = None
+active_ring = None
 
 ALLOWED_FILTERS = [f.name for f in FilterType]
 ALLOWED_MODES = [m.value.upper() for m in CaptureMode]
 
-# Queues
-upload_queue = Queue()
-print_queue = Queue()
-capture_queue = Queue(maxsize=5)
+BACKUP_ROOT = os.path.join("storage", "local_backup")
+TEMP_ROOT = os.path.join("storage", "temp")
+RETRY_ROOT = os.path.join("storage", "retry_queue")
+PRINT_CACHE_ROOT = os.path.join("storage", "print_cache")
 
-# Flask App
-app = Flask(__name__)
+# Workers and stores, built by setup()
+journal = None           # Queues are journaled so pending uploads/prints survive a crash or restart
+upload_queue = None
+print_queue = None
+photo_index = None       # Saved captures, and their thumb/web/print copies built in the background
+derivatives = None
+storage = None
+print_fetcher = None
+supabase_worker = None
+printer_worker = None
+filter_executor = None
+capture_manager = None
+capture_pipeline = None
+SUPABASE_URL = ""
+SUPABASE_KEY = ""
+PRINT_SINKS = {"auto": default_sink, "win32": Win32Sink, "cups": CupsSink, "file": FileSink}
+
+# Disk budgets: least recently used temp files, derivatives, print pages and variants go first, then
+# raw frames, then uploaded originals; anything an upload or print job still needs stays
+def _pinned_files():
+    """ Files queued uploads or prints still need; read once per enforcement pass. """
+    return journal.pending_files("upload") | journal.pending_files("print")
+
+def _evictable_original(path):
+    photo = photo_index.get(path)
+    return photo is not None and photo["upload_status"] == "uploaded"
+
+def _on_evict(path, class_name):
+    # Whatever goes along with the file is deleted here, so storage forgets it too (record() of a missing path)
+    removed = []
+    if class_name == "originals":
+        photo = photo_index.get(path)
+        removed += derivatives.evict(path, photo["content_hash"] if photo else None)
+        photo_index.remove(path)
+        # Its raw frames could only ever rebuild a capture that is gone
+        removed += remove_raw_capture(raw_manifest_for(path, BACKUP_ROOT, RAW_ROOT))
+    elif class_name == "temp" and os.path.exists(path + ".json"):
+        # The fetch cache's validators are useless without the download
+        os.remove(path + ".json")
+        removed.append(path + ".json")
+    elif class_name == "raw" and path.endswith(".png"):
+        # A raw set missing a frame can't be re-rendered: drop its manifest, the other frames follow by LRU
+        manifest = path.rsplit("_raw", 1)[0] + ".json"
+        if os.path.exists(manifest):
+            os.remove(manifest)
+            removed.append(manifest)
+    for other in removed:
+        storage.record(other)
 
-# Load Env
-from dotenv import load_dotenv
-load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), "frontend", ".env"))
-SUPABASE_URL = os.environ.get("VITE_SUPABASE_URL", "")
-SUPABASE_KEY = os.environ.get("VITE_SUPABASE_ANON_KEY", "")
+def _derivatives_built(original_path, content_hash, paths):
+    photo_index.set_derivatives(original_path, content_hash, paths)
+    for path in paths.values():
+        storage.record(path)
 
-# Initialize Workers
-supabase_worker = SupabaseManager(SUPABASE_URL, SUPABASE_KEY, upload_queue, shutdown_event)
-printer_worker = PrinterWorker(print_queue, shutdown_event)
+# /print of a gallery URL: our own captures print straight from disk, anything
+# else is downloaded once into TEMP_ROOT and reused
+def _resolve_local(url):
+    parts = urllib.parse.urlsplit(url)
+    if parts.path.startswith("/photos/") and parts.hostname in (None, "127.0.0.1", "localhost"):
+        original = safe_join(BACKUP_ROOT, urllib.parse.unquote(parts.path[len("/photos/"):]))
+        if original and os.path.isfile(original):
+            return original
+    photo = photo_index.by_remote_url(url) or photo_index.by_remote_url(url.split("?")[0])
+    if photo and os.path.isfile(photo["path"]):
+        return photo["path"]
+    return None
+
+# Metrics (served at /metrics); gauges are read at scrape time
+PREVIEW_FRAMES = metrics.counter("booth_preview_frames_total", "Frames shown in the live preview window")
+PREVIEW_FRAME_SECONDS = metrics.histogram("booth_preview_frame_seconds", "Preview loop time per frame",
+                                          buckets=(0.01, 0.02, 0.033, 0.05, 0.066, 0.1, 0.2, 0.5, 1.0))
+SAVE_SECONDS = metrics.histogram("booth_save_seconds", "Time to write a finished capture and queue it", ["mode"])
+QUEUE_DEPTH = metrics.gauge("booth_queue_depth", "Items waiting in each queue", ["queue"])
+JOURNAL_JOBS = metrics.gauge("booth_journal_jobs", "Journaled jobs by queue and state", ["queue", "state"])
+STORAGE_BYTES = metrics.gauge("booth_storage_bytes", "Bytes on disk per storage class", ["class"])
+DISK_FREE_BYTES = metrics.gauge("booth_disk_free_bytes", "Free space on the storage disk")
+
+# Flask App
+app = Flask(__name__)
 
 # API Endpoints
 @app.route("/health", methods=["GET"])
@@ -56,9 +169,21 @@ def health():
             "status": "ok",
             "mode": current_mode.value,
             "filter": current_filter.name,
-            "event_mode": EVENT_MODE
+            "event_mode": EVENT_MODE,
+            "pipeline": capture_pipeline.stats(),
+            "gesture": active_recognizer.stats() if active_recognizer else None,
+            "camera": active_ring.stats() if active_ring else None,
+            "uploads": supabase_worker.stats(),
+            "journal": {"upload": journal.counts("upload"), "print": journal.counts("print")},
+            "photos": photo_index.counts(),
+            "storage": storage.stats(),
+            "print_fetch": print_fetcher.stats()
         })
 
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route("/set_filter", methods=["POST"])
 def set_filter():
     global current_filter
@@ -92,115 +217,240 @@ def print_image():
     if not image_url:
         return jsonify({"error": "Missing imageUrl"}), 400
 
-    def fetch_and_print():
+    def enqueue_print(fetched):
         try:
-            import urllib.request
-            temp_dir = os.path.join("storage", "temp")
-            os.makedirs(temp_dir, exist_ok=True)
-            filename = image_url.split("/")[-1].split("?")[0]
-            local_path = os.path.join(temp_dir, filename)
-            urllib.request.urlretrieve(image_url, local_path)
-            print_queue.put({"file_path": local_path})
+            local_path, source = fetched.result()
         except Exception as e:
             if not EVENT_MODE: print(f"Fetch failed: {e}")
+            return
+        # Downloads in TEMP_ROOT aren't captures: they get no photo index row
+        if source == "local":
+            photo_index.set_print(local_path, "queued")
+        print_queue.put({"file_path": local_path})
+        storage.touch(local_path)
+        if source == "downloaded":
+            storage.record(local_path)
+        if source in ("downloaded", "revalidated"):
+            storage.record(local_path + ".json")
 
-    threading.Thread(target=fetch_and_print, daemon=True).start()
+    storage.ensure_free()
+    try:
+        fetched = print_fetcher.fetch(image_url)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    fetched.add_done_callback(enqueue_print)
     return jsonify({"success": True}), 200
 
+@app.route("/photos/<path:path>", methods=["GET"])
+def send_photo(path):
+    # ?size=thumb|web|print serves a downscaled copy of a still; anything else gets the original
+    size = request.args.get("size")
+    original = safe_join(BACKUP_ROOT, path)
+    if size and original and os.path.isfile(original):
+        try:
+            derivative = derivatives.get(original, size)
+        except Exception as e:
+            if not EVENT_MODE: print(f"Derivative failed for {path}: {e}")
+            derivative = None
+        if derivative:
+            file_path, etag = derivative
+            storage.touch(file_path)
+            return send_file(file_path, mimetype="image/jpeg", etag=etag,
+                             conditional=True, max_age=args.derivative_max_age)
+    if original:
+        storage.touch(original)
+    return send_from_directory(os.path.abspath(BACKUP_ROOT), path)
+
+def _gallery_item(photo):
+    item = {k: photo[k] for k in ("id", "mode", "filter", "taken_at", "day", "size_bytes",
+                                  "upload_status", "print_status", "remote_url")}
+    item["name"] = os.path.basename(photo["path"])
+    rel = os.path.relpath(photo["path"], os.path.abspath(BACKUP_ROOT))
+    if not rel.startswith(".."):
+        item["url"] = "/photos/" + rel.replace(os.sep, "/")
+        item["thumb_url"] = item["url"] + "?size=thumb" if photo["mode"] != "gif" else item["url"]
+    return item
+
+@app.route("/gallery", methods=["GET"])
+def gallery():
+    # Newest first; pass next_cursor back as ?cursor= for the following page
+    try:
+        limit = max(1, min(200, int(request.args.get("limit", 50))))
+        cursor = parse_cursor(request.args.get("cursor"))
+    except ValueError:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+    photos, next_cursor = photo_index.page(limit, cursor, day=request.args.get("day"), mode=request.args.get("mode"))
+    return jsonify({"photos": [_gallery_item(p) for p in photos], "next_cursor": encode_cursor(next_cursor)})
+
+@app.route("/gallery/days", methods=["GET"])
+def gallery_days():
+    return jsonify({"days": [{"day": day, "count": count} for day, count in photo_index.days()]})
+
 # Camera Loop
 def _save_and_dispatch(res):
+    with SAVE_SECONDS.labels(res.mode.value).time():
+        _save_and_dispatch_timed(res)
+
+def _write_capture(file_path, write):
+    # cv2.imwrite reports a full disk by returning False, not by raising: make room and try once more
+    for attempt in range(2):
+        try:
+            if write():
+                return True
+            error = "write returned False"
+        except (OSError, cv2.error) as e:
+            error = e
+        try:
+            os.remove(file_path)  # Don't leave a truncated file behind
+        except OSError:
+            pass
+        if attempt == 0 and not storage.make_room():
+            break
+    print(f"❌ Could not save {file_path} ({error}); free {max(0, storage.free_bytes()) // MB} MB")
+    return False
+
+def _save_and_dispatch_timed(res):
     date_str = datetime.datetime.now().strftime("%Y_%m_%d")
-    backup_dir = os.path.join("storage", "local_backup", date_str)
+    backup_dir = os.path.join(BACKUP_ROOT, date_str)
     os.makedirs(backup_dir, exist_ok=True)
+    storage.ensure_free()
     
     file_path = None
     if res.mode == CaptureMode.SINGLE:
         filename = f"magic_{res.base_timestamp}.jpg"
         file_path = os.path.join(backup_dir, filename)
-        cv2.imwrite(file_path, res.images[0])
+        if not _write_capture(file_path, lambda: cv2.imwrite(file_path, res.images[0])):
+            return
     elif res.mode == CaptureMode.BURST:
         filename = f"magic_burst_{res.base_timestamp}.jpg"
         file_path = os.path.join(backup_dir, filename)
         if res.collage_image is not None:
-            cv2.imwrite(file_path, res.collage_image)
+            if not _write_capture(file_path, lambda: cv2.imwrite(file_path, res.collage_image)):
+                return
         else: return
     elif res.mode == CaptureMode.GIF:
-        filename = f"magic_anim_{res.base_timestamp}.gif"
+        if res.animation_bytes is None:
+            return
+        filename = f"magic_anim_{res.base_timestamp}{res.animation_format.extension}"
         file_path = os.path.join(backup_dir, filename)
-        if res.gif_bytes is not None:
+        def write_animation():
             with open(file_path, "wb") as f:
-                f.write(res.gif_bytes)
-        else: return
+                f.write(res.animation_bytes)
+            return True
+        if not _write_capture(file_path, write_animation):
+            return
             
+    if file_path and args.save_raw and res.raw is not None:
+        manifest = save_raw_capture(res.raw, file_path, BACKUP_ROOT, RAW_ROOT, animation_format=args.animation_format,
+                                    animation_width=args.animation_width or None, boomerang=args.boomerang)
+        if manifest:
+            for path in raw_capture_files(manifest):
+                storage.record(path)
+        else:
+            print(f"⚠️ Could not save raw frames for {file_path}")
+
     if file_path:
-        upload_queue.put({"file_path": file_path})
+        cloud_sync = bool(SUPABASE_URL and SUPABASE_KEY)
+        photo_index.add(file_path, mode=res.mode.value, filter_name=res.filter_type.name if res.filter_type else None,
+                        taken_at=res.base_timestamp, print_status="queued",
+                        upload_status="pending" if cloud_sync else "none")
+        derivatives.submit(file_path)
+        # Nothing consumes uploads without credentials; a journaled job would only pin the file forever
+        if cloud_sync:
+            upload_queue.put({"file_path": file_path})
         print_queue.put({"file_path": file_path})
+        storage.record(file_path)
 
 def run_camera():
+    global active_recognizer, active_ring
     cap = cv2.VideoCapture(1)
     if not cap.isOpened(): cap = cv2.VideoCapture(0)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    ring = FrameRing(cap).start()
+    active_ring = ring
     
     cv2.namedWindow("MAGIC Photo Booth", cv2.WND_PROP_FULLSCREEN)
     cv2.setWindowProperty("MAGIC Photo Booth", cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
     
-    recognizer = GestureRecognizer()
-    capture_manager = CaptureManager()
+    recognizer = GestureRecognizer(
+        detect_every_n=args.gesture_every,
+        detect_hz=args.gesture_hz or None,
+        inference_width=args.gesture_width,
+        confirm_frames=args.gesture_confirm
+    )
+    active_recognizer = recognizer
+    recognizer.start_worker()
     
     last_capture_time = 0
     COOLDOWN = 6.0
+    MAX_GESTURE_AGE = 1.0
     
-    while not shutdown_event.is_set():
-        ret, frame = cap.read()
-        if not ret: continue
+    try:
+        frame_started = time.perf_counter()
+        seen = 0
+        display_frame = None
+        while not shutdown_event.is_set():
+            ref = ring.borrow(after=seen)
+            if ref is None: continue
+            with ref:
+                seen = ref.seq
+                # The flipped copy is drawn on, so it lives in its own reused buffer
+                display_frame = cv2.flip(ref.frame, 1, display_frame)
+            now = time.perf_counter()
+            PREVIEW_FRAMES.inc()
+            PREVIEW_FRAME_SECONDS.observe(now - frame_started)
+            frame_started = now
         
-        display_frame = cv2.flip(frame, 1)
-        rgb_frame = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
+            rgb_frame = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
         
-        results, gesture = recognizer.process_frame(rgb_frame)
+            # Inference runs on the recognizer's worker; never wait for it here
+            recognizer.submit(rgb_frame)
+            results, gesture, gesture_ts = recognizer.latest()
+            if time.time() - gesture_ts > recognizer.max_result_age(MAX_GESTURE_AGE):
+                gesture = None
         
-        with state_lock:
-            act_filter = current_filter
-            act_mode = current_mode
+            with state_lock:
+                act_filter = current_filter
+                act_mode = current_mode
             
-        cv2.putText(display_frame, f"MODE: {act_mode.value.upper()} | FILTER: {act_filter.name}", (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        cv2.putText(display_frame, "THUMBS UP TO CAPTURE", (20, display_frame.shape[0] - 40), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 255, 0), 3)
+            cv2.putText(display_frame, f"MODE: {act_mode.value.upper()} | FILTER: {act_filter.name}", (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+            cv2.putText(display_frame, "THUMBS UP TO CAPTURE", (20, display_frame.shape[0] - 40), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 255, 0), 3)
         
-        cv2.imshow("MAGIC Photo Booth", display_frame)
+            cv2.imshow("MAGIC Photo Booth", display_frame)
         
-        key = cv2.waitKey(1) & 0xFF
-        if key == 27 or key == ord('q'): # ESC
-            shutdown_event.set()
-            break
+            key = cv2.waitKey(1) & 0xFF
+            if key == 27 or key == ord('q'): # ESC
+                shutdown_event.set()
+                break
             
-        if gesture == "THUMBS_UP" and (time.time() - last_capture_time) > COOLDOWN:
-            try:
-                capture_queue.put_nowait(True) # Memory bound check
-            except Full:
-                if not EVENT_MODE: print("Capture queue full. Ignored.")
-                continue
+            if gesture == "THUMBS_UP" and (time.time() - last_capture_time) > COOLDOWN:
+                # Refuse up front rather than make the guest pose for a capture we would drop
+                if not capture_pipeline.can_accept(capture_manager.frames_needed(act_mode)):
+                    if not EVENT_MODE: print("Capture pipeline full. Ignored.")
+                    continue
                 
-            last_capture_time = time.time()
+                last_capture_time = time.time()
             
-            # Execute capture sequence
-            if act_mode == CaptureMode.BURST:
-                res = capture_manager.capture_burst(cap, act_filter)
-            elif act_mode == CaptureMode.GIF:
-                res = capture_manager.capture_gif(cap, act_filter)
-            else:
-                ret, snap = cap.read()
-                if ret:
-                    snap = cv2.flip(snap, 1)
-                    res = capture_manager.capture_single(snap, act_filter)
+                # Grab raw frames only; filtering and encoding happen in the pipeline
+                raw = None
+                if act_mode == CaptureMode.BURST:
+                    raw = capture_manager.grab_burst(ring, act_filter)
+                elif act_mode == CaptureMode.GIF:
+                    raw = capture_manager.grab_gif(ring, act_filter)
+                else:
+                    snap = ring.borrow(after=ring.seq)
+                    if snap is not None:
+                        with snap:
+                            raw = capture_manager.grab_single(cv2.flip(snap.frame, 1), act_filter)
                     
-            if 'res' in locals() and res:
-                _save_and_dispatch(res)
+                if raw and not capture_pipeline.submit(raw):
+                    if not EVENT_MODE: print("Capture pipeline full. Dropped capture.")
             
-            # Clear token
-            try: capture_queue.get_nowait(); capture_queue.task_done()
-            except: pass
-            
-    cap.release()
-    cv2.destroyAllWindows()
+    finally:
+        recognizer.stop_worker()
+        ring.stop()
+        cap.release()
+        cv2.destroyAllWindows()
 
 def camera_watchdog():
     while not shutdown_event.is_set():
@@ -213,14 +463,87 @@ def camera_watchdog():
             continue
         break # Exit normally if broke out correctly
 
-if __name__ == "__main__":
+def setup(argv=None):
+    """ Parses arguments and builds the stores, queues and workers without starting them. """
+    global args, EVENT_MODE, SUPABASE_URL, SUPABASE_KEY
+    global journal, upload_queue, print_queue, photo_index, derivatives, storage, print_fetcher
+    global supabase_worker, printer_worker, filter_executor, capture_manager, capture_pipeline
+    args = parser.parse_args(argv)
+    EVENT_MODE = args.event_mode
+
+    # Load Env
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), "frontend", ".env"))
+    SUPABASE_URL = os.environ.get("VITE_SUPABASE_URL", "")
+    SUPABASE_KEY = os.environ.get("VITE_SUPABASE_ANON_KEY", "")
+
+    journal = JobJournal(os.path.join("storage", "jobs.db"))
+    upload_queue = JournaledQueue("upload", journal)
+    print_queue = JournaledQueue("print", journal, max_attempts=3)
+
+    photo_index = PhotoIndex(os.path.join("storage", "photos.db"))
+    derivatives = DerivativeStore(os.path.join("storage", "derivatives"), on_built=_derivatives_built)
+    storage = StorageManager([
+        StorageClass("temp", TEMP_ROOT, args.budget_temp_mb * MB, lambda path: True, priority=0),
+        StorageClass("derivatives", derivatives.root, args.budget_derivatives_mb * MB, lambda path: True, priority=1),
+        StorageClass("variants", VARIANTS_ROOT, args.budget_variants_mb * MB, lambda path: True, priority=1),
+        StorageClass("print_cache", PRINT_CACHE_ROOT, args.budget_print_cache_mb * MB, lambda path: True, priority=1),
+        StorageClass("raw", RAW_ROOT, args.budget_raw_mb * MB, lambda path: True, priority=2),
+        StorageClass("originals", BACKUP_ROOT, args.budget_originals_mb * MB, _evictable_original, priority=3),
+        StorageClass("retry", RETRY_ROOT),  # Un-uploaded by definition: measured, never evicted
+    ], min_free_bytes=args.min_free_mb * MB, on_evict=_on_evict,
+       pinned=_pinned_files)
+    print_fetcher = RemoteFetcher(TEMP_ROOT, workers=args.fetch_workers, timeout=args.fetch_timeout,
+                                  fresh_for=args.fetch_fresh_for, resolve_local=_resolve_local)
+
+    # Initialize Workers
+    supabase_worker = SupabaseManager(SUPABASE_URL, SUPABASE_KEY, upload_queue, shutdown_event, upload_workers=args.upload_workers,
+                                      retry_dir=RETRY_ROOT, photo_index=photo_index, on_retry_copy=storage.record)
+    printer_worker = PrinterWorker(print_queue, shutdown_event, sink=PRINT_SINKS[args.print_sink](), layout=args.print_layout,
+                                   cache_dir=PRINT_CACHE_ROOT, photo_index=photo_index,
+                                   on_cached=storage.record)
+
+    set_filter_quality(FilterQuality(args.filter_quality))
+    filter_executor = ParallelFilterExecutor(args.parallel_filters) if args.parallel_filters > 1 else None
+    capture_manager = CaptureManager(
+        executor=filter_executor, animation_format=args.animation_format,
+        animation_width=args.animation_width or None, boomerang=args.boomerang
+    )
+    capture_pipeline = CapturePipeline(
+        capture_manager, _save_and_dispatch, shutdown_event,
+        filter_workers=args.filter_workers,
+        filter_queue_depth=args.filter_queue_depth
+    )
+
+    QUEUE_DEPTH.labels("upload").set_function(upload_queue.qsize)
+    QUEUE_DEPTH.labels("print").set_function(print_queue.qsize)
+    QUEUE_DEPTH.labels("filter").set_function(capture_pipeline.filter_queue.qsize)
+    QUEUE_DEPTH.labels("encode").set_function(capture_pipeline.encode_queue.qsize)
+    for queue_name in ("upload", "print"):
+        for state in ("queued", "waiting", "deferred", "dead"):
+            JOURNAL_JOBS.labels(queue_name, state).set_function(lambda q=queue_name, st=state: journal.counts(q).get(st, 0))
+    for class_name in storage.classes:
+        STORAGE_BYTES.labels(class_name).set_function(lambda c=class_name: storage.usage(c))
+    DISK_FREE_BYTES.set_function(storage.free_bytes)
+
+def main(argv=None):
+    setup(argv)
     try:
+        # Replay jobs left over from the previous run before any new ones arrive
+        upload_queue.start_scheduler(shutdown_event)
+        print_queue.start_scheduler(shutdown_event)
+        
         if SUPABASE_URL and SUPABASE_KEY:
             supabase_worker.start_worker()
         else:
             print("Warning: Missing Supabase credentials. Cloud sync disabled.")
             
         printer_worker.start_worker()
+        derivatives.start()
+        storage.start(shutdown_event)
+        if filter_executor:
+            filter_executor.warm_up()
+        capture_pipeline.start()
         
         cam_thread = threading.Thread(target=camera_watchdog, daemon=True)
         cam_thread.start()
@@ -230,6 +553,12 @@ if __name__ == "__main__":
         print("Shutting down gracefully...")
     finally:
         shutdown_event.set()
+        print_fetcher.shutdown()
+        if filter_executor:
+            filter_executor.shutdown()
         # Non-blocking wait / timeout could be added, but simple join is ok for workers
         # upload_queue.join()
         # print_queue.join()
+
+if __name__ == "__main__":
+    main()
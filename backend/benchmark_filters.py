@@ -0,0 +1,238 @@
+"""
+Filter benchmark: times every backend FilterType (per compiled step) and
+every camera-mode filter on synthetic frames, and writes JSON that can be
+diffed across commits.
+
+    python benchmark_filters.py --output bench.json
+    python benchmark_filters.py --resolutions 720p,4k --filters DREAMY,NEON --compare bench.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+import importlib.util
+import subprocess
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+# shared/ (modules both apps use) lives in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from filters import CompiledFilter, FilterQuality, FilterType, apply_filter_reference
+from shared.noise import set_noise_seed
+
+RESOLUTIONS = {
+    "480p": (854, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+
+CAMERA_FILTERS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "camera", "filters.py")
+
+def synthetic_frame(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """ Smooth colour gradients plus a little sensor noise: exercises LUTs, blurs and CLAHE like a real photo. """
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (9, 16, 3), dtype=np.uint8)
+    frame = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+    noise = rng.normal(0, 6, frame.shape)
+    return np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+def _percentiles(samples: List[float]) -> dict:
+    values = np.asarray(samples) * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+        "min_ms": round(float(values.min()), 3),
+    }
+
+def _peak_bytes(fn: Callable[[], object]) -> int:
+    """ Peak traced allocation while fn runs (numpy and OpenCV output buffers included). """
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        del result
+        return max(0, peak - baseline)
+    finally:
+        tracemalloc.stop()
+
+def bench_compiled(filter_type: FilterType, frame: np.ndarray, iterations: int, warmup: int,
+                   quality: FilterQuality, seed: int) -> dict:
+    compiled = CompiledFilter(filter_type, frame.shape, quality)
+    names = [name for name, _ in compiled.steps]
+    stage_times: Dict[str, List[float]] = {name: [] for name in names}
+    totals = []
+
+    for i in range(warmup + iterations):
+        set_noise_seed(seed + i)
+        step_times: Dict[str, float] = {}
+        start = time.perf_counter()
+        compiled(frame, "MAGIC 2026", step_times=step_times)
+        if i >= warmup:
+            totals.append(time.perf_counter() - start)
+            for name in names:
+                stage_times[name].append(step_times[name])
+
+    stages = [dict(name=name, **_percentiles(stage_times[name])) for name in names]
+    # Memory is measured on a separate pass so tracing doesn't skew the timings;
+    # steps run here without scratch buffers, so this is each step's own output
+    img = frame
+    for stage, (_, step) in zip(stages, compiled.steps):
+        out = []
+        stage["peak_bytes"] = _peak_bytes(lambda: out.append(step(img, "MAGIC 2026")))
+        img = out[0]
+
+    return {
+        "total": _percentiles(totals),
+        "stages": stages,
+        "peak_bytes": _peak_bytes(lambda: compiled(frame)),
+    }
+
+def bench_callable(fn: Callable[[np.ndarray], np.ndarray], frame: np.ndarray, iterations: int, warmup: int, seed: int,
+                   seed_fn: Callable[[int], None] = set_noise_seed) -> dict:
+    totals = []
+    for i in range(warmup + iterations):
+        seed_fn(seed + i)
+        start = time.perf_counter()
+        fn(frame)
+        if i >= warmup:
+            totals.append(time.perf_counter() - start)
+    return {
+        "total": _percentiles(totals),
+        "stages": [],
+        "peak_bytes": _peak_bytes(lambda: fn(frame)),
+    }
+
+def load_camera_filters():
+    """ camera/filters.py shares its module name with ours, so it is loaded from its path. """
+    if not os.path.exists(CAMERA_FILTERS_PATH):
+        return None, []
+    spec = importlib.util.spec_from_file_location("camera_filters", CAMERA_FILTERS_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    with open(CAMERA_FILTERS_PATH, "r", encoding="utf-8") as f:
+        names = list(dict.fromkeys(re.findall(r'filter_name == "(\w+)"', f.read())))
+    return module, names
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def run(resolutions: List[str], filters: Optional[List[str]], iterations: int, warmup: int,
+        quality: FilterQuality, reference: bool, camera: bool, seed: int) -> dict:
+    results = []
+    camera_module, camera_names = load_camera_filters() if camera else (None, [])
+    backend_types = [ft for ft in FilterType if not filters or ft.name in filters]
+    camera_names = [name for name in camera_names if not filters or name in filters]
+
+    for res in resolutions:
+        width, height = RESOLUTIONS[res]
+        frame = synthetic_frame(width, height, seed)
+        for ft in backend_types:
+            entry = bench_compiled(ft, frame, iterations, warmup, quality, seed)
+            results.append(dict(source="backend", filter=ft.name, resolution=res, **entry))
+            if reference:
+                entry = bench_callable(lambda img: apply_filter_reference(img, ft), frame, iterations, warmup, seed)
+                results.append(dict(source="backend_reference", filter=ft.name, resolution=res, **entry))
+        for name in camera_names:
+            entry = bench_callable(lambda img: camera_module.apply_filter(img, name), frame, iterations, warmup, seed,
+                                   camera_module.NOISE.seed)
+            results.append(dict(source="camera", filter=name, resolution=res, **entry))
+        for r in results[-(len(backend_types) * (2 if reference else 1) + len(camera_names)):]:
+            print_result(r)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "cpu_count": os.cpu_count(),
+            "opencv_threads": cv2.getNumThreads(),
+            "platform": platform.platform(),
+            "iterations": iterations,
+            "warmup": warmup,
+            "quality": quality.value,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+def print_result(r: dict):
+    total = r["total"]
+    print(f"{r['source']:<18} {r['filter']:<15} {r['resolution']:<6} p50 {total['p50_ms']:9.2f} ms  "
+          f"p99 {total['p99_ms']:9.2f} ms  peak {r['peak_bytes'] / 1e6:8.1f} MB")
+    for stage in r["stages"]:
+        print(f"{'':<42}{stage['name']:<14} p50 {stage['p50_ms']:8.2f} ms  p99 {stage['p99_ms']:8.2f} ms  "
+              f"peak {stage['peak_bytes'] / 1e6:7.1f} MB")
+
+def compare(old: dict, new: dict, threshold: float = 0.10) -> int:
+    """ Prints p50 changes against an earlier run; returns the number of regressions beyond threshold. """
+    key = lambda r: (r["source"], r["filter"], r["resolution"])
+    previous = {key(r): r for r in old["results"]}
+    regressions = 0
+    print(f"\nCompared with {old['meta'].get('commit') or 'previous run'} ({old['meta'].get('timestamp')}):")
+    for r in new["results"]:
+        before = previous.get(key(r))
+        if before is None:
+            continue
+        old_ms, new_ms = before["total"]["p50_ms"], r["total"]["p50_ms"]
+        change = (new_ms - old_ms) / old_ms if old_ms else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{r['source']:<18} {r['filter']:<15} {r['resolution']:<6} {old_ms:9.2f} -> {new_ms:9.2f} ms ({change:+.0%}){flag}")
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark photo booth filters")
+    parser.add_argument("--resolutions", default="480p,720p,1080p,4k", help=f"Comma-separated, from {', '.join(RESOLUTIONS)}")
+    parser.add_argument("--filters", default=None, help="Comma-separated filter names (default: all)")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--quality", choices=[q.value for q in FilterQuality], default="full")
+    parser.add_argument("--threads", type=int, default=None, help="cv2.setNumThreads before running")
+    parser.add_argument("--reference", action="store_true", help="Also time the uncompiled reference filters")
+    parser.add_argument("--no-camera", action="store_true", help="Skip camera/filters.py")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    parser.add_argument("--compare", default=None, help="Earlier JSON output to diff p50 latencies against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p50 slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    resolutions = [r.strip().lower() for r in args.resolutions.split(",") if r.strip()]
+    unknown = [r for r in resolutions if r not in RESOLUTIONS]
+    if unknown:
+        parser.error(f"Unknown resolution(s): {', '.join(unknown)}")
+    filters = [f.strip().upper() for f in args.filters.split(",")] if args.filters else None
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+
+    report = run(resolutions, filters, args.iterations, args.warmup, FilterQuality(args.quality),
+                 args.reference, not args.no_camera, args.seed)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            return 1 if compare(json.load(f), report, args.threshold) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,8 @@ from enum import Enum
 from dataclasses import dataclass
 from typing import List, Optional
 from filters import FilterType, apply_filter
+from frame_ring import FrameRing
+from shared.animation import AnimationFormat, boomerang, get_animation_format
 
 class CaptureMode(Enum):
     SINGLE = "single"
@@ -17,8 +19,23 @@ class CaptureResult:
     images: List[np.ndarray]
     timestamps: List[float]
     base_timestamp: int
-    gif_bytes: Optional[bytes] = None
+    animation_bytes: Optional[bytes] = None
+    animation_format: Optional[AnimationFormat] = None
     collage_image: Optional[np.ndarray] = None
+    filter_type: Optional[FilterType] = None
+    raw: Optional["RawCapture"] = None  # The unfiltered frames this was built from
+
+@dataclass
+class RawCapture:
+    """ Unfiltered frames straight from the camera, waiting for the filter stage. """
+    mode: CaptureMode
+    frames: List[np.ndarray]
+    timestamps: List[float]
+    base_timestamp: int
+    filter_type: FilterType
+    text: str = "MAGIC 2026"
+    frame_duration: float = 0.2
+    seed: Optional[int] = None
 
 class CaptureManager:
     BURST_COUNT = 4
@@ -26,93 +43,137 @@ class CaptureManager:
     GIF_FRAME_COUNT = 8
     GIF_INTERVAL_MS = 200
 
+    def __init__(self, executor=None, animation_format: str = "gif", animation_width: Optional[int] = 640,
+                 boomerang: bool = False):
+        # Optional ParallelFilterExecutor; frames are filtered serially without one
+        self.executor = executor
+        # GIF mode output: "gif", "webp" or "mp4" (see shared/animation.py), downscaled
+        # to animation_width (None keeps the camera resolution)
+        self.animation_format = get_animation_format(animation_format)
+        self.animation_width = animation_width
+        self.boomerang = boomerang
+        self._flash_frame: Optional[np.ndarray] = None
+
+    def frames_needed(self, mode: CaptureMode) -> int:
+        if mode == CaptureMode.BURST:
+            return self.BURST_COUNT
+        if mode == CaptureMode.GIF:
+            return self.GIF_FRAME_COUNT
+        return 1
+
     def capture_single(self, frame: np.ndarray, filter_type: FilterType) -> CaptureResult:
+        return self.process(self.grab_single(frame, filter_type))
+
+    def capture_burst(self, ring: FrameRing, filter_type: FilterType) -> CaptureResult:
+        return self.process(self.grab_burst(ring, filter_type))
+
+    def capture_gif(self, ring: FrameRing, filter_type: FilterType, duration_per_frame: float = 0.2) -> CaptureResult:
+        return self.process(self.grab_gif(ring, filter_type, duration_per_frame))
+
+    def process(self, raw: RawCapture) -> CaptureResult:
+        """ Filters and assembles a raw capture synchronously. """
+        return self.build_result(raw, self.filter_frames(raw))
+
+    def filter_frames(self, raw: RawCapture) -> List[np.ndarray]:
+        if self.executor is not None:
+            return self.executor.filter_frames(raw.frames, raw.filter_type, text=raw.text, seed=raw.seed)
+        return [apply_filter(frame, raw.filter_type, text=raw.text) for frame in raw.frames]
+
+    def grab_single(self, frame: np.ndarray, filter_type: FilterType) -> RawCapture:
         timestamp = time.time()
-        filtered = apply_filter(frame, filter_type, text="MAGIC 2026")
-        return CaptureResult(
+        return RawCapture(
             mode=CaptureMode.SINGLE,
-            images=[filtered],
+            frames=[frame],
             timestamps=[timestamp],
-            base_timestamp=int(timestamp)
+            base_timestamp=int(timestamp),
+            filter_type=filter_type
         )
 
-    def capture_burst(self, cap: cv2.VideoCapture, filter_type: FilterType) -> CaptureResult:
-        images = []
+    def grab_burst(self, ring: FrameRing, filter_type: FilterType) -> RawCapture:
+        frames = []
         timestamps = []
         base_timestamp = int(time.time())
         
         for i in range(self.BURST_COUNT):
             if i > 0:
-                self._countdown(cap, seconds=3)
+                self._countdown(ring, seconds=3)
             
-            # Flush a couple frames to ensure we don't get a frozen frame from the countdown
-            for _ in range(3):
-                cap.read()
-            
-            ret, frame = cap.read()
-            if not ret: continue
-            
-            frame = cv2.flip(frame, 1)
-            timestamp = time.time()
-            filtered = apply_filter(frame, filter_type, text="MAGIC 2026")
-            images.append(filtered)
-            timestamps.append(timestamp)
+            # A frame exposed after this point, never one left over from the countdown
+            ref = ring.borrow(after=ring.seq)
+            if ref is None: continue
+            with ref:
+                frames.append(cv2.flip(ref.frame, 1))
+                timestamps.append(ref.timestamp)
             
             # Flash effect
-            self._flash(cap)
+            self._flash(ring)
             
-        collage = self._create_collage(images) if len(images) == self.BURST_COUNT else (images[0] if images else None)
-        return CaptureResult(
+        return RawCapture(
             mode=CaptureMode.BURST,
-            images=images,
+            frames=frames,
             timestamps=timestamps,
             base_timestamp=base_timestamp,
-            collage_image=collage
+            filter_type=filter_type
         )
 
-    def capture_gif(self, cap: cv2.VideoCapture, filter_type: FilterType, duration_per_frame: float = 0.2) -> CaptureResult:
-        images = []
+    def grab_gif(self, ring: FrameRing, filter_type: FilterType, duration_per_frame: float = 0.2) -> RawCapture:
+        frames = []
         timestamps = []
         base_timestamp = int(time.time())
-        rgb_images = []
+        seen = ring.seq
         
         for i in range(self.GIF_FRAME_COUNT):
-            ret, frame = cap.read()
-            if not ret: continue
+            ref = ring.borrow(after=seen)
+            if ref is None: continue
+            with ref:
+                seen = ref.seq
+                frames.append(cv2.flip(ref.frame, 1))
+                timestamps.append(ref.timestamp)
             
-            frame = cv2.flip(frame, 1)
-            timestamp = time.time()
-            
-            filtered = apply_filter(frame, filter_type, text="MAGIC 2026")
-            images.append(filtered)
-            timestamps.append(timestamp)
-            
-            rgb_frame = cv2.cvtColor(filtered, cv2.COLOR_BGR2RGB)
-            rgb_images.append(rgb_frame)
-            
-            # Preview delay while capturing
+            # Keep the preview live while waiting for the next frame
             if i < self.GIF_FRAME_COUNT - 1:
-                wait_start = time.time()
-                while (time.time() - wait_start) < (self.GIF_INTERVAL_MS / 1000.0):
-                    cap.read()  # keep reading to clear buffer
-        
-        # Create GIF in memory
-        import io
-        import imageio
-        gif_bytes = None
-        if rgb_images:
-            with io.BytesIO() as buf:
-                imageio.mimsave(buf, rgb_images, format='GIF', duration=duration_per_frame, loop=0)
-                gif_bytes = buf.getvalue()
+                deadline = time.time() + self.GIF_INTERVAL_MS / 1000.0
+                while time.time() < deadline:
+                    live = ring.borrow(after=seen, timeout=max(0.0, deadline - time.time()))
+                    if live is None: break
+                    with live:
+                        seen = live.seq
+                        cv2.imshow("MAGIC Photo Booth", cv2.flip(live.frame, 1))
+                    cv2.waitKey(1)
                 
-        return CaptureResult(
+        return RawCapture(
             mode=CaptureMode.GIF,
-            images=images,
+            frames=frames,
             timestamps=timestamps,
             base_timestamp=base_timestamp,
-            gif_bytes=gif_bytes
+            filter_type=filter_type,
+            frame_duration=duration_per_frame
         )
 
+    def build_result(self, raw: RawCapture, images: List[np.ndarray]) -> CaptureResult:
+        """ Turns filtered frames into the final collage / animation for the capture mode. """
+        result = CaptureResult(
+            mode=raw.mode,
+            images=images,
+            timestamps=raw.timestamps,
+            base_timestamp=raw.base_timestamp,
+            filter_type=raw.filter_type,
+            raw=raw
+        )
+        if raw.mode == CaptureMode.BURST:
+            result.collage_image = self._create_collage(images) if len(images) == self.BURST_COUNT else (images[0] if images else None)
+        elif raw.mode == CaptureMode.GIF:
+            result.animation_bytes = self._encode_animation(images, raw.frame_duration, raw.filter_type)
+            result.animation_format = self.animation_format
+        return result
+
+    def _encode_animation(self, images: List[np.ndarray], duration_per_frame: float, filter_type: Optional[FilterType] = None) -> Optional[bytes]:
+        if self.boomerang:
+            images = boomerang(images)
+        # GIFs share one palette per filter
+        palette_key = filter_type.name if filter_type is not None else None
+        return self.animation_format.encode(images, duration_per_frame, self.animation_width, palette_key)
+
     def _create_collage(self, images: List[np.ndarray]) -> np.ndarray:
         if len(images) != 4:
              return images[0] if images else None
@@ -124,33 +185,37 @@ class CaptureManager:
         bottom_row = np.hstack([resized[2], resized[3]])
         return np.vstack([top_row, bottom_row])
 
-    def _countdown(self, cap: cv2.VideoCapture, seconds: int):
+    def _countdown(self, ring: FrameRing, seconds: int):
+        seen = ring.seq
         for i in range(seconds, 0, -1):
             start = time.time()
             while time.time() - start < 1.0:
-                ret, frame = cap.read()
-                if ret:
-                    frame = cv2.flip(frame, 1)
-                    display = frame.copy()
-                    text = str(i)
-                    font = cv2.FONT_HERSHEY_SIMPLEX
-                    font_scale = 6
-                    thickness = 15
-                    text_size = cv2.getTextSize(text, font, font_scale, thickness)[0]
-                    text_x = (display.shape[1] - text_size[0]) // 2
-                    text_y = (display.shape[0] + text_size[1]) // 2
-                    
-                    # Red shadow
-                    cv2.putText(display, text, (text_x+5, text_y+5), font, font_scale, (0, 0, 150), thickness)
-                    # White text
-                    cv2.putText(display, text, (text_x, text_y), font, font_scale, (255, 255, 255), thickness)
-                    
-                    cv2.imshow("MAGIC Photo Booth", display)
-                    cv2.waitKey(1)
+                ref = ring.borrow(after=seen, timeout=0.5)
+                if ref is None: continue
+                with ref:
+                    seen = ref.seq
+                    # flip() writes a new array, so text can be drawn on it after release
+                    display = cv2.flip(ref.frame, 1)
+                text = str(i)
+                font = cv2.FONT_HERSHEY_SIMPLEX
+                font_scale = 6
+                thickness = 15
+                text_size = cv2.getTextSize(text, font, font_scale, thickness)[0]
+                text_x = (display.shape[1] - text_size[0]) // 2
+                text_y = (display.shape[0] + text_size[1]) // 2
+                
+                # Red shadow
+                cv2.putText(display, text, (text_x+5, text_y+5), font, font_scale, (0, 0, 150), thickness)
+                # White text
+                cv2.putText(display, text, (text_x, text_y), font, font_scale, (255, 255, 255), thickness)
+                
+                cv2.imshow("MAGIC Photo Booth", display)
+                cv2.waitKey(1)
                     
-    def _flash(self, cap: cv2.VideoCapture):
-        ret, frame = cap.read()
-        if ret:
-            flash = np.ones_like(frame) * 255
-            cv2.imshow("MAGIC Photo Booth", flash)
+    def _flash(self, ring: FrameRing):
+        shape = ring.shape
+        if shape is not None:
+            if self._flash_frame is None or self._flash_frame.shape != shape:
+                self._flash_frame = np.full(shape, 255, dtype=np.uint8)
+            cv2.imshow("MAGIC Photo Booth", self._flash_frame)
             cv2.waitKey(50)
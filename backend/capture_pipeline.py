@@ -0,0 +1,153 @@
+import threading
+import time
+import traceback
+from queue import Queue, Empty, Full
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from capture_modes import CaptureManager, CaptureResult, RawCapture
+from filters import apply_filter
+import metrics
+
+FILTER_TASK_SECONDS = metrics.histogram("booth_filter_task_seconds", "Time to filter one pipeline task (a frame, or a whole capture with a process pool)", ["mode"])
+CAPTURE_FILTER_SECONDS = metrics.histogram("booth_capture_filter_seconds", "Wall time from a capture's first filter task starting to its last finishing", ["mode"])
+ENCODE_SECONDS = metrics.histogram("booth_encode_seconds", "Collage / animation build time per capture", ["mode"])
+CAPTURE_LATENCY_SECONDS = metrics.histogram("booth_capture_latency_seconds", "Capture submit to result handed off (filter + encode + save)", ["mode"])
+CAPTURES_REJECTED = metrics.counter("booth_captures_rejected_total", "Captures refused because the filter stage was full")
+
+class _PipelineJob:
+    def __init__(self, raw: RawCapture):
+        self.raw = raw
+        self.filtered: List[Optional[np.ndarray]] = [None] * len(raw.frames)
+        self.remaining = len(raw.frames)
+        self.submitted_at = time.time()
+        self.filter_started_at: Optional[float] = None
+        self.lock = threading.Lock()
+
+    def filter_started(self):
+        with self.lock:
+            if self.filter_started_at is None:
+                self.filter_started_at = time.perf_counter()
+
+    def frames_done(self, count: int) -> bool:
+        with self.lock:
+            self.remaining -= count
+            return self.remaining == 0
+
+class CapturePipeline:
+    """
+    Background stages for captures: filter workers -> encoder/writer.
+
+    The camera thread only grabs raw frames and calls submit(). Frames are
+    filtered by a bounded pool of worker threads, then a single encoder
+    assembles the collage/GIF and hands the CaptureResult to on_result.
+    Both hand-offs are bounded queues, so a slow writer backs up into the
+    filter stage and a full filter stage rejects new captures.
+
+    When the CaptureManager has a process-pool executor, a whole capture is
+    one filter task and the executor fans its frames out across processes.
+    """
+    def __init__(self, capture_manager: CaptureManager, on_result: Callable[[CaptureResult], None],
+                 shutdown_event: threading.Event, filter_workers: int = 2,
+                 filter_queue_depth: int = 8, encode_queue_depth: int = 2):
+        self.capture_manager = capture_manager
+        self.on_result = on_result
+        self.shutdown_event = shutdown_event
+        self.filter_workers = filter_workers
+        self.filter_queue: Queue = Queue(maxsize=filter_queue_depth)
+        self.encode_queue: Queue = Queue(maxsize=encode_queue_depth)
+        self._submit_lock = threading.Lock()
+
+    def start(self):
+        threads = [threading.Thread(target=self._filter_loop, daemon=True) for _ in range(self.filter_workers)]
+        threads.append(threading.Thread(target=self._encode_loop, daemon=True))
+        for t in threads:
+            t.start()
+        return threads
+
+    def _split_tasks(self, frame_count: int) -> List[List[int]]:
+        if self.capture_manager.executor is not None:
+            return [list(range(frame_count))]
+        return [[i] for i in range(frame_count)]
+
+    def can_accept(self, frame_count: int) -> bool:
+        free = self.filter_queue.maxsize - self.filter_queue.qsize()
+        return free >= len(self._split_tasks(frame_count))
+
+    def submit(self, raw: RawCapture) -> bool:
+        """ Queues every frame of a capture, or none of them if the filter stage is full. """
+        if not raw.frames:
+            return False
+        with self._submit_lock:
+            if not self.can_accept(len(raw.frames)):
+                CAPTURES_REJECTED.inc()
+                return False
+            job = _PipelineJob(raw)
+            for indices in self._split_tasks(len(raw.frames)):
+                self.filter_queue.put_nowait((job, indices))
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "filter_queue": self.filter_queue.qsize(),
+            "filter_queue_max": self.filter_queue.maxsize,
+            "encode_queue": self.encode_queue.qsize(),
+            "encode_queue_max": self.encode_queue.maxsize,
+        }
+
+    def _filter_loop(self):
+        while not self.shutdown_event.is_set():
+            try:
+                job, indices = self.filter_queue.get(timeout=1.0)
+            except Empty:
+                continue
+            mode = job.raw.mode.value
+            job.filter_started()
+            started = time.perf_counter()
+            try:
+                raw = job.raw
+                if len(indices) > 1:
+                    job.filtered = self.capture_manager.filter_frames(raw)
+                else:
+                    index = indices[0]
+                    job.filtered[index] = apply_filter(raw.frames[index], raw.filter_type, text=raw.text)
+            except Exception as e:
+                print(f"[Pipeline] Filter error: {e}")
+            finally:
+                self.filter_queue.task_done()
+            finished = time.perf_counter()
+            FILTER_TASK_SECONDS.labels(mode).observe(finished - started)
+
+            if job.frames_done(len(indices)):
+                CAPTURE_FILTER_SECONDS.labels(mode).observe(finished - job.filter_started_at)
+                self._put_encode(job)
+
+    def _put_encode(self, job: _PipelineJob):
+        # Blocking here is the backpressure from a slow writer
+        while not self.shutdown_event.is_set():
+            try:
+                self.encode_queue.put(job, timeout=1.0)
+                return
+            except Full:
+                continue
+
+    def _encode_loop(self):
+        while not self.shutdown_event.is_set():
+            try:
+                job = self.encode_queue.get(timeout=1.0)
+            except Empty:
+                continue
+            try:
+                mode = job.raw.mode.value
+                images = [img for img in job.filtered if img is not None]
+                if images:
+                    with ENCODE_SECONDS.labels(mode).time():
+                        result = self.capture_manager.build_result(job.raw, images)
+                    self.on_result(result)
+                    CAPTURE_LATENCY_SECONDS.labels(mode).observe(time.time() - job.submitted_at)
+            except Exception as e:
+                print(f"[Pipeline] Encode error: {e}")
+                traceback.print_exc()
+            finally:
+                self.encode_queue.task_done()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# shared/ (modules both apps use) lives in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -1,7 +1,12 @@
 import cv2
+import time
+import threading
 import numpy as np
 from enum import Enum
-from typing import Optional
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from shared.noise import NOISE
 
 class FilterType(Enum):
     NONE = "none"
@@ -13,6 +18,20 @@ class FilterType(Enum):
     BW = "bw"
     STRANGER_THEME = "stranger_theme"
 
+class FilterQuality(Enum):
+    """
+    Speed/quality trade-off for the compiled filters. FULL matches the
+    reference filters; BALANCED and FAST compute large-sigma blurs (bloom)
+    on a downscaled copy and upsample the result. Detail steps (sharpen,
+    denoise, CLAHE) always run at full resolution.
+
+    Largest per-channel difference from apply_filter_reference on photo-like
+    frames (see test_filters.py): FULL 1, BALANCED 4, FAST 8.
+    """
+    FULL = "full"
+    BALANCED = "balanced"
+    FAST = "fast"
+
 def enhance_sharpness(image: np.ndarray, strength: float = 1.0) -> np.ndarray:
     gaussian = cv2.GaussianBlur(image, (0, 0), 3)
     return cv2.addWeighted(image, 1.0 + strength, gaussian, -strength, 0)
@@ -27,16 +46,14 @@ def add_vignette(image: np.ndarray, strength: float = 0.5) -> np.ndarray:
     kernel = Y * X.T
     mask = kernel / kernel.max()
     mask = mask * (1 - strength) + strength
-    result = image.copy().astype(np.float32)
-    for i in range(3):
-        result[:, :, i] = result[:, :, i] * mask
-    return np.clip(result, 0, 255).astype(np.uint8)
+    result = image.astype(np.float32)
+    result *= mask[:, :, np.newaxis] if result.ndim == 3 else mask
+    return np.clip(result, 0, 255, out=result).astype(np.uint8)
 
-def add_film_grain(image: np.ndarray, intensity: float = 0.15) -> np.ndarray:
-    rows, cols = image.shape[:2]
-    noise = np.random.randn(rows, cols, 3) * 25 * intensity
-    grainy = image.astype(np.float32) + noise
-    return np.clip(grainy, 0, 255).astype(np.uint8)
+def add_film_grain(image: np.ndarray, intensity: float = 0.15, out: Optional[np.ndarray] = None) -> np.ndarray:
+    # Gaussian grain sampled from the precomputed noise bank, added with saturation
+    noise = NOISE.gaussian(image.shape, 25 * intensity)
+    return cv2.add(image, noise, dst=out, dtype=cv2.CV_8U)
 
 def apply_glitch(image: np.ndarray) -> np.ndarray:
     result = image.copy()
@@ -50,15 +67,14 @@ def apply_glitch(image: np.ndarray) -> np.ndarray:
     r_shifted[:, :shift_amount] = r[:, :shift_amount]
     
     glitched = cv2.merge([b_shifted, g, r_shifted])
-    line_interval = 3
-    for i in range(0, rows, line_interval):
-        if i + 1 < rows:
-            glitched[i, :] = (glitched[i, :].astype(np.float32) * 0.7).astype(np.uint8)
+    # Every third row, except a final row with nothing below it
+    scanlines = glitched[0:rows - 1:3]
+    scanlines[:] = (scanlines.astype(np.float32) * 0.7).astype(np.uint8)
             
     for _ in range(3):
-        band_y = np.random.randint(0, rows - 20)
-        band_height = np.random.randint(2, 8)
-        shift = np.random.randint(-15, 15)
+        band_y = NOISE.integers(0, rows - 20)
+        band_height = NOISE.integers(2, 8)
+        shift = NOISE.integers(-15, 15)
         band = glitched[band_y:band_y + band_height, :].copy()
         band = np.roll(band, shift, axis=1)
         glitched[band_y:band_y + band_height, :] = band
@@ -128,13 +144,15 @@ def apply_retro(image: np.ndarray, text: str = "MAGIC 2026") -> np.ndarray:
     b_ch = cv2.convertScaleAbs(b_ch, alpha=0.95, beta=-5)
     result = cv2.merge([b_ch, g_ch, r_ch])
     result = add_vignette(result, strength=0.25)
-    
+    return _polaroid_frame(result, text)
+
+def _polaroid_frame(result: np.ndarray, text: str, out: Optional[np.ndarray] = None) -> np.ndarray:
     row, col = result.shape[:2]
     bottom_border = int(row * 0.20)
     side_border = int(col * 0.04)
     cream = [240, 248, 255]
     polaroid = cv2.copyMakeBorder(
-        result, side_border, bottom_border, side_border, side_border, cv2.BORDER_CONSTANT, value=cream
+        result, side_border, bottom_border, side_border, side_border, cv2.BORDER_CONSTANT, dst=out, value=cream
     )
     
     font = cv2.FONT_HERSHEY_SCRIPT_SIMPLEX
@@ -198,7 +216,8 @@ def apply_stranger_theme(image: np.ndarray) -> np.ndarray:
     
     return result
 
-def apply_filter(image: np.ndarray, filter_type: FilterType, text: str = "MAGIC 2026") -> np.ndarray:
+def apply_filter_reference(image: np.ndarray, filter_type: FilterType, text: str = "MAGIC 2026") -> np.ndarray:
+    """ Uncompiled filter chain; every call rebuilds its masks, LUTs and CLAHE objects. """
     enhanced = enhance_sharpness(image, strength=0.5)
     
     if filter_type == FilterType.NONE:
@@ -220,6 +239,347 @@ def apply_filter(image: np.ndarray, filter_type: FilterType, text: str = "MAGIC
     else:
         return enhanced
 
+# --- Compiled filters -------------------------------------------------------
+# Each FilterType is built once per frame shape: LUTs, vignette masks and CLAHE
+# instances are prepared up front so a frame only runs a short fixed sequence
+# of uint8 operations. Burst and GIF captures hit the same (filter, shape) pair
+# several times in a row, which is where this pays off.
+#
+# Steps write into the `dst` they are handed (OpenCV reallocates it if the
+# shape doesn't fit) and keep their temporaries in per-thread scratch buffers,
+# so after the first frame the only allocation left is the returned image.
+
+# step(img, text, dst) -> result; dst may be None, and in-place steps return img
+FilterStep = Callable[[np.ndarray, str, Optional[np.ndarray]], np.ndarray]
+
+_IDENTITY_LUT = np.arange(256, dtype=np.uint8)
+_SEPIA_MATRIX = np.array([
+    [0.272, 0.534, 0.131],
+    [0.349, 0.686, 0.168],
+    [0.393, 0.769, 0.189]
+])
+
+_scratch_local = threading.local()
+MAX_SCRATCH_PER_THREAD = 64
+
+def _scratch(tag: str, shape: Tuple[int, ...]) -> np.ndarray:
+    """
+    A uint8 work buffer owned by the calling thread. Every compiled filter on
+    the thread shares the pool; a buffer is only valid until the next step
+    asks for the same tag and shape.
+    """
+    pool: Optional[Dict[Tuple[str, Tuple[int, ...]], np.ndarray]] = getattr(_scratch_local, "pool", None)
+    if pool is None:
+        pool = _scratch_local.pool = {}
+    key = (tag, tuple(shape))
+    buffer = pool.get(key)
+    if buffer is None:
+        if len(pool) >= MAX_SCRATCH_PER_THREAD:
+            pool.clear()
+        buffer = pool[key] = np.empty(shape, dtype=np.uint8)
+    return buffer
+
+def _output(dst: Optional[np.ndarray], shape: Tuple[int, ...]) -> np.ndarray:
+    """ dst if a numpy step can write straight into it, else a new array. """
+    if dst is not None and dst.shape == tuple(shape) and dst.dtype == np.uint8:
+        return dst
+    return np.empty(shape, dtype=np.uint8)
+
+def _scale_lut(alpha: float, beta: float) -> np.ndarray:
+    # Exactly what cv2.convertScaleAbs does to each of the 256 input levels
+    return cv2.convertScaleAbs(_IDENTITY_LUT.reshape(1, -1), alpha=alpha, beta=beta).ravel()
+
+def _gain_lut(gain: float) -> np.ndarray:
+    return np.clip(_IDENTITY_LUT.astype(np.float32) * gain, 0, 255).astype(np.uint8)
+
+def _channel_lut(c0: np.ndarray, c1: np.ndarray, c2: np.ndarray) -> np.ndarray:
+    return np.dstack([c0, c1, c2])
+
+@lru_cache(maxsize=32)
+def _vignette_mask(rows: int, cols: int, strength: float, channels: int) -> np.ndarray:
+    """ Vignette gain scaled to 0-255 so it can be applied with a single cv2.multiply """
+    X = cv2.getGaussianKernel(cols, cols * 0.6)
+    Y = cv2.getGaussianKernel(rows, rows * 0.6)
+    kernel = Y * X.T
+    mask = kernel / kernel.max()
+    mask = mask * (1 - strength) + strength
+    mask = np.rint(mask * 255).astype(np.uint8)
+    if channels > 1:
+        mask = cv2.merge([mask] * channels)
+    mask.setflags(write=False)
+    return mask
+
+def _sharpen_step(strength: float) -> FilterStep:
+    def step(img, text, dst=None):
+        blurred = cv2.GaussianBlur(img, (0, 0), 3, dst=_scratch("blur", img.shape))
+        return cv2.addWeighted(img, 1.0 + strength, blurred, -strength, 0, dst=dst)
+    return step
+
+def _denoise_step(sigma: float) -> FilterStep:
+    return lambda img, text, dst=None: cv2.bilateralFilter(img, d=5, sigmaColor=sigma, sigmaSpace=sigma, dst=dst)
+
+def _lut_step(lut: np.ndarray) -> FilterStep:
+    return lambda img, text, dst=None: cv2.LUT(img, lut, dst=dst)
+
+def _vignette_step(shape: Tuple[int, ...], strength: float) -> FilterStep:
+    channels = shape[2] if len(shape) > 2 else 1
+    mask = _vignette_mask(shape[0], shape[1], strength, channels)
+    return lambda img, text, dst=None: cv2.multiply(img, mask, dst=dst, scale=1.0 / 255)
+
+# Smallest sigma a blur may shrink to on the downscaled level; None = no pyramid
+_PYRAMID_MIN_SIGMA = {
+    FilterQuality.FULL: None,
+    FilterQuality.BALANCED: 4.0,
+    FilterQuality.FAST: 2.0,
+}
+
+def _pyramid_factor(sigma: float, quality: FilterQuality) -> int:
+    """ Largest power-of-two downscale that keeps the blur at least the quality's minimum sigma. """
+    min_sigma = _PYRAMID_MIN_SIGMA[quality]
+    factor = 1
+    while min_sigma is not None and sigma / (factor * 2) >= min_sigma:
+        factor *= 2
+    return factor
+
+def _pyramid_blur(img: np.ndarray, sigma: float, factor: int, dst: Optional[np.ndarray] = None) -> np.ndarray:
+    if factor == 1:
+        return cv2.GaussianBlur(img, (0, 0), sigma, dst=dst)
+    rows, cols = img.shape[:2]
+    small_shape = (max(1, rows // factor), max(1, cols // factor)) + img.shape[2:]
+    small = cv2.resize(img, small_shape[1::-1], dst=_scratch("pyramid", small_shape), interpolation=cv2.INTER_AREA)
+    blurred = cv2.GaussianBlur(small, (0, 0), sigma / factor, dst=_scratch("pyramid_blur", small_shape))
+    return cv2.resize(blurred, (cols, rows), dst=dst, interpolation=cv2.INTER_LINEAR)
+
+def _bloom_step(sigma: float, weight: float, quality: FilterQuality = FilterQuality.FULL) -> FilterStep:
+    factor = _pyramid_factor(sigma, quality)
+
+    def step(img, text, dst=None):
+        blurred = _pyramid_blur(img, sigma, factor, dst=_scratch("blur", img.shape))
+        return cv2.addWeighted(img, 1.0 - weight, blurred, weight, 0, dst=dst)
+    return step
+
+def _lab_clahe_step(clip_limit: float, a_lut: np.ndarray, b_lut: np.ndarray) -> FilterStep:
+    clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=(8, 8))
+    ab_lut = _channel_lut(_IDENTITY_LUT, a_lut, b_lut)
+
+    def step(img, text, dst=None):
+        # Same as split / CLAHE on L / LUTs on a, b / merge, without the five plane copies
+        lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB, dst=_scratch("lab", img.shape))
+        l = cv2.extractChannel(lab, 0, dst=_scratch("lab_l", img.shape[:2]))
+        l = clahe.apply(l, dst=_scratch("lab_l_out", img.shape[:2]))
+        cv2.LUT(lab, ab_lut, dst=lab)
+        cv2.insertChannel(l, lab, 0)
+        return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR, dst=dst)
+    return step
+
+def _lab_lut_step(lab_lut: np.ndarray) -> FilterStep:
+    def step(img, text, dst=None):
+        lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB, dst=_scratch("lab", img.shape))
+        cv2.LUT(lab, lab_lut, dst=lab)
+        return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR, dst=dst)
+    return step
+
+def _gray_clahe_step(clip_limit: float) -> FilterStep:
+    clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=(8, 8))
+
+    def step(img, text, dst=None):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=_scratch("gray", img.shape[:2]))
+        return clahe.apply(gray, dst=dst)
+    return step
+
+def _to_bgr_step() -> FilterStep:
+    return lambda img, text, dst=None: cv2.cvtColor(img, cv2.COLOR_GRAY2BGR, dst=dst)
+
+def _grain_step(intensity: float) -> FilterStep:
+    return lambda img, text, dst=None: add_film_grain(img, intensity=intensity, out=dst)
+
+def _glitch_steps(shape: Tuple[int, ...]) -> List[Tuple[str, FilterStep]]:
+    rows, cols = shape[:2]
+    shift_amount = max(8, cols // 80)
+    scan_lut = _gain_lut(0.7)
+
+    def shift(img, text, dst=None):
+        # np.roll with the wrapped columns restored is a plain slice copy
+        out = _output(dst, img.shape)
+        np.copyto(out, img)
+        out[:, :-shift_amount, 0] = img[:, shift_amount:, 0]
+        out[:, shift_amount:, 2] = img[:, :-shift_amount, 2]
+        scan = out[0:rows - 1:3]
+        cv2.LUT(scan, scan_lut, dst=scan)
+        return out
+
+    def bands(img, text, dst=None):
+        for _ in range(3):
+            band_y = NOISE.integers(0, rows - 20)
+            band_height = NOISE.integers(2, 8)
+            band_shift = NOISE.integers(-15, 15)
+            band = img[band_y:band_y + band_height, :]
+            band[:] = np.roll(band, band_shift, axis=1)
+        return img
+
+    return [("channel_shift", shift), ("bands", bands), ("tone", _lut_step(_scale_lut(1.1, 5)))]
+
+def _polaroid_step() -> FilterStep:
+    return lambda img, text, dst=None: _polaroid_frame(img, text, out=dst)
+
+def _sepia_step() -> FilterStep:
+    def step(img, text, dst=None):
+        sepia = cv2.transform(img, _SEPIA_MATRIX, dst=_scratch("sepia", img.shape))
+        return cv2.addWeighted(img, 0.35, sepia, 0.65, 0, dst=dst)
+    return step
+
+def _build_steps(filter_type: FilterType, shape: Tuple[int, ...],
+                 quality: FilterQuality = FilterQuality.FULL) -> List[Tuple[str, FilterStep]]:
+    steps = [("sharpen", _sharpen_step(0.5))]
+
+    if filter_type == FilterType.NONE:
+        steps.append(("denoise", _denoise_step(30)))
+    elif filter_type == FilterType.GLITCH:
+        steps += _glitch_steps(shape)
+    elif filter_type == FilterType.NEON:
+        steps += [
+            ("lab_clahe", _lab_clahe_step(2.5, _scale_lut(1.2, 0), _scale_lut(0.9, -10))),
+            ("tone", _lut_step(_channel_lut(_scale_lut(1.15, 10), _IDENTITY_LUT, _scale_lut(1.1, 8)))),
+            ("bloom", _bloom_step(8, 0.15, quality)),
+            ("sharpen_out", _sharpen_step(0.3)),
+        ]
+    elif filter_type == FilterType.DREAMY:
+        l_lift = np.clip(np.power(_IDENTITY_LUT.astype(np.float32) / 255.0, 0.85) * 255, 0, 255).astype(np.uint8)
+        steps += [
+            ("lab_tone", _lab_lut_step(_channel_lut(l_lift, _scale_lut(0.7, 30), _scale_lut(0.75, 20)))),
+            ("bloom", _bloom_step(25, 0.45, quality)),
+            ("tone", _lut_step(_scale_lut(1.05, 15))),
+            ("vignette", _vignette_step(shape, 0.2)),
+        ]
+    elif filter_type == FilterType.RETRO:
+        l_lift = np.clip(_IDENTITY_LUT.astype(np.float32) + 15, 0, 255).astype(np.uint8)
+        steps += [
+            ("sepia", _sepia_step()),
+            ("lab_tone", _lab_lut_step(_channel_lut(l_lift, _IDENTITY_LUT, _IDENTITY_LUT))),
+            ("tone", _lut_step(_channel_lut(_scale_lut(0.95, -5), _scale_lut(1.02, 3), _scale_lut(1.08, 8)))),
+            ("vignette", _vignette_step(shape, 0.25)),
+            ("polaroid", _polaroid_step()),
+        ]
+    elif filter_type == FilterType.NOIR:
+        # Vignetting the single gray channel before expanding is equivalent and 3x cheaper
+        steps += [
+            ("gray_clahe", _gray_clahe_step(3.0)),
+            ("tone", _lut_step(_scale_lut(1.25, -10))),
+            ("vignette", _vignette_step(shape[:2], 0.4)),
+            ("to_bgr", _to_bgr_step()),
+            ("grain", _grain_step(0.12)),
+        ]
+    elif filter_type == FilterType.BW:
+        steps += [
+            ("gray_clahe", _gray_clahe_step(1.5)),
+            ("denoise", _denoise_step(40)),
+            ("to_bgr", _to_bgr_step()),
+        ]
+    elif filter_type == FilterType.STRANGER_THEME:
+        steps += [
+            ("lab_clahe", _lab_clahe_step(3.0, _scale_lut(1.5, 20), _scale_lut(0.5, 0))),
+            ("tone", _lut_step(_channel_lut(_gain_lut(0.7), _gain_lut(0.6), _gain_lut(1.5)))),
+            ("bloom", _bloom_step(10, 0.3, quality)),
+            ("vignette", _vignette_step(shape, 0.7)),
+            ("grain", _grain_step(0.20)),
+        ]
+    return steps
+
+class CompiledFilter:
+    """
+    A FilterType specialised for one input shape. Build it once, then call it
+    per frame; at FilterQuality.FULL the output matches apply_filter_reference
+    to within rounding.
+
+    Intermediate frames ping-pong between two per-thread scratch buffers, so
+    only the last step allocates, and not even that when `out` is given.
+    """
+    def __init__(self, filter_type: FilterType, shape: Tuple[int, ...], quality: FilterQuality = FilterQuality.FULL):
+        self.filter_type = filter_type
+        self.shape = tuple(shape)
+        self.quality = quality
+        self.steps = _build_steps(filter_type, self.shape, quality)
+        # Output shape of each step, learned on the first call
+        self._step_shapes: Optional[List[Tuple[int, ...]]] = None
+
+    def __call__(self, image: np.ndarray, text: str = "MAGIC 2026", out: Optional[np.ndarray] = None,
+                 step_times: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """
+        Filters `image` into `out` when it has filter_output_shape(), else into
+        a new array; the result is returned either way. `out` may be `image`.
+        step_times, if given, receives the seconds spent in each step.
+        """
+        shapes = self._step_shapes
+        learned: Optional[List[Tuple[int, ...]]] = [] if shapes is None else None
+        last = len(self.steps) - 1
+        result = previous = image
+        for i, (name, step) in enumerate(self.steps):
+            if i == last:
+                dst = out
+            elif shapes is None:
+                dst = None
+            else:
+                dst = _scratch("frame0", shapes[i])
+                if dst is result:
+                    # The previous step worked in place, so this buffer is still its input
+                    dst = _scratch("frame1", shapes[i])
+            start = time.perf_counter() if step_times is not None else 0.0
+            previous, result = result, step(result, text, dst)
+            if step_times is not None:
+                step_times[name] = time.perf_counter() - start
+            if learned is not None:
+                learned.append(result.shape)
+        if learned is not None:
+            self._step_shapes = learned
+        if result is previous:
+            # A final in-place step left the frame in a scratch buffer
+            final = _output(out, result.shape)
+            np.copyto(final, result)
+            result = final
+        return result
+
+# CLAHE objects keep internal scratch buffers, so every thread compiles its own
+_compiled_local = threading.local()
+MAX_COMPILED_PER_THREAD = 32
+
+_default_quality = FilterQuality.FULL
+
+def set_filter_quality(quality: FilterQuality):
+    """ Quality used by apply_filter calls that don't pass one. """
+    global _default_quality
+    _default_quality = quality
+
+def get_filter_quality() -> FilterQuality:
+    return _default_quality
+
+def get_compiled_filter(filter_type: FilterType, shape: Tuple[int, ...],
+                        quality: Optional[FilterQuality] = None) -> CompiledFilter:
+    quality = quality or _default_quality
+    cache: Optional[Dict[Tuple[FilterType, Tuple[int, ...], FilterQuality], CompiledFilter]] = getattr(_compiled_local, "cache", None)
+    if cache is None:
+        cache = _compiled_local.cache = {}
+    key = (filter_type, tuple(shape), quality)
+    compiled = cache.get(key)
+    if compiled is None:
+        if len(cache) >= MAX_COMPILED_PER_THREAD:
+            cache.clear()
+        compiled = cache[key] = CompiledFilter(filter_type, shape, quality)
+    return compiled
+
+def apply_filter(image: np.ndarray, filter_type: FilterType, text: str = "MAGIC 2026",
+                 quality: Optional[FilterQuality] = None, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """ Filters image, into `out` when it has filter_output_shape(); returns the result. """
+    return get_compiled_filter(filter_type, image.shape, quality)(image, text, out=out)
+
+def filter_output_shape(filter_type: FilterType, shape: Tuple[int, ...]) -> Tuple[int, int, int]:
+    """ Shape apply_filter will return for an input of `shape`, without running it. """
+    rows, cols = shape[:2]
+    if filter_type == FilterType.RETRO:
+        side_border = int(cols * 0.04)
+        bottom_border = int(rows * 0.20)
+        return (rows + side_border + bottom_border, cols + 2 * side_border, 3)
+    return (rows, cols, 3)
+
 def get_filter_from_string(filter_name: str) -> FilterType:
     if not filter_name: return FilterType.NONE
     mapping = {
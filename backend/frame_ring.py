@@ -0,0 +1,143 @@
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+class FrameRef:
+    """
+    A borrowed ring slot. `frame` is a read-only view of the ring buffer, valid
+    until release(); copy (or cv2.flip, cvtColor...) whatever must outlive it.
+    """
+    __slots__ = ("frame", "seq", "timestamp", "_ring", "_slot")
+
+    def __init__(self, ring: "FrameRing", slot: int, frame: np.ndarray, seq: int, timestamp: float):
+        self._ring = ring
+        self._slot = slot
+        self.frame = frame
+        self.seq = seq
+        self.timestamp = timestamp
+
+    def release(self):
+        if self._ring is not None:
+            self._ring._release(self._slot)
+            self._ring = None
+            self.frame = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class FrameRing:
+    """
+    The one reader of the camera. A thread decodes frames straight into a
+    fixed set of preallocated buffers (cap.read() into an existing array);
+    consumers borrow the newest slot without copying and give it back.
+
+    A slot is only rewritten once nobody holds it and it is no longer the
+    newest frame, so a borrowed frame never changes under its reader. Each
+    consumer passes the seq of the last frame it saw to borrow(), which then
+    returns the next newer frame; borrow(after=ring.seq) waits for a frame
+    captured after the call, which replaces the old "flush N frames" reads.
+    """
+    def __init__(self, cap: cv2.VideoCapture, slots: int = 6):
+        if slots < 3:
+            raise ValueError("FrameRing needs at least 3 slots (newest, borrowed, being written)")
+        self.cap = cap
+        self.slots = slots
+        self._cond = threading.Condition()
+        self._buffers: List[Optional[np.ndarray]] = [None] * slots
+        self._refs = [0] * slots
+        self._timestamps = [0.0] * slots
+        self._latest = -1
+        self._seq = 0
+        self._stopped = threading.Event()
+        self._thread = None
+        self.frames_dropped = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._reader_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    def isOpened(self) -> bool:
+        return self.cap.isOpened() and not self._stopped.is_set()
+
+    @property
+    def seq(self) -> int:
+        """ Sequence number of the newest frame (0 before the first one). """
+        return self._seq
+
+    @property
+    def shape(self) -> Optional[Tuple[int, ...]]:
+        with self._cond:
+            return self._buffers[self._latest].shape if self._latest >= 0 else None
+
+    def _free_slot(self) -> int:
+        for slot in range(self.slots):
+            if slot != self._latest and self._refs[slot] == 0:
+                return slot
+        return -1
+
+    def _reader_loop(self):
+        while not self._stopped.is_set():
+            with self._cond:
+                slot = self._free_slot()
+                if slot < 0:
+                    # Every slot is borrowed: let the driver drop frames until one comes back
+                    self.frames_dropped += 1
+                    self._cond.wait(timeout=0.05)
+                    continue
+                buffer = self._buffers[slot]
+
+            # The slot is neither newest nor borrowed, so nobody can see it while it's written
+            ret, frame = self.cap.read(buffer) if buffer is not None else self.cap.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+
+            with self._cond:
+                # A new buffer is only allocated for the first frame per slot or a resolution change
+                self._buffers[slot] = frame
+                self._timestamps[slot] = time.time()
+                self._latest = slot
+                self._seq += 1
+                self._cond.notify_all()
+
+    def borrow(self, after: int = 0, timeout: float = 1.0) -> Optional[FrameRef]:
+        """ Borrows the newest frame with seq > after, waiting up to timeout; None on timeout. """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > after or self._stopped.is_set(), timeout=timeout):
+                return None
+            if self._latest < 0 or self._seq <= after:
+                return None
+            slot = self._latest
+            self._refs[slot] += 1
+            view = self._buffers[slot].view()
+            view.flags.writeable = False
+            return FrameRef(self, slot, view, self._seq, self._timestamps[slot])
+
+    def _release(self, slot: int):
+        with self._cond:
+            self._refs[slot] -= 1
+            if self._refs[slot] == 0:
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "seq": self._seq,
+                "slots": self.slots,
+                "borrowed": sum(1 for r in self._refs if r),
+                "frames_dropped": self.frames_dropped,
+            }
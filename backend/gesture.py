@@ -1,7 +1,39 @@
+import time
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
 import mediapipe as mp
 
+import metrics
+
+INFERENCE_SECONDS = metrics.histogram("booth_gesture_inference_seconds", "MediaPipe hand inference latency")
+
 class GestureRecognizer:
-    def __init__(self):
+    """
+    MediaPipe Hands with an inference scheduler in front of it.
+
+    - Inference runs every `detect_every_n` camera frames and at most
+      `detect_hz` times per second, on a frame downscaled to `inference_width`.
+    - Once a hand is found, inference runs on a crop around it (the ROI),
+      so less of the frame is downscaled. The crop window stays put while
+      the hand is well inside it and only moves when the hand nears its
+      edge; losing the hand drops the ROI. Whenever the window changes the
+      video-mode tracker is reset, so its state never refers to another
+      window's coordinates.
+    - THUMBS_UP is only reported after `confirm_frames` consecutive
+      inferences agree. Skipped frames repeat the last inference.
+
+    In worker mode (start_worker) inference runs on a background thread:
+    submit() counts every camera frame, drops the due ones into a
+    single-slot mailbox, overwriting any frame the worker has not picked up
+    yet, and latest() returns the most recent result without waiting for
+    MediaPipe. max_result_age() says how old that result may be and still
+    count, given how often inference actually runs.
+    """
+    def __init__(self, detect_every_n: int = 1, detect_hz: float = None, inference_width: int = None,
+                 confirm_frames: int = 1, roi_margin: float = 0.4):
         self.mp_hands = mp.solutions.hands
         self.mp_draw = mp.solutions.drawing_utils
         self.hands = self.mp_hands.Hands(
@@ -9,21 +41,198 @@ class GestureRecognizer:
             min_detection_confidence=0.7,
             min_tracking_confidence=0.6
         )
+        self.detect_every_n = max(1, detect_every_n)
+        self.min_interval = 1.0 / detect_hz if detect_hz else 0.0
+        self.inference_width = inference_width
+        self.confirm_frames = max(1, confirm_frames)
+        self.roi_margin = roi_margin
+
+        self._frame_index = 0
+        self._last_inference_at = 0.0
+        self._roi = None  # (x0, y0, x1, y1) in full-frame pixels
+        self._last_results = None
+        self._streak = 0
+        self._gesture = None
+
+        self.inference_count = 0
+        self._latency_ms = None
+        self._inference_times = deque(maxlen=30)
+
+        # Worker mode: single-slot mailbox in, latest result out
+        self._mailbox = threading.Condition()
+        self._pending_frame = None
+        self._pending_timestamp = 0.0
+        self._latest = (None, None, 0.0)
+        self._worker_stop = threading.Event()
+        self._worker = None
+        self.frames_submitted = 0
+        self.frames_dropped = 0
 
     def process_frame(self, rgb_frame):
         """
         Processes an RGB frame and returns (results, gesture_name).
         Main gesture supported: "THUMBS_UP".
+        Landmarks in `results` are always relative to the full frame.
         """
-        results = self.hands.process(rgb_frame)
-        gesture = None
+        now = time.time()
+        if not self._due(now):
+            return self._last_results, self._gesture
+        return self._infer(rgb_frame, now)
+
+    def _due(self, now: float) -> bool:
+        """ Counts a camera frame; True if inference should run on it. """
+        self._frame_index += 1
+        return self._frame_index % self.detect_every_n == 0 and (now - self._last_inference_at) >= self.min_interval
+
+    def _infer(self, rgb_frame, now: float):
+        height, width = rgb_frame.shape[:2]
+        x0, y0, x1, y1 = self._roi or (0, 0, width, height)
+        model_input = rgb_frame[y0:y1, x0:x1]
+        if self.inference_width and model_input.shape[1] > self.inference_width:
+            scale = self.inference_width / model_input.shape[1]
+            model_input = cv2.resize(model_input, (self.inference_width, max(1, int(model_input.shape[0] * scale))),
+                                     interpolation=cv2.INTER_AREA)
+        else:
+            model_input = np.ascontiguousarray(model_input)
 
+        started = time.perf_counter()
+        results = self.hands.process(model_input)
+        self._record_inference(now, (time.perf_counter() - started) * 1000.0)
+
+        gesture = None
         if results.multi_hand_landmarks:
             for handLms in results.multi_hand_landmarks:
-                gesture = self._classify_gesture(handLms.landmark)
-                break  # Only evaluate the first hand
-                
-        return results, gesture
+                self._to_frame_coords(handLms.landmark, x0, y0, x1, y1, width, height)
+            landmarks = results.multi_hand_landmarks[0].landmark  # Only evaluate the first hand
+            gesture = self._classify_gesture(landmarks)
+            if not self._inside_roi(landmarks, width, height):
+                self._set_roi(self._roi_around(landmarks, width, height))
+        else:
+            self._set_roi(None)
+
+        self._streak = self._streak + 1 if gesture == "THUMBS_UP" else 0
+        self._gesture = "THUMBS_UP" if self._streak >= self.confirm_frames else None
+        self._last_results = results
+        return results, self._gesture
+
+    def start_worker(self):
+        self._worker_stop.clear()
+        self._worker = threading.Thread(target=self._worker_loop, daemon=True)
+        self._worker.start()
+        return self._worker
+
+    def stop_worker(self):
+        self._worker_stop.set()
+        with self._mailbox:
+            self._mailbox.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout=2.0)
+            self._worker = None
+
+    def submit(self, rgb_frame, timestamp: float = None):
+        """ Hands the newest frame to the worker if inference is due; the caller must not modify it afterwards. """
+        with self._mailbox:
+            self.frames_submitted += 1
+            if not self._due(time.time()):
+                return
+            if self._pending_frame is not None:
+                self.frames_dropped += 1
+            self._pending_frame = rgb_frame
+            self._pending_timestamp = timestamp or time.time()
+            self._mailbox.notify()
+
+    def latest(self):
+        """ Returns (results, gesture, frame_timestamp) of the newest finished inference. """
+        with self._mailbox:
+            return self._latest
+
+    def max_result_age(self, floor: float = 1.0) -> float:
+        """ Oldest latest() result that still counts: `floor`, or three inference intervals if longer. """
+        interval = self.min_interval
+        if len(self._inference_times) > 1:
+            observed = (self._inference_times[-1] - self._inference_times[0]) / (len(self._inference_times) - 1)
+            interval = max(interval, observed)
+        return max(floor, 3 * interval)
+
+    def _worker_loop(self):
+        while not self._worker_stop.is_set():
+            with self._mailbox:
+                while self._pending_frame is None and not self._worker_stop.is_set():
+                    self._mailbox.wait(timeout=1.0)
+                if self._worker_stop.is_set():
+                    return
+                frame, timestamp = self._pending_frame, self._pending_timestamp
+                self._pending_frame = None
+            try:
+                # submit() already decided this frame is due
+                results, gesture = self._infer(frame, time.time())
+            except Exception as e:
+                print(f"[Gesture] Inference error: {e}")
+                continue
+            with self._mailbox:
+                self._latest = (results, gesture, timestamp)
+
+    def stats(self) -> dict:
+        fps = 0.0
+        if len(self._inference_times) > 1:
+            span = self._inference_times[-1] - self._inference_times[0]
+            if span > 0:
+                fps = (len(self._inference_times) - 1) / span
+        return {
+            "inference_ms": round(self._latency_ms, 2) if self._latency_ms is not None else None,
+            "inference_fps": round(fps, 2),
+            "inferences": self.inference_count,
+            "frames": self._frame_index,
+            "roi_active": self._roi is not None,
+            "frames_submitted": self.frames_submitted,
+            "frames_dropped": self.frames_dropped,
+            "result_staleness_s": round(time.time() - self._latest[2], 3) if self._latest[2] else None,
+        }
+
+    def _record_inference(self, now: float, latency_ms: float):
+        self.inference_count += 1
+        self._last_inference_at = now
+        self._inference_times.append(now)
+        INFERENCE_SECONDS.observe(latency_ms / 1000.0)
+        # Exponential moving average keeps the number stable for display
+        self._latency_ms = latency_ms if self._latency_ms is None else 0.8 * self._latency_ms + 0.2 * latency_ms
+
+    @staticmethod
+    def _to_frame_coords(landmarks, x0, y0, x1, y1, width, height):
+        for lm in landmarks:
+            lm.x = (x0 + lm.x * (x1 - x0)) / width
+            lm.y = (y0 + lm.y * (y1 - y0)) / height
+
+    def _set_roi(self, roi):
+        if roi == self._roi:
+            return
+        self._roi = roi
+        # The tracker follows the hand in the old window's coordinates; make it detect afresh
+        if hasattr(self.hands, "reset"):
+            self.hands.reset()
+
+    def _inside_roi(self, landmarks, width, height, inset: float = 0.1) -> bool:
+        """ Whether the hand lies inside the current ROI, away from its edges by `inset` of its size. """
+        if self._roi is None:
+            return False
+        x0, y0, x1, y1 = self._roi
+        dx, dy = (x1 - x0) * inset, (y1 - y0) * inset
+        return all(x0 + dx <= lm.x * width <= x1 - dx and y0 + dy <= lm.y * height <= y1 - dy for lm in landmarks)
+
+    def _roi_around(self, landmarks, width, height):
+        xs = [lm.x * width for lm in landmarks]
+        ys = [lm.y * height for lm in landmarks]
+        # Square box with margin; the palm detector prefers square inputs
+        size = max(max(xs) - min(xs), max(ys) - min(ys)) * (1 + 2 * self.roi_margin)
+        cx = (max(xs) + min(xs)) / 2
+        cy = (max(ys) + min(ys)) / 2
+        x0 = int(max(0, cx - size / 2))
+        y0 = int(max(0, cy - size / 2))
+        x1 = int(min(width, cx + size / 2))
+        y1 = int(min(height, cy + size / 2))
+        if x1 - x0 < 32 or y1 - y0 < 32:
+            return None
+        return (x0, y0, x1, y1)
 
     def _classify_gesture(self, landmarks):
         # Y-coordinates increase moving downwards.
@@ -60,6 +269,6 @@ class GestureRecognizer:
         return None
 
     def draw_landmarks(self, frame, results):
-        if results.multi_hand_landmarks:
+        if results and results.multi_hand_landmarks:
             for handLms in results.multi_hand_landmarks:
                 self.mp_draw.draw_landmarks(frame, handLms, self.mp_hands.HAND_CONNECTIONS)
@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from queue import Queue
+from typing import List, Optional, Set, Tuple
+
+def backoff_delay(attempts: int, base: float = 5.0, cap: float = 600.0) -> float:
+    """ Exponential backoff: base, 2*base, 4*base ... capped at `cap` seconds. """
+    return min(cap, base * (2 ** max(0, attempts - 1)))
+
+class JobJournal:
+    """
+    Durable record of queued jobs in SQLite (WAL mode).
+
+    A job is a small JSON payload that references a file on disk; the file
+    itself is never copied. States:
+      queued   - handed to an in-memory queue, waiting for a worker
+      waiting  - failed, due again at next_attempt_at
+      deferred - failed, being retried by a scheduler outside the journal
+      dead     - gave up after max attempts
+    Acknowledged jobs are deleted. After a restart, recover() turns every
+    unfinished job back into a due one so it is replayed.
+    """
+    def __init__(self, path: str = "storage/jobs.db"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                queue TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_due ON jobs (queue, state, next_attempt_at)")
+
+    def enqueue(self, queue: str, payload: dict) -> int:
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO jobs (queue, payload, state, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?)",
+                (queue, json.dumps(payload), now, now)
+            )
+            return cur.lastrowid
+
+    def ack(self, job_id: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def fail(self, job_id: int, error: str, delay: float, max_attempts: Optional[int] = None) -> Tuple[int, str]:
+        """ Records a failed attempt; returns (attempts, new_state). """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return 0, "missing"
+            attempts = row[0] + 1
+            state = "dead" if max_attempts and attempts >= max_attempts else "waiting"
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                (state, attempts, now + delay, error[:500], now, job_id)
+            )
+            return attempts, state
+
+    def defer(self, job_id: int, error: str) -> int:
+        """ Records a failed attempt whose retry is owned by the caller; returns attempts. """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = 'deferred', attempts = attempts + 1, last_error = ?, updated_at = ? WHERE id = ?",
+                (error[:500], now, job_id)
+            )
+            row = self._conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else 0
+
+    def bury(self, job_id: int, error: str):
+        """ Marks a job dead now, whatever its attempt count. """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = 'dead', attempts = attempts + 1, last_error = ?, updated_at = ? WHERE id = ?",
+                (error[:500], now, job_id)
+            )
+
+    def claim_due(self, queue: str, limit: int = 500) -> List[Tuple[int, dict, int]]:
+        """ Moves due waiting jobs back to queued and returns (id, payload, attempts). """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload, attempts FROM jobs WHERE queue = ? AND state = 'waiting' AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (queue, now, limit)
+            ).fetchall()
+            if rows:
+                self._conn.executemany(
+                    "UPDATE jobs SET state = 'queued', updated_at = ? WHERE id = ?",
+                    [(now, row[0]) for row in rows]
+                )
+        return [(row[0], json.loads(row[1]), row[2]) for row in rows]
+
+    def recover(self, queue: str) -> int:
+        """ Makes every unfinished job of `queue` due now. Call once at startup. """
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET state = 'waiting', next_attempt_at = 0 WHERE queue = ? AND state IN ('queued', 'deferred')",
+                (queue,)
+            )
+            return cur.rowcount
+
+    def counts(self, queue: str) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs WHERE queue = ? GROUP BY state", (queue,)).fetchall()
+        return dict(rows)
+
+    def pending_files(self, queue: str) -> Set[str]:
+        """ Absolute paths of files that unfinished (not dead) jobs of `queue` still need. """
+        with self._lock:
+            rows = self._conn.execute("SELECT payload FROM jobs WHERE queue = ? AND state != 'dead'", (queue,)).fetchall()
+        paths = set()
+        for (payload,) in rows:
+            file_path = json.loads(payload).get("file_path")
+            if file_path:
+                paths.add(os.path.abspath(file_path))
+        return paths
+
+class JournaledQueue(Queue):
+    """
+    queue.Queue whose items are journaled before they are queued.
+
+    Items are dicts; put() adds a "job_id" key. Consumers call ack(item) when
+    done or retry(item, error) on failure, which schedules the job again
+    with exponential backoff. start_scheduler() replays unfinished jobs from
+    the previous run and feeds due retries back into the queue.
+    """
+    def __init__(self, name: str, journal: JobJournal, maxsize: int = 0, max_attempts: Optional[int] = None,
+                 backoff_base: float = 5.0, backoff_max: float = 600.0):
+        super().__init__(maxsize)
+        self.name = name
+        self.journal = journal
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def put(self, item, block=True, timeout=None):
+        if "job_id" not in item:
+            item = dict(item, job_id=self.journal.enqueue(self.name, item))
+        super().put(item, block, timeout)
+
+    def ack(self, item):
+        if item.get("job_id") is not None:
+            self.journal.ack(item["job_id"])
+
+    def retry(self, item, error: str = ""):
+        if item.get("job_id") is None:
+            return
+        attempts = item.get("attempts", 0) + 1
+        delay = backoff_delay(attempts, self.backoff_base, self.backoff_max)
+        attempts, state = self.journal.fail(item["job_id"], error, delay, self.max_attempts)
+        if state == "dead":
+            print(f"[Journal] {self.name} job {item['job_id']} gave up after {attempts} attempts: {error}")
+
+    def dead_letter(self, item, error: str = ""):
+        """ Gives up on the job without further retries; it stays in the journal as dead. """
+        if item.get("job_id") is None:
+            return
+        self.journal.bury(item["job_id"], error)
+        print(f"[Journal] {self.name} job {item['job_id']} dead-lettered: {error}")
+
+    def defer(self, item, error: str = "") -> int:
+        """ Keeps the job journaled but leaves its retries to the caller. """
+        if item.get("job_id") is None:
+            return item.get("attempts", 0) + 1
+        return self.journal.defer(item["job_id"], error)
+
+    def start_scheduler(self, shutdown_event: threading.Event, interval: float = 1.0):
+        replayed = self.journal.recover(self.name)
+        if replayed:
+            print(f"[Journal] Replaying {replayed} unfinished {self.name} jobs.")
+        worker = threading.Thread(target=self._scheduler_loop, args=(shutdown_event, interval), daemon=True)
+        worker.start()
+        return worker
+
+    def _scheduler_loop(self, shutdown_event: threading.Event, interval: float):
+        while not shutdown_event.is_set():
+            try:
+                for job_id, payload, attempts in self.journal.claim_due(self.name):
+                    super().put(dict(payload, job_id=job_id, attempts=attempts))
+            except Exception as e:
+                print(f"[Journal] Scheduler error: {e}")
+            shutdown_event.wait(interval)
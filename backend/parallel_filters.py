@@ -0,0 +1,118 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from filters import FilterQuality, FilterType, apply_filter, filter_output_shape, get_filter_quality, set_filter_quality
+from shared.noise import set_noise_seed
+
+def _init_worker(quality_value: Optional[str] = None):
+    # One OpenCV thread per process; the pool itself provides the parallelism
+    cv2.setNumThreads(1)
+    if quality_value is not None:
+        set_filter_quality(FilterQuality(quality_value))
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # Pool workers share the parent's resource tracker, so attaching adds no
+    # second registration and the parent's unlink() is the only cleanup.
+    return shared_memory.SharedMemory(name=name)
+
+def _seed_frame(seed: Optional[int], index: int):
+    if seed is not None:
+        set_noise_seed(seed + index)
+
+def _filter_shared_frame(in_name: str, in_shape: tuple, out_name: str, out_shape: tuple,
+                         index: int, filter_value: str, text: str, seed: Optional[int]) -> int:
+    in_shm = _attach(in_name)
+    out_shm = _attach(out_name)
+    try:
+        frames = np.ndarray(in_shape, dtype=np.uint8, buffer=in_shm.buf)
+        outputs = np.ndarray(out_shape, dtype=np.uint8, buffer=out_shm.buf)
+        _seed_frame(seed, index)
+        # Filtered straight into this frame's slot of the shared output block
+        slot = outputs[index]
+        result = apply_filter(frames[index], FilterType(filter_value), text=text, out=slot)
+        if result is not slot:
+            slot[...] = result
+        del frames, outputs, slot, result
+    finally:
+        in_shm.close()
+        out_shm.close()
+    return index
+
+class ParallelFilterExecutor:
+    """
+    Filters a batch of frames across a process pool. Frames travel through
+    shared memory blocks rather than being pickled; each worker writes its
+    result into its own slot of the output block so order is preserved.
+
+    With a seed, frame i is filtered with the noise bank seeded to seed + i, in
+    the pool and in the serial fallback alike, so output is reproducible.
+    """
+    def __init__(self, processes: Optional[int] = None, quality: Optional[FilterQuality] = None):
+        self.processes = processes or os.cpu_count() or 1
+        # Workers are separate processes and don't see set_filter_quality() calls in the parent
+        self.quality = quality or get_filter_quality()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker,
+                                             initargs=(self.quality.value,))
+        return self._pool
+
+    def warm_up(self):
+        """ Starts the worker processes now instead of on the first capture. """
+        pool = self._get_pool()
+        for f in [pool.submit(_init_worker, self.quality.value) for _ in range(self.processes)]:
+            f.result()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def filter_frames(self, frames: List[np.ndarray], filter_type: FilterType,
+                      text: str = "MAGIC 2026", seed: Optional[int] = None) -> List[np.ndarray]:
+        if len(frames) < 2 or self.processes < 2 or any(f.shape != frames[0].shape for f in frames):
+            return self._filter_serial(frames, filter_type, text, seed)
+
+        count = len(frames)
+        in_shape = (count,) + frames[0].shape
+        out_shape = (count,) + filter_output_shape(filter_type, frames[0].shape)
+        in_shm = shared_memory.SharedMemory(create=True, size=int(np.prod(in_shape)))
+        out_shm = shared_memory.SharedMemory(create=True, size=int(np.prod(out_shape)))
+        try:
+            inputs = np.ndarray(in_shape, dtype=np.uint8, buffer=in_shm.buf)
+            for i, frame in enumerate(frames):
+                inputs[i] = frame
+            del inputs
+
+            pool = self._get_pool()
+            futures = [
+                pool.submit(_filter_shared_frame, in_shm.name, in_shape, out_shm.name, out_shape,
+                            i, filter_type.value, text, seed)
+                for i in range(count)
+            ]
+            for future in futures:
+                future.result()
+
+            outputs = np.ndarray(out_shape, dtype=np.uint8, buffer=out_shm.buf)
+            results = [outputs[i].copy() for i in range(count)]
+            del outputs
+            return results
+        finally:
+            in_shm.close()
+            in_shm.unlink()
+            out_shm.close()
+            out_shm.unlink()
+
+    def _filter_serial(self, frames, filter_type, text, seed):
+        results = []
+        for i, frame in enumerate(frames):
+            _seed_frame(seed, i)
+            results.append(apply_filter(frame, filter_type, text=text, quality=self.quality))
+        return results
@@ -1,77 +1,342 @@
 import os
+import time
+import shutil
+import hashlib
+import tempfile
 import threading
-from queue import Queue, Empty
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty, Full
+from typing import Callable, Optional, Tuple
 import traceback
 
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+import metrics
+
 try:
     import win32print
     import win32ui
-    from PIL import Image, ImageWin
+    from PIL import ImageWin
     WIN32_AVAILABLE = True
 except ImportError:
     WIN32_AVAILABLE = False
 
+PRINT_RENDER_SECONDS = metrics.histogram("booth_print_render_seconds", "Page raster render time on a cache miss")
+PRINT_SEND_SECONDS = metrics.histogram("booth_print_send_seconds", "Time for the sink to accept a page", ["sink"])
+PRINT_JOB_SECONDS = metrics.histogram("booth_print_job_seconds", "Print job dequeue to sent, including waiting for the render", ["sink"])
+PRINT_JOBS = metrics.counter("booth_print_jobs_total", "Finished print jobs", ["sink", "result"])
+PRINT_CACHE_HITS = metrics.counter("booth_print_cache_hits_total", "Page rasters served from cache", ["tier"])
+
+def apply_print_layout(image_cv2, frame_type="stranger_things"):
+    """
+    Applies a print layout or border before saving for print.
+    """
+    # Simply add a thick black border and some text or use an overlay image
+    # For now, let's add a cinematic black border
+    h, w = image_cv2.shape[:2]
+    border_y = int(h * 0.1)
+    border_x = int(w * 0.05)
+
+    # Create black canvas
+    canvas = np.zeros((h + 2*border_y, w + 2*border_x, 3), dtype=np.uint8)
+
+    # Put original image in middle
+    canvas[border_y:border_y+h, border_x:border_x+w] = image_cv2
+
+    # Add neon text
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    cv2.putText(canvas, 'MAGIC HACKATHON', (int(w/2) - 100, border_y - 20), font, 1, (0, 0, 255), 2, cv2.LINE_AA)
+    cv2.putText(canvas, 'IEEE', (int(w/2) - 30, h + border_y + 40), font, 1, (255, 255, 255), 2, cv2.LINE_AA)
+
+    return canvas
+
+def render_print_raster(file_path: str, target_size: Tuple[int, int], layout: Optional[str] = None) -> Image.Image:
+    """ Loads a capture, lays it out and fits it onto a page-sized RGB canvas. """
+    try:
+        with Image.open(file_path) as src:
+            src.seek(0)  # First frame of animations
+            img = src.convert("RGB")
+    except Image.UnidentifiedImageError:
+        # Video captures (MP4 animations): print the first frame
+        cap = cv2.VideoCapture(file_path)
+        ret, frame = cap.read()
+        cap.release()
+        if not ret:
+            raise
+        img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    if layout:
+        framed = apply_print_layout(cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR), layout)
+        img = Image.fromarray(cv2.cvtColor(framed, cv2.COLOR_BGR2RGB))
+    return ImageOps.pad(img, target_size, method=Image.LANCZOS, color=(255, 255, 255))
+
+# --- Output sinks ----------------------------------------------------------
+
+class PrintSink:
+    """ Where rendered pages go. target_size() is the page size in device pixels. """
+    name = "sink"
+
+    def target_size(self) -> Tuple[int, int]:
+        raise NotImplementedError
+
+    def send(self, raster: Image.Image, job_name: str) -> bool:
+        raise NotImplementedError
+
+class _PaperSink(PrintSink):
+    def __init__(self, dpi: int = 300, paper_inches: Tuple[float, float] = (6, 4)):
+        self.dpi = dpi
+        self.paper_inches = paper_inches
+
+    def target_size(self) -> Tuple[int, int]:
+        return int(self.paper_inches[0] * self.dpi), int(self.paper_inches[1] * self.dpi)
+
+class Win32Sink(PrintSink):
+    """ GDI printing. The printer DC is created once and reused across jobs. """
+    name = "win32"
+
+    def __init__(self, printer_name: Optional[str] = None):
+        self.printer_name = printer_name
+        self._dc = None
+        self._printable_area = None
+
+    def _ensure_dc(self):
+        if self._dc is None:
+            printer_name = self.printer_name or win32print.GetDefaultPrinter()
+            dc = win32ui.CreateDC()
+            dc.CreatePrinterDC(printer_name)
+            self._printable_area = dc.GetDeviceCaps(8), dc.GetDeviceCaps(10) # HORZRES, VERTRES
+            self._dc = dc
+            self.printer_name = printer_name
+        return self._dc
+
+    def target_size(self) -> Tuple[int, int]:
+        self._ensure_dc()
+        return self._printable_area
+
+    def send(self, raster: Image.Image, job_name: str) -> bool:
+        try:
+            hDC = self._ensure_dc()
+            hDC.StartDoc(job_name)
+            hDC.StartPage()
+            # Raster is already at device resolution, so this is a 1:1 blit
+            ImageWin.Dib(raster).draw(hDC.GetHandleOutput(), (0, 0, raster.width, raster.height))
+            hDC.EndPage()
+            hDC.EndDoc()
+            print(f"[Printer] Successfully sent to {self.printer_name}")
+            return True
+        except Exception as e:
+            print(f"[Printer] Print failed: {e}")
+            # Printer may have gone away; start from a fresh DC next time
+            try:
+                self._dc.DeleteDC()
+            except Exception:
+                pass
+            self._dc = None
+            return False
+
+class CupsSink(_PaperSink):
+    """ CUPS via `lpr`, run as a subprocess with a timeout. """
+    name = "cups"
+
+    def __init__(self, printer_name: Optional[str] = None, dpi: int = 300, paper_inches: Tuple[float, float] = (6, 4), timeout: float = 30.0):
+        super().__init__(dpi, paper_inches)
+        self.printer_name = printer_name
+        self.timeout = timeout
+
+    def send(self, raster: Image.Image, job_name: str) -> bool:
+        fd, path = tempfile.mkstemp(suffix=".png")
+        os.close(fd)
+        try:
+            raster.save(path, compress_level=1, dpi=(self.dpi, self.dpi))
+            cmd = ["lpr", "-T", job_name, "-o", "fit-to-page"]
+            if self.printer_name:
+                cmd += ["-P", self.printer_name]
+            subprocess.run(cmd + [path], check=True, timeout=self.timeout, capture_output=True)
+            return True
+        except Exception as e:
+            print(f"[Printer] lpr failed: {e}")
+            return False
+        finally:
+            os.remove(path)
+
+class FileSink(_PaperSink):
+    """ Writes pages to a directory instead of a printer (tests, dry runs). """
+    name = "file"
+
+    def __init__(self, out_dir: str = "storage/print_out", dpi: int = 300, paper_inches: Tuple[float, float] = (6, 4)):
+        super().__init__(dpi, paper_inches)
+        self.out_dir = out_dir
+        os.makedirs(out_dir, exist_ok=True)
+
+    def send(self, raster: Image.Image, job_name: str) -> bool:
+        path = os.path.join(self.out_dir, f"{int(time.time() * 1000)}_{job_name}.png")
+        raster.save(path, compress_level=1)
+        print(f"[Printer] Wrote page {path}")
+        return True
+
+class SimulatedSink(_PaperSink):
+    name = "simulated"
+
+    def send(self, raster: Image.Image, job_name: str) -> bool:
+        print(f"[Printer] Simulated printing (win32print/PIL.ImageWin unavailable): {job_name}")
+        return True
+
+def default_sink() -> PrintSink:
+    if WIN32_AVAILABLE:
+        return Win32Sink()
+    if shutil.which("lpr"):
+        return CupsSink()
+    return SimulatedSink()
+
+# --- Spooler ---------------------------------------------------------------
+
 class PrinterWorker:
-    def __init__(self, print_queue: Queue, shutdown_event: threading.Event):
+    """
+    Print spooler: render stage -> output stage.
+
+    Jobs from print_queue are rendered on a small thread pool: the capture
+    is laid out and scaled to the sink's page size once, and the raster is
+    cached in memory and on disk keyed by file, layout and page size. The
+    output thread sends finished rasters to the sink in job order, so a
+    reprint skips straight to output. Outcomes are recorded in photo_index
+    (photo_index.PhotoIndex) when one is given.
+
+    The disk cache is not bounded here: the caller registers cache_dir with
+    storage_manager.StorageManager and passes on_cached(path), called after
+    a raster is written or hit on disk. A hit refreshes the file's mtime so
+    the least recently printed rasters are evicted first.
+    """
+    MEMORY_CACHE_SIZE = 8
+
+    def __init__(self, print_queue: Queue, shutdown_event: threading.Event, sink: Optional[PrintSink] = None,
+                 layout: Optional[str] = None, render_workers: int = 2, cache_dir: str = "storage/print_cache",
+                 photo_index=None, on_cached: Optional[Callable[[str], None]] = None):
         self.print_queue = print_queue
         self.shutdown_event = shutdown_event
-        
+        self.sink = sink or default_sink()
+        self.layout = layout
+        self.cache_dir = cache_dir
+        self.photo_index = photo_index
+        self.on_cached = on_cached
+        self._render_pool = ThreadPoolExecutor(max_workers=render_workers)
+        self._spool: Queue = Queue(maxsize=render_workers * 4)
+        self._memory_cache: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._target_size = None
+        os.makedirs(cache_dir, exist_ok=True)
+
     def start_worker(self):
-        worker = threading.Thread(target=self._worker_loop, daemon=True)
-        worker.start()
-        return worker
-        
+        threads = [
+            threading.Thread(target=self._worker_loop, daemon=True),
+            threading.Thread(target=self._output_loop, daemon=True),
+        ]
+        for t in threads:
+            t.start()
+        return threads
+
     def _worker_loop(self):
         while not self.shutdown_event.is_set():
             try:
                 job = self.print_queue.get(timeout=1.0)
-                file_path = job.get("file_path")
-                
-                if file_path and os.path.exists(file_path):
-                    self._print_image(file_path)
-                
-                self.print_queue.task_done()
             except Empty:
                 continue
+            file_path = job.get("file_path")
+            if file_path and os.path.exists(file_path):
+                future = self._render_pool.submit(self.prerender, file_path)
+            else:
+                future = None
+            dequeued_at = time.perf_counter()
+            # Blocks when output is behind: at most a few rendered pages wait in memory
+            while not self.shutdown_event.is_set():
+                try:
+                    self._spool.put((job, future, dequeued_at), timeout=1.0)
+                    break
+                except Full:
+                    continue
+
+    def _output_loop(self):
+        while not self.shutdown_event.is_set():
+            try:
+                job, future, dequeued_at = self._spool.get(timeout=1.0)
+            except Empty:
+                continue
+            try:
+                if future is None:
+                    self._ack(job)  # File is gone, nothing to print
+                    continue
+                raster = future.result()
+                name = os.path.basename(job["file_path"])
+                print(f"[Printer] Starting print job for {name}")
+                with PRINT_SEND_SECONDS.labels(self.sink.name).time():
+                    sent = self.sink.send(raster, name)
+                PRINT_JOB_SECONDS.labels(self.sink.name).observe(time.perf_counter() - dequeued_at)
+                PRINT_JOBS.labels(self.sink.name, "ok" if sent else "failed").inc()
+                self._record(job, "printed" if sent else "failed")
+                if sent:
+                    self._ack(job)
+                elif hasattr(self.print_queue, "retry"):
+                    self.print_queue.retry(job, "print failed")
             except Exception as e:
                 print(f"[Printer] Worker error: {e}")
-                
-    def _print_image(self, file_path: str):
-        if not WIN32_AVAILABLE:
-            print(f"[Printer] Simulated printing (win32print/PIL.ImageWin unavailable): {file_path}")
-            return
-            
+                PRINT_JOBS.labels(self.sink.name, "error").inc()
+                self._record(job, "failed")
+                if hasattr(self.print_queue, "retry"):
+                    self.print_queue.retry(job, str(e))
+            finally:
+                self.print_queue.task_done()
+
+    def _ack(self, job):
+        if hasattr(self.print_queue, "ack"):
+            self.print_queue.ack(job)
+
+    def _record(self, job, status: str):
+        if self.photo_index is not None and job.get("file_path"):
+            self.photo_index.set_print(job["file_path"], status)
+
+    def target_size(self) -> Tuple[int, int]:
+        if self._target_size is None:
+            self._target_size = tuple(self.sink.target_size())
+        return self._target_size
+
+    def _cache_key(self, file_path: str) -> str:
+        st = os.stat(file_path)
+        width, height = self.target_size()
+        raw = f"{os.path.abspath(file_path)}|{st.st_mtime_ns}|{st.st_size}|{self.layout}|{width}x{height}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def prerender(self, file_path: str) -> Image.Image:
+        """ Returns the page raster for a file, rendering it only on a cache miss. """
+        key = self._cache_key(file_path)
+        with self._cache_lock:
+            raster = self._memory_cache.get(key)
+            if raster is not None:
+                self._memory_cache.move_to_end(key)
+                PRINT_CACHE_HITS.labels("memory").inc()
+                return raster
+
+        cache_path = os.path.join(self.cache_dir, f"{key}.png")
+        raster = None
         try:
-            print(f"[Printer] Starting print job for {file_path}")
-            printer_name = win32print.GetDefaultPrinter()
-            img = Image.open(file_path)
-            
-            hDC = win32ui.CreateDC()
-            hDC.CreatePrinterDC(printer_name)
-            
-            printable_area = hDC.GetDeviceCaps(8), hDC.GetDeviceCaps(10) # HORZRES, VERTRES
-            
-            hDC.StartDoc("MAGIC Photo Booth")
-            hDC.StartPage()
-            
-            dib = ImageWin.Dib(img)
-            
-            ratio = min(printable_area[0] / img.width, printable_area[1] / img.height)
-            scaled_width = int(img.width * ratio)
-            scaled_height = int(img.height * ratio)
-            
-            x1 = int((printable_area[0] - scaled_width) / 2)
-            y1 = int((printable_area[1] - scaled_height) / 2)
-            x2 = x1 + scaled_width
-            y2 = y1 + scaled_height
-            
-            dib.draw(hDC.GetHandleOutput(), (x1, y1, x2, y2))
-            
-            hDC.EndPage()
-            hDC.EndDoc()
-            hDC.DeleteDC()
-            
-            print(f"[Printer] Successfully sent to {printer_name}")
-            
-        except Exception as e:
-            print(f"[Printer] Print failed: {e}")
+            with Image.open(cache_path) as cached:
+                raster = cached.convert("RGB")
+            os.utime(cache_path)
+            PRINT_CACHE_HITS.labels("disk").inc()
+        except FileNotFoundError:
+            pass  # Never rendered, or evicted since
+        if raster is None:
+            with PRINT_RENDER_SECONDS.time():
+                raster = render_print_raster(file_path, self.target_size(), self.layout)
+            tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+            raster.save(tmp_path, format="PNG", compress_level=1)
+            os.replace(tmp_path, cache_path)
+        if self.on_cached is not None:
+            self.on_cached(cache_path)
+
+        with self._cache_lock:
+            self._memory_cache[key] = raster
+            while len(self._memory_cache) > self.MEMORY_CACHE_SIZE:
+                self._memory_cache.popitem(last=False)
+        return raster
@@ -0,0 +1,168 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+import metrics
+
+FETCHES = metrics.counter("booth_print_fetches_total", "Images resolved for /print, by where they came from", ["source"])
+FETCH_SECONDS = metrics.histogram("booth_print_fetch_seconds", "Network time per /print download or revalidation")
+
+# (local path, source) where source is local / cached / revalidated / downloaded / stale
+FetchResult = Tuple[str, str]
+
+class RemoteFetcher:
+    """
+    Turns the image URL of a /print request into a local file, touching the
+    network as little as possible:
+
+    - resolve_local(url) maps URLs of our own captures (our /photos/ route,
+      or the public URL an upload was given) to the original on disk.
+    - Downloads are cached in cache_dir under a hash of the URL. A copy
+      checked less than `fresh_for` seconds ago is used as is; an older one
+      is revalidated with If-None-Match / If-Modified-Since, and still used
+      if the server can't be reached.
+    - Concurrent fetches of one URL share a single download.
+    - At most `workers` downloads run at once, each with a socket timeout.
+
+    Local and fresh cached hits resolve on the caller's thread without
+    network; fetch() returns an already completed Future for them.
+    """
+    def __init__(self, cache_dir: str, workers: int = 2, timeout: float = 15.0, fresh_for: float = 3600.0,
+                 resolve_local: Optional[Callable[[str], Optional[str]]] = None):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.fresh_for = fresh_for
+        self.resolve_local = resolve_local
+        os.makedirs(cache_dir, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="print-fetch")
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, "Future[FetchResult]"] = {}
+        # cache path -> {"etag", "last_modified", "checked_at"}, mirrored in <path>.json
+        self._meta: Dict[str, dict] = {}
+        self._sources: Dict[str, int] = {}
+
+    def path_for(self, url: str) -> str:
+        name = os.path.basename(urllib.parse.urlsplit(url).path) or "image.jpg"
+        name = re.sub(r"[^A-Za-z0-9._-]", "_", name)[-80:]
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{digest}_{name}")
+
+    def fetch(self, url: str) -> "Future[FetchResult]":
+        """ Future of (local path, source) for `url`; ValueError for URLs it can't fetch. """
+        scheme = urllib.parse.urlsplit(url).scheme
+        if scheme not in ("http", "https", ""):
+            raise ValueError(f"Unsupported URL scheme: {url}")
+        hit = self._lookup(url)
+        if hit is not None:
+            future: "Future[FetchResult]" = Future()
+            future.set_result(self._count(hit))
+            return future
+        if not scheme:
+            raise ValueError(f"No local photo at {url}")
+        with self._lock:
+            future = self._in_flight.get(url)
+            if future is not None:
+                return future
+            future = self._pool.submit(self._download, url)
+            self._in_flight[url] = future
+        future.add_done_callback(lambda _f: self._forget(url))
+        return future
+
+    def _forget(self, url: str):
+        with self._lock:
+            self._in_flight.pop(url, None)
+
+    def _count(self, result: FetchResult) -> FetchResult:
+        FETCHES.labels(result[1]).inc()
+        with self._lock:
+            self._sources[result[1]] = self._sources.get(result[1], 0) + 1
+        return result
+
+    def _lookup(self, url: str) -> Optional[FetchResult]:
+        if self.resolve_local is not None:
+            local = self.resolve_local(url)
+            if local:
+                return local, "local"
+        path = self.path_for(url)
+        meta = self._load_meta(path)
+        if meta and os.path.exists(path) and time.time() - meta.get("checked_at", 0) < self.fresh_for:
+            return path, "cached"
+        return None
+
+    def _load_meta(self, path: str) -> Optional[dict]:
+        with self._lock:
+            meta = self._meta.get(path)
+        if meta is None:
+            try:
+                with open(path + ".json", "r") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                return None
+            with self._lock:
+                self._meta[path] = meta
+        return meta
+
+    def _save_meta(self, path: str, meta: dict):
+        with self._lock:
+            self._meta[path] = meta
+        try:
+            with open(path + ".json", "w") as f:
+                json.dump(meta, f)
+        except OSError as e:
+            print(f"[Fetch] Could not save cache metadata for {path}: {e}")
+
+    def _download(self, url: str) -> FetchResult:
+        path = self.path_for(url)
+        cached = os.path.exists(path)
+        meta = self._load_meta(path) if cached else None
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        tmp = path + ".tmp"
+        started = time.perf_counter()
+        try:
+            request = urllib.request.Request(url, headers=headers)
+            with urllib.request.urlopen(request, timeout=self.timeout) as response, open(tmp, "wb") as f:
+                shutil.copyfileobj(response, f, 1 << 16)
+                etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+            os.replace(tmp, path)
+            self._save_meta(path, {"etag": etag, "last_modified": last_modified, "checked_at": time.time()})
+            return self._count((path, "downloaded"))
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and cached:
+                self._save_meta(path, dict(meta, checked_at=time.time()))
+                return self._count((path, "revalidated"))
+            error = e
+        except (urllib.error.URLError, OSError) as e:
+            error = e
+        finally:
+            FETCH_SECONDS.observe(time.perf_counter() - started)
+            if os.path.exists(tmp):
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+        if cached:
+            # Offline or the server is failing: an old copy still prints the same photo
+            print(f"[Fetch] Using cached copy of {url} ({error})")
+            return self._count((path, "stale"))
+        raise error
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"in_flight": len(self._in_flight), "sources": dict(self._sources)}
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,372 @@
+"""
+Re-renders existing captures with another filter, caption or print layout:
+
+    python rerender.py --filter RETRO --text "ANA & BEN 2026"
+    python rerender.py --filter NOIR --layout stranger_things --day 2026-10-18 --mode burst
+    python rerender.py --filter BW storage/raw/2026_10_18 storage/local_backup/2026_10_17
+
+Without paths, captures are streamed from the photo index. Variants go to
+storage/variants/<name>/, mirroring the capture's folder under
+storage/local_backup, so they have their own disk budget in app.py and are
+never mistaken for captures. A capture saved with app.py --save-raw is re-filtered from
+its unfiltered frames, so bursts get a new collage and GIFs a new
+animation; any other still is re-filtered from the saved image, on top of
+the filter it already has.
+
+Variants that already exist are skipped, so an interrupted run picks up
+where it stopped; --force renders them again.
+"""
+import os
+import re
+import sys
+import json
+import zlib
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+import cv2
+
+# shared/ (modules both apps use) lives in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from capture_modes import CaptureManager, CaptureMode, RawCapture
+from filters import FilterQuality, FilterType, apply_filter, set_filter_quality
+from shared.noise import set_noise_seed
+from parallel_filters import _init_worker
+from shared.photo_index import ANIMATION_EXTENSIONS, MEDIA_EXTENSIONS, PhotoIndex
+
+BACKUP_ROOT = os.path.join("storage", "local_backup")
+RAW_ROOT = os.path.join("storage", "raw")
+VARIANTS_ROOT = os.path.join("storage", "variants")
+# Raw frames are kept lossless; level 1 trades file size for a fast save
+RAW_PNG_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+
+# --- Raw captures ----------------------------------------------------------
+
+def raw_manifest_for(original_path: str, backup_root: str = BACKUP_ROOT, raw_root: str = RAW_ROOT) -> str:
+    """ Where the raw frames of a capture under backup_root are described (it may not exist). """
+    rel = os.path.relpath(os.path.abspath(original_path), os.path.abspath(backup_root))
+    return os.path.join(raw_root, os.path.splitext(rel)[0] + ".json")
+
+def save_raw_capture(raw: RawCapture, original_path: str, backup_root: str = BACKUP_ROOT, raw_root: str = RAW_ROOT,
+                     animation_format: Optional[str] = None, animation_width: Optional[int] = None,
+                     boomerang: bool = False) -> Optional[str]:
+    """
+    Writes a capture's unfiltered frames as PNGs plus a JSON manifest with
+    everything needed to build it again; returns the manifest path, or None
+    if a write failed (nothing partial is left behind).
+    """
+    manifest_path = raw_manifest_for(original_path, backup_root, raw_root)
+    directory = os.path.dirname(manifest_path)
+    stem = os.path.splitext(os.path.basename(manifest_path))[0]
+    os.makedirs(directory, exist_ok=True)
+    frames = []
+    for i, frame in enumerate(raw.frames):
+        name = f"{stem}_raw{i}.png"
+        if not cv2.imwrite(os.path.join(directory, name), frame, RAW_PNG_PARAMS):
+            for written in frames + [name]:
+                try:
+                    os.remove(os.path.join(directory, written))
+                except OSError:
+                    pass
+            return None
+        frames.append(name)
+    manifest = {
+        "original": os.path.abspath(original_path),
+        "mode": raw.mode.value,
+        "filter": raw.filter_type.name,
+        "text": raw.text,
+        "frames": frames,
+        "timestamps": raw.timestamps,
+        "base_timestamp": raw.base_timestamp,
+        "frame_duration": raw.frame_duration,
+        "seed": raw.seed,
+        "animation_format": animation_format,
+        "animation_width": animation_width,
+        "boomerang": boomerang,
+    }
+    tmp = manifest_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, manifest_path)
+    return manifest_path
+
+def load_raw_capture(manifest_path: str, filter_type: FilterType, text: str) -> Tuple[RawCapture, dict]:
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(manifest_path)
+    frames = []
+    for name in manifest["frames"]:
+        frame = cv2.imread(os.path.join(directory, name), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError(f"Cannot decode raw frame {name} of {manifest_path}")
+        frames.append(frame)
+    raw = RawCapture(
+        mode=CaptureMode(manifest["mode"]),
+        frames=frames,
+        timestamps=manifest["timestamps"],
+        base_timestamp=manifest["base_timestamp"],
+        filter_type=filter_type,
+        text=text,
+        frame_duration=manifest["frame_duration"],
+        seed=manifest["seed"]
+    )
+    return raw, manifest
+
+def raw_capture_files(manifest_path: str) -> List[str]:
+    """ The frames a raw manifest lists, then the manifest itself (none of them need exist). """
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        frames = manifest.get("frames", []) if isinstance(manifest, dict) else []
+    except (OSError, ValueError):
+        frames = []
+    directory = os.path.dirname(manifest_path)
+    return [os.path.join(directory, name) for name in frames] + [manifest_path]
+
+def remove_raw_capture(manifest_path: str) -> List[str]:
+    """ Deletes a raw manifest and whatever of its frames are left; returns the paths removed. """
+    removed = []
+    for path in raw_capture_files(manifest_path):
+        try:
+            os.remove(path)
+            removed.append(path)
+        except OSError:
+            pass
+    return removed
+
+# --- Rendering (runs in the worker processes) -------------------------------
+
+@dataclass
+class RenderItem:
+    original: str                   # The capture the variant belongs to
+    manifest: Optional[str] = None  # Its raw manifest, when it has one
+
+@dataclass
+class RenderSettings:
+    filter_type: FilterType
+    text: str
+    layout: Optional[str]
+    name: str
+    backup_root: str = BACKUP_ROOT
+    variants_root: str = VARIANTS_ROOT
+
+def variant_path(original: str, settings: RenderSettings, extension: Optional[str] = None) -> str:
+    """ variants_root/<name>/<folder under backup_root>/<stem><ext>; captures elsewhere go straight under <name>. """
+    rel = os.path.relpath(os.path.abspath(original), os.path.abspath(settings.backup_root))
+    if rel.startswith(os.pardir + os.sep):
+        rel = os.path.basename(original)
+    stem, ext = os.path.splitext(rel)
+    return os.path.join(settings.variants_root, settings.name, stem + (extension or ext))
+
+def _output_extension(item: RenderItem) -> str:
+    ext = os.path.splitext(item.original)[1].lower()
+    return ext if ext in ANIMATION_EXTENSIONS else ".jpg"
+
+def _write_atomic(path: str, data: bytes):
+    # A variant either exists whole or not at all, which is what resuming relies on
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _filter_frames(frames, settings: RenderSettings, seed: int) -> List:
+    images = []
+    for i, frame in enumerate(frames):
+        set_noise_seed(seed + i)
+        images.append(apply_filter(frame, settings.filter_type, text=settings.text))
+    return images
+
+def render_item(item: RenderItem, settings: RenderSettings) -> Tuple[str, str]:
+    """ Renders one variant; returns (status, output path). """
+    output = variant_path(item.original, settings, _output_extension(item))
+    # Seeded by capture, so grain and glitches don't change when a run is resumed
+    seed = zlib.crc32(os.path.basename(item.original).encode("utf-8"))
+
+    if item.manifest:
+        raw, manifest = load_raw_capture(item.manifest, settings.filter_type, settings.text)
+        if raw.seed is not None:
+            seed = raw.seed
+        manager = CaptureManager(animation_format=manifest.get("animation_format") or "gif",
+                                 animation_width=manifest.get("animation_width"),
+                                 boomerang=manifest.get("boomerang", False))
+        result = manager.build_result(raw, _filter_frames(raw.frames, settings, seed))
+        if result.animation_bytes is not None:
+            output = variant_path(item.original, settings, result.animation_format.extension)
+            _write_atomic(output, result.animation_bytes)
+            return "rendered", output
+        image = result.collage_image if result.collage_image is not None else result.images[0]
+    elif item.original.lower().endswith(ANIMATION_EXTENSIONS):
+        return "unsupported", output  # Needs the raw frames
+    else:
+        original = cv2.imread(item.original, cv2.IMREAD_COLOR)
+        if original is None:
+            raise ValueError(f"Cannot decode {item.original}")
+        image = _filter_frames([original], settings, seed)[0]
+
+    if settings.layout:
+        from printer import apply_print_layout
+        image = apply_print_layout(image, settings.layout)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    if not ok:
+        raise RuntimeError(f"JPEG encode failed for {item.original}")
+    _write_atomic(output, encoded.tobytes())
+    return "rendered", output
+
+def _render_safely(item: RenderItem, settings: RenderSettings) -> Tuple[str, str, str]:
+    try:
+        status, output = render_item(item, settings)
+        return status, item.original, output
+    except Exception as e:
+        return "failed", item.original, str(e)
+
+# --- Sources ---------------------------------------------------------------
+
+def _item_for(original: str, backup_root: str, raw_root: str) -> RenderItem:
+    manifest = raw_manifest_for(original, backup_root, raw_root)
+    return RenderItem(os.path.abspath(original), manifest if os.path.exists(manifest) else None)
+
+def items_from_index(db_path: str, backup_root: str, raw_root: str, day: Optional[str] = None,
+                     mode: Optional[str] = None, page_size: int = 200) -> Iterator[RenderItem]:
+    """ Every indexed capture outside the temp folders, newest first, a page at a time. """
+    index = PhotoIndex(db_path)
+    root = os.path.abspath(backup_root)
+    cursor = None
+    while True:
+        photos, cursor = index.page(page_size, cursor, day=day, mode=mode)
+        for photo in photos:
+            if photo["path"].startswith(root + os.sep):
+                yield _item_for(photo["path"], backup_root, raw_root)
+        if cursor is None:
+            return
+
+def items_from_paths(paths: List[str], backup_root: str, raw_root: str) -> Iterator[RenderItem]:
+    """ Raw manifests and captures under `paths` (dot-dirs are skipped). """
+    def walk(path):
+        if os.path.isfile(path):
+            yield path
+            return
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            for filename in sorted(filenames):
+                yield os.path.join(dirpath, filename)
+
+    raw_dir = os.path.abspath(raw_root) + os.sep
+    for path in paths:
+        for file_path in walk(path):
+            lower = file_path.lower()
+            if os.path.abspath(file_path).startswith(raw_dir) and not lower.endswith(".json"):
+                continue  # Raw frames, read through their manifest
+            if lower.endswith(".json"):
+                try:
+                    with open(file_path, "r") as f:
+                        manifest = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                original = manifest.get("original") if isinstance(manifest, dict) else None
+                if isinstance(original, str) and original:
+                    yield RenderItem(original, os.path.abspath(file_path))
+            elif lower.endswith(MEDIA_EXTENSIONS):
+                yield _item_for(file_path, backup_root, raw_root)
+
+# --- Driver ----------------------------------------------------------------
+
+def variant_name(filter_type: FilterType, text: str, layout: Optional[str]) -> str:
+    """ Default variant folder, so different settings never resume into each other's output. """
+    parts = [filter_type.name, text] + ([layout] if layout else [])
+    return re.sub(r"[^a-z0-9]+", "-", "-".join(parts).lower()).strip("-")
+
+def run(items: Iterator[RenderItem], settings: RenderSettings, workers: int, quality: FilterQuality,
+        force: bool = False) -> dict:
+    """
+    Renders every item not rendered yet, across `workers` processes. Only a
+    couple of items per worker are in flight at a time, so memory stays flat
+    however many captures there are.
+    """
+    counts = {"rendered": 0, "skipped": 0, "unsupported": 0, "failed": 0}
+    seen = set()
+
+    def todo():
+        for item in items:
+            if item.original in seen:
+                continue
+            seen.add(item.original)
+            if not force and os.path.exists(variant_path(item.original, settings, _output_extension(item))):
+                counts["skipped"] += 1
+                continue
+            yield item
+
+    def report(result):
+        status, original, detail = result
+        counts[status] += 1
+        if status == "failed":
+            print(f"[Rerender] {os.path.basename(original)} failed: {detail}")
+        elif status == "unsupported":
+            print(f"[Rerender] {os.path.basename(original)} skipped: animations need raw frames (--save-raw)")
+        done = counts["rendered"] + counts["failed"]
+        if status == "rendered" and done % 25 == 0:
+            print(f"[Rerender] {done} rendered...")
+
+    if workers <= 1:
+        set_filter_quality(quality)
+        for item in todo():
+            report(_render_safely(item, settings))
+        return counts
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(quality.value,))
+    pending = set()
+    try:
+        for item in todo():
+            pending.add(pool.submit(_render_safely, item, settings))
+            if len(pending) >= workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    report(future.result())
+        for future in pending:
+            report(future.result())
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-render captures with another filter, caption or layout.")
+    parser.add_argument("paths", nargs="*", help="Raw folders, capture folders or files (default: the photo index)")
+    parser.add_argument("--filter", type=str.upper, choices=[f.name for f in FilterType], required=True, help="Filter to apply")
+    parser.add_argument("--text", default="MAGIC 2026", help="Caption for filters that draw one (RETRO)")
+    parser.add_argument("--layout", default=None, help="Print layout frame, e.g. stranger_things (stills only)")
+    parser.add_argument("--name", default=None, help="Variant folder name (default: from filter, text and layout)")
+    parser.add_argument("--day", default=None, help="Only captures from this day (YYYY-MM-DD), with the index")
+    parser.add_argument("--mode", choices=[m.value for m in CaptureMode], default=None, help="Only this capture mode, with the index")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--quality", choices=[q.value for q in FilterQuality], default="full", help="Filter quality")
+    parser.add_argument("--force", action="store_true", help="Render variants that already exist again")
+    parser.add_argument("--db", default=os.path.join("storage", "photos.db"), help="Photo index")
+    parser.add_argument("--backup-root", default=BACKUP_ROOT, help="Where captures are saved")
+    parser.add_argument("--raw-root", default=RAW_ROOT, help="Where raw frames are saved")
+    parser.add_argument("--variants-root", default=VARIANTS_ROOT, help="Where variants are written")
+    args = parser.parse_args(argv)
+
+    filter_type = FilterType[args.filter]
+    settings = RenderSettings(filter_type, args.text, args.layout,
+                              args.name or variant_name(filter_type, args.text, args.layout),
+                              backup_root=args.backup_root, variants_root=args.variants_root)
+    if args.paths:
+        items = items_from_paths(args.paths, args.backup_root, args.raw_root)
+    else:
+        items = items_from_index(args.db, args.backup_root, args.raw_root, day=args.day, mode=args.mode)
+
+    print(f"[Rerender] {filter_type.name} into {os.path.join(settings.variants_root, settings.name)} with {args.workers} workers")
+    try:
+        counts = run(items, settings, args.workers, FilterQuality(args.quality), force=args.force)
+    except KeyboardInterrupt:
+        print("[Rerender] Interrupted; run the same command again to resume.")
+        return 130
+    print(f"[Rerender] {counts['rendered']} rendered, {counts['skipped']} already done, "
+          f"{counts['unsupported']} unsupported, {counts['failed']} failed.")
+    return 1 if counts["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+@dataclass
+class RetryItem:
+    file_path: str
+    job: Optional[dict] = None
+    attempts: int = 0
+    next_attempt_at: float = 0.0
+    created_at: float = field(default_factory=time.time)
+
+class RetryScheduler:
+    """
+    Continuously retries failed uploads until they succeed.
+
+    - Nothing is attempted while `health_check()` says we are offline; it is
+      probed every `probe_interval` seconds. When connectivity comes back,
+      every backlogged item becomes due at once.
+    - Each item backs off exponentially with +/- `jitter` randomisation so a
+      reconnect does not hit the server in lockstep.
+    - At most `concurrency` retries run at a time, newest photos first, and
+      only while `is_busy()` (fresh uploads pending) is False.
+    """
+    def __init__(self, handler: Callable[[RetryItem], bool], health_check: Optional[Callable[[], bool]] = None,
+                 is_busy: Optional[Callable[[], bool]] = None, concurrency: int = 2, backoff_base: float = 2.0,
+                 backoff_max: float = 300.0, jitter: float = 0.3, probe_interval: float = 3.0):
+        self.handler = handler
+        self.health_check = health_check
+        self.is_busy = is_busy or (lambda: False)
+        self.concurrency = concurrency
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.probe_interval = probe_interval
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._items: List[RetryItem] = []
+        self._slots = threading.Semaphore(concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=concurrency)
+        self._online: Optional[bool] = None  # None = unknown, probe before the next attempt
+        self._in_flight = 0
+        self.succeeded = 0
+        self.failed_attempts = 0
+
+    def add(self, file_path: str, job: Optional[dict] = None, attempts: int = 0, created_at: Optional[float] = None):
+        item = RetryItem(file_path=file_path, job=job, attempts=attempts, created_at=created_at or time.time())
+        if attempts:
+            item.next_attempt_at = time.time() + self._delay(attempts)
+        with self._lock:
+            self._items.append(item)
+        self._wake.set()
+
+    def start(self, shutdown_event: threading.Event):
+        worker = threading.Thread(target=self._dispatch_loop, args=(shutdown_event,), daemon=True)
+        worker.start()
+        return worker
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backlog": len(self._items),
+                "in_flight": self._in_flight,
+                "online": self._online,
+                "succeeded": self.succeeded,
+                "failed_attempts": self.failed_attempts,
+            }
+
+    def _delay(self, attempts: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** max(0, attempts - 1)))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _check_online(self) -> bool:
+        if self.health_check is None:
+            return True
+        try:
+            online = bool(self.health_check())
+        except Exception:
+            online = False
+        with self._lock:
+            if online and self._online is False:
+                # Back online: don't make guests wait out the offline backoff
+                now = time.time()
+                for item in self._items:
+                    item.next_attempt_at = now
+                print(f"[Retry] Connectivity restored, draining {len(self._items)} backlogged files.")
+            self._online = online
+        return online
+
+    def _take_due(self) -> Optional[RetryItem]:
+        now = time.time()
+        with self._lock:
+            due = [item for item in self._items if item.next_attempt_at <= now]
+            if not due:
+                return None
+            item = max(due, key=lambda i: i.created_at)
+            self._items.remove(item)
+            self._in_flight += 1
+            return item
+
+    def _next_due_in(self) -> float:
+        with self._lock:
+            if not self._items:
+                return 1.0
+            return max(0.05, min(1.0, min(i.next_attempt_at for i in self._items) - time.time()))
+
+    def _dispatch_loop(self, shutdown_event: threading.Event):
+        while not shutdown_event.is_set():
+            with self._lock:
+                has_items = bool(self._items)
+                online = self._online
+            if not has_items:
+                self._wake.wait(timeout=1.0)
+                self._wake.clear()
+                continue
+            if not online and not self._check_online():
+                shutdown_event.wait(self.probe_interval)
+                continue
+            if self.is_busy():
+                shutdown_event.wait(0.2)
+                continue
+            if not self._slots.acquire(timeout=0.5):
+                continue
+            item = self._take_due()
+            if item is None:
+                self._slots.release()
+                self._wake.wait(timeout=self._next_due_in())
+                self._wake.clear()
+                continue
+            self._pool.submit(self._run, item)
+
+    def _run(self, item: RetryItem):
+        try:
+            ok = self.handler(item)
+        except Exception as e:
+            print(f"[Retry] Handler error for {item.file_path}: {e}")
+            ok = False
+        with self._lock:
+            self._in_flight -= 1
+            if ok:
+                self.succeeded += 1
+            else:
+                self.failed_attempts += 1
+                item.attempts += 1
+                item.next_attempt_at = time.time() + self._delay(item.attempts)
+                self._items.append(item)
+                # A failure may mean the network dropped; probe before the next attempt
+                self._online = None
+        self._slots.release()
+        self._wake.set()
@@ -0,0 +1,319 @@
+import os
+import time
+import shutil
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+MB = 1024 * 1024
+
+@dataclass
+class StorageClass:
+    """
+    One directory the booth writes into.
+
+    budget_bytes: 0 means no budget of its own (disk pressure still applies).
+    evictable(path): whether a file may be deleted right now; None means the
+        class is never evicted, only measured.
+    priority: under disk pressure, lower priorities are emptied first.
+    """
+    name: str
+    root: str
+    budget_bytes: int = 0
+    evictable: Optional[Callable[[str], bool]] = None
+    priority: int = 0
+
+class StorageManager:
+    """
+    Keeps local disk use bounded: each class stays under its byte budget and
+    the disk keeps at least `min_free_bytes` free, by deleting the least
+    recently used files that their class allows to go.
+
+    "Recently used" is the newest of the file's mtime and the last touch()
+    (the file was served), since atime is unreliable on the kiosk's Windows.
+    Which files may go is decided by the caller's evictable() predicates;
+    the booth never lets an original go before it is uploaded. pinned()
+    returns absolute paths that must stay whatever their class (files that
+    queued jobs still need); it is called once per enforce() pass, not per
+    file. on_evict(path, class name) runs after each deletion so the caller
+    can forget the file.
+
+    Sizes come from an in-memory index, not from listing the directories:
+    rescan() walks every class once at start() and again from make_room(),
+    and in between the caller record()s each file it writes or deletes.
+    Files written by other processes (rerender variants) are counted at the
+    next rescan.
+
+    Enforcement runs every `interval` seconds on a background thread, when
+    record() pushes a class over budget, and synchronously from make_room()
+    when a write has just failed.
+    """
+    def __init__(self, classes: List[StorageClass], min_free_bytes: int = 0, interval: float = 60.0,
+                 on_evict: Optional[Callable[[str, str], None]] = None,
+                 pinned: Optional[Callable[[], Set[str]]] = None):
+        self.classes = {c.name: c for c in classes}
+        self.min_free_bytes = min_free_bytes
+        self.interval = interval
+        self.on_evict = on_evict
+        self.pinned = pinned
+        for c in classes:
+            os.makedirs(c.root, exist_ok=True)
+        self._enforce_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        # abspath -> last touch()
+        self._touched: Dict[str, float] = {}
+        # class name -> {abspath: (size, link count, mtime)}, as of the last rescan plus record()s since
+        self._files: Dict[str, Dict[str, Tuple[int, int, float]]] = {c.name: {} for c in classes}
+        # class name -> [bytes, files], the running totals of _files
+        self._usage: Dict[str, List[int]] = {c.name: [0, 0] for c in classes}
+        self._evicted: Dict[str, List[int]] = {c.name: [0, 0] for c in classes}
+        self._scanned_at = 0.0
+
+    def start(self, shutdown_event: threading.Event):
+        """ Rescans every class, then enforces on a background thread. """
+        worker = threading.Thread(target=self._enforce_loop, args=(shutdown_event,), daemon=True)
+        worker.start()
+        return worker
+
+    def _class_of(self, path: str) -> Optional[StorageClass]:
+        path = os.path.abspath(path)
+        for c in self.classes.values():
+            root = os.path.abspath(c.root)
+            if path.startswith(root + os.sep):
+                return c
+        return None
+
+    def touch(self, path: str):
+        """ Marks a file as just used, moving it to the back of the eviction order. """
+        with self._lock:
+            self._touched[os.path.abspath(path)] = time.time()
+
+    def record(self, path: str):
+        """
+        Accounts for a file just written, rewritten or deleted: its current
+        size replaces what was known, and a path that no longer exists is
+        forgotten. Wakes enforcement if its class went over budget.
+        """
+        c = self._class_of(path)
+        if c is None or path.endswith(".tmp"):
+            return
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._forget(c, path)
+            return
+        with self._lock:
+            self._set(c, path, (st.st_size, st.st_nlink, st.st_mtime))
+            over = c.budget_bytes and self._usage[c.name][0] > c.budget_bytes
+        if over:
+            self._wake.set()
+
+    def _set(self, c: StorageClass, path: str, entry: Optional[Tuple[int, int, float]]):
+        """ Replaces (or with None, drops) a file's index entry and adjusts its class totals; caller holds _lock. """
+        files, usage = self._files[c.name], self._usage[c.name]
+        old = files.pop(path, None)
+        if old is not None:
+            usage[0] -= old[0]
+            usage[1] -= 1
+        if entry is not None:
+            files[path] = entry
+            usage[0] += entry[0]
+            usage[1] += 1
+        else:
+            self._touched.pop(path, None)
+
+    def _forget(self, c: StorageClass, path: str):
+        with self._lock:
+            self._set(c, path, None)
+
+    def free_bytes(self) -> int:
+        try:
+            return shutil.disk_usage(next(iter(self.classes.values())).root).free
+        except (OSError, StopIteration):
+            return -1
+
+    def ensure_free(self, nbytes: int = 0) -> bool:
+        """ Cheap check before a write: evicts now only if free space is below min_free_bytes + nbytes. """
+        free = self.free_bytes()
+        if free < 0 or free >= self.min_free_bytes + nbytes:
+            return True
+        self.enforce(extra_free=nbytes)
+        return self._has_free(nbytes)
+
+    def make_room(self, nbytes: int = 0) -> bool:
+        """
+        For when a write has just failed: rescans (the index may be missing
+        files), then enforces budgets and frees at least min_free_bytes +
+        nbytes if possible; True if that much is free.
+        """
+        self.rescan()
+        self.enforce(extra_free=nbytes)
+        return self._has_free(nbytes)
+
+    def _has_free(self, nbytes: int) -> bool:
+        free = self.free_bytes()
+        return free < 0 or free >= self.min_free_bytes + nbytes
+
+    def _enforce_loop(self, shutdown_event: threading.Event):
+        try:
+            self.rescan()
+        except Exception as e:
+            print(f"[Storage] Rescan error: {e}")
+        while not shutdown_event.is_set():
+            try:
+                self.enforce()
+            except Exception as e:
+                print(f"[Storage] Enforcement error: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def rescan(self):
+        """ Rebuilds the index by walking and stat'ing every file under every class root. """
+        with self._enforce_lock:
+            for c in self.classes.values():
+                files = {}
+                for dirpath, _dirnames, filenames in os.walk(c.root):
+                    for filename in filenames:
+                        if filename.endswith(".tmp"):
+                            continue  # Being written (derivatives, downloads)
+                        path = os.path.abspath(os.path.join(dirpath, filename))
+                        try:
+                            st = os.stat(path)
+                        except OSError:
+                            continue
+                        files[path] = (st.st_size, st.st_nlink, st.st_mtime)
+                with self._lock:
+                    self._files[c.name] = files
+                    self._usage[c.name] = [sum(f[0] for f in files.values()), len(files)]
+            with self._lock:
+                self._touched = {p: t for p, t in self._touched.items()
+                                 if any(p in files for files in self._files.values())}
+            self._scanned_at = time.time()
+
+    def _candidates(self, c: StorageClass) -> List[Tuple[float, int, int, str]]:
+        """ (last used, size, link count, path) of every indexed file of the class, oldest first. """
+        with self._lock:
+            files = [(max(mtime, self._touched.get(path, 0.0)), size, nlink, path)
+                     for path, (size, nlink, mtime) in self._files[c.name].items()]
+        files.sort()
+        return files
+
+    def _evict(self, c: StorageClass, path: str, size: int) -> Optional[bool]:
+        """ Deletes a file; None if it has to stay, else whether the deletion freed disk (not if it was already gone). """
+        try:
+            os.remove(path)
+            freed = True
+        except FileNotFoundError:
+            # Deleted behind our back: only the index was out of date
+            freed = False
+        except OSError as e:
+            # Open elsewhere (Windows)
+            print(f"[Storage] Could not evict {path}: {e}")
+            return None
+        with self._lock:
+            self._set(c, path, None)
+            if freed:
+                self._evicted[c.name][0] += size
+                self._evicted[c.name][1] += 1
+        if self.on_evict is not None:
+            try:
+                self.on_evict(path, c.name)
+            except Exception as e:
+                print(f"[Storage] on_evict failed for {path}: {e}")
+        return freed
+
+    def _drain(self, c: StorageClass, candidates: List[Tuple[float, int, int, str]], target: int,
+               freeing: bool, pinned: Set[str]) -> int:
+        """
+        Evicts the class's oldest allowed files (candidates is sorted oldest
+        first) until `target` bytes are gone, dropping them from candidates;
+        returns the bytes removed. When `freeing`, only bytes actually
+        released count: hardlinked files and files that were already gone
+        count as 0.
+        """
+        removed = 0
+        kept = []
+        for i, (used, size, nlink, path) in enumerate(candidates):
+            if removed >= target:
+                kept.extend(candidates[i:])
+                break
+            try:
+                allowed = path not in pinned and c.evictable(path)
+            except Exception as e:
+                print(f"[Storage] Cannot decide on {path}: {e}")
+                allowed = False
+            freed = self._evict(c, path, size) if allowed else None
+            if freed is None:
+                kept.append((used, size, nlink, path))
+            elif not freeing or (freed and nlink <= 1):
+                removed += size
+        candidates[:] = kept
+        return removed
+
+    def enforce(self, extra_free: int = 0) -> int:
+        """ One pass over every class, from the index; returns the number of bytes evicted. """
+        with self._enforce_lock:
+            try:
+                pinned = self.pinned() if self.pinned is not None else set()
+            except Exception as e:
+                # Without knowing what is pinned, nothing may go this pass
+                print(f"[Storage] Cannot read pinned files, skipping eviction: {e}")
+                return 0
+
+            candidates = {c.name: self._candidates(c) for c in self.classes.values()}
+            evicted_before = self._evicted_bytes()
+            for c in self.classes.values():
+                usage = self.usage(c.name)
+                if c.evictable is None or not c.budget_bytes or usage <= c.budget_bytes:
+                    continue
+                removed = self._drain(c, candidates[c.name], usage - c.budget_bytes, freeing=False, pinned=pinned)
+                if usage - removed > c.budget_bytes:
+                    print(f"[Storage] {c.name} is {(usage - removed) / MB:.0f} MB, over its {c.budget_bytes / MB:.0f} MB "
+                          f"budget, with nothing left that may be evicted.")
+
+            free = self.free_bytes()
+            need = self.min_free_bytes + extra_free - free if free >= 0 else 0
+            if need > 0:
+                for c in sorted(self.classes.values(), key=lambda c: c.priority):
+                    if need <= 0:
+                        break
+                    if c.evictable is not None:
+                        need -= self._drain(c, candidates[c.name], need, freeing=True, pinned=pinned)
+                if need > 0:
+                    print(f"[Storage] Disk nearly full: {max(0, free) / MB:.0f} MB free and nothing left that may be evicted.")
+
+            # Files that were already gone moved the totals but freed nothing
+            evicted = self._evicted_bytes() - evicted_before
+            if evicted:
+                print(f"[Storage] Evicted {evicted / MB:.1f} MB.")
+            return evicted
+
+    def _evicted_bytes(self) -> int:
+        with self._lock:
+            return sum(bytes_files[0] for bytes_files in self._evicted.values())
+
+    def usage(self, name: str) -> int:
+        with self._lock:
+            return self._usage[name][0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            classes = {
+                name: {
+                    "bytes": self._usage[name][0],
+                    "files": self._usage[name][1],
+                    "budget_bytes": c.budget_bytes or None,
+                    "evictable": c.evictable is not None,
+                    "evicted_bytes": self._evicted[name][0],
+                    "evicted_files": self._evicted[name][1],
+                }
+                for name, c in self.classes.items()
+            }
+        return {
+            "classes": classes,
+            "free_bytes": self.free_bytes(),
+            "min_free_bytes": self.min_free_bytes,
+            "scanned_at": self._scanned_at,
+        }
@@ -1,41 +1,153 @@
 import os
+import time
 import shutil
+import mimetypes
 import threading
 import traceback
+import urllib.error
+import urllib.request
+from collections import deque
 from queue import Queue, Empty
+from typing import Callable, Optional
 from supabase import create_client, Client
+from retry_scheduler import RetryItem, RetryScheduler
+import metrics
+
+# Not in every platform's mime table (e.g. older Windows registries)
+mimetypes.add_type("image/webp", ".webp")
+
+UPLOAD_SECONDS = metrics.histogram("booth_upload_seconds", "Storage upload latency per file")
+UPLOADS = metrics.counter("booth_uploads_total", "Files uploaded to storage")
+UPLOAD_FAILURES = metrics.counter("booth_upload_failures_total", "Failed storage uploads (each retry attempt counts)")
+UPLOAD_BYTES = metrics.counter("booth_upload_bytes_total", "Bytes uploaded to storage")
+INSERT_SECONDS = metrics.histogram("booth_insert_batch_seconds", "Batched photos-table insert latency")
+INSERT_FAILURES = metrics.counter("booth_insert_batch_failures_total", "Failed batched photos-table inserts")
+RETRY_BACKLOG = metrics.gauge("booth_upload_retry_backlog", "Files waiting in the offline retry scheduler")
 
 class SupabaseManager:
-    def __init__(self, url: str, key: str, upload_queue: Queue, shutdown_event: threading.Event, retry_dir: str = "storage/retry_queue"):
-        self.supabase: Client = create_client(url, key)
+    """
+    Uploads captures to Supabase storage and records them in the photos table.
+
+    Several worker threads drain upload_queue concurrently over the client's
+    shared HTTP session. Table rows are not inserted per photo: they collect
+    in a buffer and a flusher inserts them in batches. When a batch is
+    rejected while the project is reachable, its rows are retried one by
+    one so a single bad row can't hold up the rest; a row that fails
+    `max_insert_attempts` such flushes is dead-lettered (its job is buried
+    in the journal and the file marked failed in the index). While offline,
+    rows are simply kept for the next flush. A file is only marked uploaded
+    once its row exists.
+
+    Retention runs on a background thread against a locally tracked row
+    count: it is triggered once the count passes max_images + retention_slack
+    (or max_images is lowered) and resyncs with the server every
+    retention_interval seconds. Excess rows go in one bulk delete.
+
+    Failed uploads go to a RetryScheduler that keeps retrying them in the
+    background (see retry_scheduler.py) while fresh photos take priority.
+    With a journaled upload_queue (job_journal.JournaledQueue) a job is only
+    acknowledged once its row is inserted, and a failed job stays in the
+    journal as deferred instead of its file being copied into retry_dir.
+
+    `client` and `health_check` can be injected, e.g. a local fake storage
+    and table client in tests. With a photo_index (photo_index.PhotoIndex)
+    each upload's outcome and public URL are recorded against the file.
+    """
+    def __init__(self, url: str, key: str, upload_queue: Queue, shutdown_event: threading.Event, retry_dir: str = "storage/retry_queue",
+                 upload_workers: int = 3, insert_batch_size: int = 10, insert_interval: float = 2.0,
+                 retention_slack: int = 10, retention_interval: float = 300.0, retry_concurrency: int = 2,
+                 max_insert_attempts: int = 3, client: Optional[Client] = None, health_check: Optional[Callable[[], bool]] = None, photo_index=None,
+                 on_retry_copy: Optional[Callable[[str], None]] = None):
+        self.supabase: Client = client or create_client(url, key)
+        self.url = url
         self.upload_queue = upload_queue
         self.shutdown_event = shutdown_event
         self.retry_dir = retry_dir
         self.bucket = "magic-photos"
         self.table = "photos"
         self.max_images = 600
+        self.upload_workers = upload_workers
+        self.insert_batch_size = insert_batch_size
+        self.insert_interval = insert_interval
+        self.retention_slack = retention_slack
+        self.retention_interval = retention_interval
+        self.max_insert_attempts = max_insert_attempts
+        self.photo_index = photo_index
+        self.on_retry_copy = on_retry_copy
+        self.health_check = health_check or self._default_health_check
+        
+        # One bucket proxy for all workers so they share the storage session
+        self._storage = self.supabase.storage.from_(self.bucket)
+        
+        self._rows_lock = threading.Lock()
+        # (row, job, file path, failed insert attempts)
+        self._pending_rows = []
+        self._rows_ready = threading.Event()
+        
+        # Row count as far as we know; None until the first server sync
+        self._known_count = None
+        self._retention_wake = threading.Event()
+        
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._uploaded = 0
+        self._failed = 0
+        self._bytes_uploaded = 0
+        self._recent_uploads = deque()
+        
+        self.retry_scheduler = RetryScheduler(
+            self._retry_upload,
+            health_check=self.health_check,
+            is_busy=lambda: self.upload_queue.qsize() > 0,
+            concurrency=retry_concurrency
+        )
+        RETRY_BACKLOG.set_function(lambda: self.retry_scheduler.stats()["backlog"])
         
         os.makedirs(self.retry_dir, exist_ok=True)
         
     def start_worker(self):
-        worker = threading.Thread(target=self._worker_loop, daemon=True)
-        worker.start()
-        return worker
-        
-    def _worker_loop(self):
-        # First try to upload any offline queued files
         self._process_retry_queue()
+        threads = [threading.Thread(target=self._worker_loop, daemon=True) for _ in range(self.upload_workers)]
+        threads.append(threading.Thread(target=self._flush_loop, daemon=True))
+        threads.append(threading.Thread(target=self._retention_loop, daemon=True))
+        for t in threads:
+            t.start()
+        threads.append(self.retry_scheduler.start(self.shutdown_event))
+        return threads
         
+    def stats(self) -> dict:
+        with self._stats_lock:
+            cutoff = time.time() - 60
+            while self._recent_uploads and self._recent_uploads[0] < cutoff:
+                self._recent_uploads.popleft()
+            return {
+                "queue_depth": self.upload_queue.qsize(),
+                "in_flight": self._in_flight,
+                "pending_rows": len(self._pending_rows),
+                "uploaded": self._uploaded,
+                "failed": self._failed,
+                "bytes_uploaded": self._bytes_uploaded,
+                "uploads_per_min": len(self._recent_uploads),
+                "known_rows": self._known_count,
+                "retry": self.retry_scheduler.stats(),
+            }
+        
+    def _worker_loop(self):
         while not self.shutdown_event.is_set():
             try:
                 # Wait for items with timeout to allow checking shutdown_event
                 job = self.upload_queue.get(timeout=1.0)
                 file_path = job.get("file_path")
                 
-                if file_path and os.path.exists(file_path):
-                    success = self._upload_file(file_path)
+                if file_path and os.path.exists(file_path) and job.get("attempts"):
+                    # Replayed job that already failed before: it waits behind fresh photos
+                    self.retry_scheduler.add(file_path, job, attempts=job["attempts"], created_at=os.path.getmtime(file_path))
+                elif file_path and os.path.exists(file_path):
+                    success = self._upload_file(file_path, job)
                     if not success:
-                        self._move_to_retry(file_path)
+                        self._schedule_retry(job, file_path)
+                else:
+                    self._ack(job)  # Nothing left to upload
                 
                 self.upload_queue.task_done()
             except Empty:
@@ -43,43 +155,195 @@ class SupabaseManager:
             except Exception as e:
                 print(f"[Supabase] Worker error: {e}")
                     
-    def _upload_file(self, file_path: str) -> bool:
+    def _ack(self, job):
+        if job is not None and hasattr(self.upload_queue, "ack"):
+            self.upload_queue.ack(job)
+            
+    def _schedule_retry(self, job, file_path):
+        if hasattr(self.upload_queue, "defer"):
+            attempts = self.upload_queue.defer(job, "upload failed")
+            self.retry_scheduler.add(file_path, dict(job, attempts=attempts), attempts=attempts)
+        else:
+            self._move_to_retry(file_path)
+            
+    def _retry_upload(self, item: RetryItem) -> bool:
+        if not os.path.exists(item.file_path):
+            self._ack(item.job)
+            return True
+        if not self._upload_file(item.file_path, item.job):
+            if item.job is not None and hasattr(self.upload_queue, "defer"):
+                self.upload_queue.defer(item.job, "retry failed")
+            return False
+        return True  # A retry_dir copy is removed once its row is in (_inserted)
+            
+    def _default_health_check(self) -> bool:
+        # Any HTTP answer from the project, even an error status, means we are online
+        try:
+            urllib.request.urlopen(self.url.rstrip("/") + "/storage/v1/", timeout=3)
+        except urllib.error.HTTPError:
+            return True
+        except Exception:
+            return False
+        return True
+                    
+    def _upload_file(self, file_path: str, job=None) -> bool:
+        with self._stats_lock:
+            self._in_flight += 1
         try:
             filename = os.path.basename(file_path)
+            size = os.path.getsize(file_path)
+            started = time.perf_counter()
+            content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
             
             # Upload to bucket
             with open(file_path, "rb") as f:
-                res = self.supabase.storage.from_(self.bucket).upload(
+                res = self._storage.upload(
                     path=filename,
                     file=f,
-                    file_options={"content-type": "image/jpeg", "upsert": "true"}
+                    file_options={"content-type": content_type, "upsert": "true"}
                 )
             
-            # Get public URL
-            public_url = self.supabase.storage.from_(self.bucket).get_public_url(filename)
+            # Public URL is built locally, no round trip
+            public_url = self._storage.get_public_url(filename)
             
-            # Insert to DB
-            self.supabase.table(self.table).insert({
-                "filename": filename,
-                "url": public_url
-            }).execute()
+            # Row goes into the next batched insert; the index says "uploaded" once it's in
+            with self._rows_lock:
+                self._pending_rows.append(({
+                    "filename": filename,
+                    "url": public_url
+                }, job, file_path, 0))
+                if len(self._pending_rows) >= self.insert_batch_size:
+                    self._rows_ready.set()
             
-            # Enforce limit
-            self._enforce_limit()
+            UPLOAD_SECONDS.observe(time.perf_counter() - started)
+            UPLOADS.inc()
+            UPLOAD_BYTES.inc(size)
+            with self._stats_lock:
+                self._uploaded += 1
+                self._bytes_uploaded += size
+                self._recent_uploads.append(time.time())
             return True
             
         except Exception as e:
             print(f"[Supabase] Upload failed: {e}")
+            UPLOAD_FAILURES.inc()
+            if self.photo_index is not None:
+                self.photo_index.set_upload(file_path, "failed")
+            with self._stats_lock:
+                self._failed += 1
             return False
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+            
+    def _flush_loop(self):
+        while not self.shutdown_event.is_set():
+            self._rows_ready.wait(timeout=self.insert_interval)
+            self._flush_rows()
+        self._flush_rows()
+        
+    def _flush_rows(self):
+        with self._rows_lock:
+            rows = self._pending_rows
+            self._pending_rows = []
+            self._rows_ready.clear()
+        if not rows:
+            return
+        try:
+            with INSERT_SECONDS.time():
+                self.supabase.table(self.table).insert([entry[0] for entry in rows]).execute()
+            self._inserted(rows)
+            return
+        except Exception as e:
+            print(f"[Supabase] Batch insert of {len(rows)} rows failed: {e}")
+            INSERT_FAILURES.inc()
+        
+        # Files are already in the bucket; their rows wait for the next flush
+        if not self.health_check():
+            self._requeue_rows(rows)
+            return
+        # Reachable, so something in the batch was rejected: find out which rows
+        kept = []
+        for row, job, file_path, failures in rows:
+            try:
+                self.supabase.table(self.table).insert([row]).execute()
+                self._inserted([(row, job, file_path, failures)])
+            except Exception as e:
+                failures += 1
+                if failures >= self.max_insert_attempts:
+                    self._dead_letter(row, job, file_path, f"insert failed {failures} times: {e}")
+                else:
+                    kept.append((row, job, file_path, failures))
+        self._requeue_rows(kept)
+        
+    def _inserted(self, rows):
+        for row, job, file_path, _ in rows:
+            if self.photo_index is not None:
+                self.photo_index.set_upload(file_path, "uploaded", row["url"])
+            self._ack(job)
+            if job is None and self._in_retry_dir(file_path):
+                self._remove_retry_copy(file_path)
+        with self._rows_lock:
+            if self._known_count is not None:
+                self._known_count += len(rows)
+                if self._known_count > self.max_images + self.retention_slack:
+                    self._retention_wake.set()
+                    
+    def _in_retry_dir(self, file_path: str) -> bool:
+        return os.path.dirname(os.path.abspath(file_path)) == os.path.abspath(self.retry_dir)
+        
+    def _remove_retry_copy(self, file_path: str):
+        try:
+            os.remove(file_path)
+        except OSError as e:
+            print(f"[Supabase] Could not remove retry copy {file_path}: {e}")
+            return
+        if self.on_retry_copy is not None:
+            self.on_retry_copy(file_path)
+            
+    def _requeue_rows(self, rows):
+        if rows:
+            with self._rows_lock:
+                self._pending_rows = rows + self._pending_rows
+                
+    def _dead_letter(self, row, job, file_path, error: str):
+        print(f"[Supabase] Giving up on the row for {row['filename']}: {error}")
+        if self.photo_index is not None:
+            self.photo_index.set_upload(file_path, "failed")
+        if job is not None and hasattr(self.upload_queue, "dead_letter"):
+            self.upload_queue.dead_letter(job, error)
+            
+    def set_max_images(self, max_images: int):
+        self.max_images = max_images
+        self._retention_wake.set()
+            
+    def _retention_loop(self):
+        self._sync_count()
+        while not self.shutdown_event.is_set():
+            triggered = self._retention_wake.wait(timeout=self.retention_interval)
+            self._retention_wake.clear()
+            if self.shutdown_event.is_set():
+                break
+            if not triggered:
+                # Periodic resync catches rows added or removed by anyone else
+                self._sync_count()
+            self._enforce_limit()
+            
+    def _sync_count(self):
+        try:
+            count_res = self.supabase.table(self.table).select('id', count='exact', head=True).execute()
+            with self._rows_lock:
+                self._known_count = count_res.count or 0
+        except Exception as e:
+            print(f"[Supabase] Count sync error: {e}")
             
     def _process_retry_queue(self):
+        # Files left by older runs; the scheduler keeps retrying them from here on
         try:
             for filename in os.listdir(self.retry_dir):
                 file_path = os.path.join(self.retry_dir, filename)
                 if os.path.isfile(file_path):
-                    print(f"[Supabase] Retrying offline file: {filename}")
-                    if self._upload_file(file_path):
-                        os.remove(file_path) # cleanup after success
+                    self.retry_scheduler.add(file_path, created_at=os.path.getmtime(file_path))
         except Exception as e:
             print(f"[Supabase] Retry queue error: {e}")
             
@@ -88,33 +352,36 @@ class SupabaseManager:
             filename = os.path.basename(file_path)
             dest = os.path.join(self.retry_dir, filename)
             shutil.copy2(file_path, dest)
+            if self.on_retry_copy is not None:
+                self.on_retry_copy(dest)
+            self.retry_scheduler.add(dest)
             print(f"[Supabase] Moved {filename} to offline retry queue.")
         except Exception as e:
             print(f"[Supabase] Failed to move offline: {e}")
             
     def _enforce_limit(self):
+        with self._rows_lock:
+            total_count = self._known_count
+        if total_count is None or total_count <= self.max_images:
+            return
         try:
-            # Check count
-            count_res = self.supabase.table(self.table).select('id', count='exact').execute()
-            total_count = count_res.count
+            excess = total_count - self.max_images
             
-            if total_count and total_count > self.max_images:
-                excess = total_count - self.max_images
+            # Get oldest
+            oldest_res = self.supabase.table(self.table).select('id, filename').order('created_at', desc=False).limit(excess).execute()
+            
+            if oldest_res.data:
+                ids_to_delete = [item['id'] for item in oldest_res.data]
+                filenames_to_delete = [item['filename'] for item in oldest_res.data]
                 
-                # Get oldest
-                oldest_res = self.supabase.table(self.table).select('id, filename').order('created_at', desc=False).limit(excess).execute()
+                # One bucket call and one table call, whatever the excess
+                self._storage.remove(filenames_to_delete)
+                self.supabase.table(self.table).delete().in_('id', ids_to_delete).execute()
                 
-                if oldest_res.data:
-                    ids_to_delete = [item['id'] for item in oldest_res.data]
-                    filenames_to_delete = [item['filename'] for item in oldest_res.data]
-                    
-                    # Delete from bucket
-                    self.supabase.storage.from_(self.bucket).remove(filenames_to_delete)
-                    
-                    # Delete from DB
-                    for row_id in ids_to_delete:
-                        self.supabase.table(self.table).delete().eq('id', row_id).execute()
-                        
-                    print(f"[Supabase] Cleaned {excess} old images.")
+                with self._rows_lock:
+                    self._known_count -= len(ids_to_delete)
+                print(f"[Supabase] Cleaned {len(ids_to_delete)} old images.")
         except Exception as e:
             print(f"[Supabase] Cleanup error: {e}")
+            # Our count may be off after a partial failure; resync on the next pass
+            self._sync_count()
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from benchmark_filters import synthetic_frame
+from filters import CompiledFilter, FilterQuality, FilterType, apply_filter_reference
+from shared.noise import set_noise_seed
+
+# Largest per-channel difference from the reference, as documented on FilterQuality
+TOLERANCE = {
+    FilterQuality.FULL: 1,
+    FilterQuality.BALANCED: 4,
+    FilterQuality.FAST: 8,
+}
+SEED = 7
+
+@pytest.fixture(scope="module")
+def frame():
+    return synthetic_frame(320, 240, seed=0)
+
+@pytest.mark.parametrize("quality", list(FilterQuality), ids=lambda q: q.name)
+@pytest.mark.parametrize("filter_type", list(FilterType), ids=lambda f: f.name)
+def test_compiled_matches_reference(frame, filter_type, quality):
+    set_noise_seed(SEED)
+    expected = apply_filter_reference(frame.copy(), filter_type)
+    set_noise_seed(SEED)
+    actual = CompiledFilter(filter_type, frame.shape, quality)(frame.copy())
+
+    assert actual.shape == expected.shape
+    assert actual.dtype == np.uint8
+    diff = np.abs(actual.astype(np.int16) - expected.astype(np.int16))
+    assert diff.max() <= TOLERANCE[quality], f"max difference {diff.max()}"
@@ -0,0 +1,74 @@
+from job_journal import JobJournal, JournaledQueue, backoff_delay
+
+def test_ack_deletes_the_job(tmp_path):
+    journal = JobJournal(str(tmp_path / "jobs.db"))
+    job_id = journal.enqueue("upload", {"file_path": "a.jpg"})
+    assert journal.counts("upload") == {"queued": 1}
+    journal.ack(job_id)
+    assert journal.counts("upload") == {}
+
+def test_failed_job_waits_out_its_delay_then_is_claimed(tmp_path):
+    journal = JobJournal(str(tmp_path / "jobs.db"))
+    job_id = journal.enqueue("print", {"file_path": "a.jpg"})
+    assert journal.fail(job_id, "printer offline", delay=60.0) == (1, "waiting")
+    assert journal.claim_due("print") == []
+
+    journal.fail(job_id, "printer offline", delay=0.0)
+    assert journal.claim_due("print") == [(job_id, {"file_path": "a.jpg"}, 2)]
+    assert journal.counts("print") == {"queued": 1}
+
+def test_job_dies_after_max_attempts_and_no_longer_pins_its_file(tmp_path):
+    journal = JobJournal(str(tmp_path / "jobs.db"))
+    job_id = journal.enqueue("upload", {"file_path": str(tmp_path / "a.jpg")})
+    assert journal.pending_files("upload") == {str(tmp_path / "a.jpg")}
+    assert journal.fail(job_id, "boom", delay=0.0, max_attempts=2) == (1, "waiting")
+    assert journal.fail(job_id, "boom", delay=0.0, max_attempts=2) == (2, "dead")
+    assert journal.claim_due("upload") == []
+    assert journal.pending_files("upload") == set()
+
+def test_deferred_and_buried_jobs(tmp_path):
+    journal = JobJournal(str(tmp_path / "jobs.db"))
+    deferred = journal.enqueue("upload", {"file_path": "a.jpg"})
+    buried = journal.enqueue("upload", {"file_path": "b.jpg"})
+    assert journal.defer(deferred, "offline") == 1
+    journal.bury(buried, "rejected")
+    assert journal.counts("upload") == {"deferred": 1, "dead": 1}
+    # Deferred retries belong to the caller: the journal never hands them out itself
+    assert journal.claim_due("upload") == []
+
+def test_unfinished_jobs_are_replayed_after_a_crash(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    journal = JobJournal(path)
+    queue = JournaledQueue("upload", journal)
+    queue.put({"file_path": "queued.jpg"})
+    queue.put({"file_path": "deferred.jpg"})
+    queue.put({"file_path": "done.jpg"})
+    queue.put({"file_path": "dead.jpg"})
+    items = [queue.get() for _ in range(4)]
+    queue.defer(items[1], "offline")
+    queue.ack(items[2])
+    queue.dead_letter(items[3], "rejected")
+
+    # The process dies here; the next run opens the same file
+    journal = JobJournal(path)
+    assert journal.recover("upload") == 2
+    replayed = sorted(payload["file_path"] for _, payload, _ in journal.claim_due("upload"))
+    assert replayed == ["deferred.jpg", "queued.jpg"]
+    assert journal.counts("upload") == {"queued": 2, "dead": 1}
+
+def test_queues_are_independent(tmp_path):
+    journal = JobJournal(str(tmp_path / "jobs.db"))
+    journal.enqueue("upload", {"file_path": "a.jpg"})
+    assert journal.recover("print") == 0
+    assert journal.counts("print") == {}
+
+def test_retry_schedules_with_backoff(tmp_path):
+    journal = JobJournal(str(tmp_path / "jobs.db"))
+    queue = JournaledQueue("print", journal, backoff_base=30.0)
+    queue.put({"file_path": "a.jpg"})
+    queue.retry(queue.get(), "jammed")
+    assert journal.counts("print") == {"waiting": 1}
+    assert journal.claim_due("print") == []
+
+def test_backoff_delay_doubles_up_to_the_cap():
+    assert [backoff_delay(n, base=5.0, cap=30.0) for n in range(1, 6)] == [5.0, 10.0, 20.0, 30.0, 30.0]
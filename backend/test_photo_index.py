@@ -0,0 +1,99 @@
+import os
+import datetime
+
+import pytest
+
+from shared.photo_index import PhotoIndex, encode_cursor, guess_metadata, parse_cursor
+
+def _write(path, data=b"jpeg"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+@pytest.fixture
+def index(tmp_path):
+    return PhotoIndex(str(tmp_path / "photos.db"))
+
+def _fill(index, tmp_path, taken_at):
+    paths = []
+    for i, t in enumerate(taken_at):
+        path = _write(str(tmp_path / "backup" / f"magic_{i}.jpg"))
+        index.add(path, mode="single", taken_at=t)
+        paths.append(os.path.abspath(path))
+    return paths
+
+def test_pages_walk_every_photo_once_newest_first(index, tmp_path):
+    # Ties on taken_at are broken by id, so no page boundary skips or repeats a photo
+    taken_at = [1_760_000_000 + t for t in (5, 1, 3, 3, 3, 2, 4, 3, 0, 1)]
+    paths = _fill(index, tmp_path, taken_at)
+
+    seen, cursor = [], None
+    while True:
+        photos, cursor = index.page(limit=3, cursor=cursor)
+        seen += photos
+        if cursor is None:
+            break
+        cursor = parse_cursor(encode_cursor(cursor))
+
+    assert sorted(p["path"] for p in seen) == sorted(paths)
+    keys = [(p["taken_at"], p["id"]) for p in seen]
+    assert keys == sorted(keys, reverse=True)
+
+def test_last_full_page_has_no_next_cursor(index, tmp_path):
+    _fill(index, tmp_path, [1_760_000_000 + t for t in range(4)])
+    photos, cursor = index.page(limit=2)
+    photos, cursor = index.page(limit=2, cursor=cursor)
+    assert len(photos) == 2
+    assert cursor is None
+
+def test_page_filters_by_day_and_mode(index, tmp_path):
+    day1 = datetime.datetime(2026, 10, 17, 12).timestamp()
+    day2 = datetime.datetime(2026, 10, 18, 12).timestamp()
+    index.add(_write(str(tmp_path / "a.jpg")), mode="single", taken_at=day1)
+    index.add(_write(str(tmp_path / "b.gif")), mode="gif", taken_at=day2)
+    index.add(_write(str(tmp_path / "c.jpg")), mode="single", taken_at=day2 + 1)
+
+    photos, _ = index.page(day="2026-10-18")
+    assert [os.path.basename(p["path"]) for p in photos] == ["c.jpg", "b.gif"]
+    photos, _ = index.page(mode="gif")
+    assert [os.path.basename(p["path"]) for p in photos] == ["b.gif"]
+    assert index.days() == [("2026-10-18", 2), ("2026-10-17", 1)]
+
+def test_re_adding_keeps_statuses(index, tmp_path):
+    path = _write(str(tmp_path / "a.jpg"))
+    index.add(path, mode="single", taken_at=1_760_000_000, upload_status="pending")
+    index.set_upload(path, "uploaded", "https://example.test/a.jpg")
+    index.add(path, mode="single", taken_at=1_760_000_000, upload_status="pending")
+    photo = index.get(path)
+    assert photo["upload_status"] == "uploaded"
+    assert index.by_remote_url("https://example.test/a.jpg")["path"] == os.path.abspath(path)
+
+def test_reconcile_adds_missing_drops_gone_and_keeps_statuses(index, tmp_path):
+    root = tmp_path / "backup"
+    kept = _write(str(root / "2026_10_18" / "magic_1760000000.jpg"))
+    gone = _write(str(root / "2026_10_18" / "magic_1760000001.jpg"))
+    outside = _write(str(tmp_path / "elsewhere" / "magic_1760000002.jpg"))
+    for path in (kept, gone, outside):
+        index.add(path, mode="single")
+    index.set_upload(kept, "uploaded", "https://example.test/kept.jpg")
+    os.remove(gone)
+    os.remove(outside)
+    new = _write(str(root / "2026_10_18" / "magic_20261018_142501_NOIR_burst0.jpg"))
+    _write(str(root / ".derivatives" / "ab" / "abc_thumb.jpg"))
+    _write(str(root / "notes.txt"))
+
+    assert index.reconcile([str(root)]) == {"files": 2, "added": 1, "removed": 1}
+    assert index.get(gone) is None
+    assert index.get(outside) is not None  # Not under a reconciled root
+    assert index.get(kept)["upload_status"] == "uploaded"
+    photo = index.get(new)
+    assert (photo["mode"], photo["filter"]) == ("burst", "NOIR")
+    assert photo["taken_at"] == datetime.datetime(2026, 10, 18, 14, 25, 1).timestamp()
+
+    assert index.reconcile([str(root)]) == {"files": 2, "added": 0, "removed": 0}
+
+def test_guess_metadata_from_names():
+    assert guess_metadata("magic_anim_1760000000.gif") == ("gif", None, 1760000000.0)
+    assert guess_metadata("magic_burst_1760000000.jpg") == ("burst", None, 1760000000.0)
+    assert guess_metadata("holiday.jpg") == ("single", None, None)
@@ -0,0 +1,111 @@
+import io
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from remote_fetch import RemoteFetcher
+
+URL = "https://example.test/photos/a.jpg"
+
+class StubResponse(io.BytesIO):
+    def __init__(self, body, etag=None):
+        super().__init__(body)
+        self.headers = {"ETag": etag} if etag else {}
+
+class StubOpener:
+    """ Stands in for urllib.request.urlopen: serves `body` with `etag`, 304 when the client already has it. """
+    def __init__(self, body=b"jpeg", etag='"v1"'):
+        self.body = body
+        self.etag = etag
+        self.requests = []
+        self.offline = False
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, request, timeout=None):
+        self.requests.append(dict(request.header_items()))
+        self.release.wait(5.0)
+        if self.offline:
+            raise urllib.error.URLError("unreachable")
+        if self.etag and request.get_header("If-none-match") == self.etag:
+            raise urllib.error.HTTPError(request.full_url, 304, "Not Modified", {}, None)
+        return StubResponse(self.body, self.etag)
+
+@pytest.fixture
+def opener(monkeypatch):
+    stub = StubOpener()
+    monkeypatch.setattr(urllib.request, "urlopen", stub)
+    return stub
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def test_concurrent_fetches_share_one_download(tmp_path, opener):
+    fetcher = RemoteFetcher(str(tmp_path), workers=4)
+    opener.release.clear()
+    futures = [fetcher.fetch(URL) for _ in range(5)]
+    assert all(future is futures[0] for future in futures)
+    opener.release.set()
+
+    path, source = futures[0].result(timeout=5.0)
+    assert source == "downloaded"
+    assert _read(path) == b"jpeg"
+    assert len(opener.requests) == 1
+    fetcher.shutdown()
+
+def test_fresh_copy_is_used_without_the_network(tmp_path, opener):
+    fetcher = RemoteFetcher(str(tmp_path), fresh_for=3600.0)
+    fetcher.fetch(URL).result(timeout=5.0)
+    future = fetcher.fetch(URL)
+    assert future.done()
+    assert future.result()[1] == "cached"
+    assert len(opener.requests) == 1
+    fetcher.shutdown()
+
+def test_stale_copy_is_revalidated_with_its_etag(tmp_path, opener):
+    fetcher = RemoteFetcher(str(tmp_path), fresh_for=0.0)
+    path, _ = fetcher.fetch(URL).result(timeout=5.0)
+    opener.body = b"changed"  # Would be served if the 304 were ignored
+
+    assert fetcher.fetch(URL).result(timeout=5.0) == (path, "revalidated")
+    assert opener.requests[1]["If-none-match"] == '"v1"'
+    assert _read(path) == b"jpeg"
+
+    # Validators survive a restart through the sidecar file
+    restarted = RemoteFetcher(str(tmp_path), fresh_for=0.0)
+    assert restarted.fetch(URL).result(timeout=5.0) == (path, "revalidated")
+    assert restarted.stats()["sources"] == {"revalidated": 1}
+    fetcher.shutdown()
+    restarted.shutdown()
+
+def test_changed_image_is_downloaded_again(tmp_path, opener):
+    fetcher = RemoteFetcher(str(tmp_path), fresh_for=0.0)
+    path, _ = fetcher.fetch(URL).result(timeout=5.0)
+    opener.body, opener.etag = b"changed", '"v2"'
+    assert fetcher.fetch(URL).result(timeout=5.0) == (path, "downloaded")
+    assert _read(path) == b"changed"
+    fetcher.shutdown()
+
+def test_offline_uses_the_cached_copy_and_fails_without_one(tmp_path, opener):
+    fetcher = RemoteFetcher(str(tmp_path), fresh_for=0.0)
+    path, _ = fetcher.fetch(URL).result(timeout=5.0)
+    opener.offline = True
+    assert fetcher.fetch(URL).result(timeout=5.0) == (path, "stale")
+    with pytest.raises(urllib.error.URLError):
+        fetcher.fetch("https://example.test/photos/b.jpg").result(timeout=5.0)
+    assert not [name for name in tmp_path.iterdir() if name.suffix == ".tmp"]
+    fetcher.shutdown()
+
+def test_local_captures_and_bad_urls(tmp_path, opener):
+    local = str(tmp_path / "magic_1.jpg")
+    fetcher = RemoteFetcher(str(tmp_path / "cache"), resolve_local=lambda url: local if url == "/photos/magic_1.jpg" else None)
+    assert fetcher.fetch("/photos/magic_1.jpg").result() == (local, "local")
+    with pytest.raises(ValueError):
+        fetcher.fetch("/photos/missing.jpg")
+    with pytest.raises(ValueError):
+        fetcher.fetch("file:///etc/passwd")
+    assert opener.requests == []
+    fetcher.shutdown()
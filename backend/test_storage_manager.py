@@ -0,0 +1,112 @@
+import os
+
+from storage_manager import StorageClass, StorageManager
+
+def _write(path, size, used_at):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    os.utime(path, (used_at, used_at))
+    return os.path.abspath(path)
+
+def _manager(classes, **kwargs):
+    evicted = []
+    manager = StorageManager(classes, on_evict=lambda path, name: evicted.append(os.path.basename(path)), **kwargs)
+    manager.rescan()
+    return manager, evicted
+
+def test_least_recently_used_go_first(tmp_path):
+    root = str(tmp_path / "cache")
+    for i in range(5):
+        _write(os.path.join(root, f"{i}.png"), 100, 1000 + i)
+    manager, evicted = _manager([StorageClass("cache", root, 300, lambda path: True)])
+    manager.touch(os.path.join(root, "0.png"))  # Served just now
+
+    assert manager.enforce() == 200
+    assert evicted == ["1.png", "2.png"]
+    assert sorted(os.listdir(root)) == ["0.png", "3.png", "4.png"]
+    assert manager.stats()["classes"]["cache"]["bytes"] == 300
+
+def test_un_uploaded_originals_and_pinned_files_are_never_evicted(tmp_path):
+    root = str(tmp_path / "originals")
+    uploaded = {_write(os.path.join(root, "uploaded.jpg"), 100, 1003)}
+    _write(os.path.join(root, "pending_old.jpg"), 100, 1000)
+    _write(os.path.join(root, "pending.jpg"), 100, 1001)
+    pinned = _write(os.path.join(root, "pinned.jpg"), 100, 1002)
+    uploaded.add(pinned)
+    manager, evicted = _manager([StorageClass("originals", root, 100, lambda path: path in uploaded)],
+                                pinned=lambda: {pinned})
+
+    manager.enforce()
+    assert evicted == ["uploaded.jpg"]
+    # Still over budget, but nothing else may go
+    assert manager.usage("originals") == 300
+    assert sorted(os.listdir(root)) == ["pending.jpg", "pending_old.jpg", "pinned.jpg"]
+
+def test_nothing_goes_when_pinned_files_cannot_be_read(tmp_path):
+    root = str(tmp_path / "cache")
+    _write(os.path.join(root, "a.png"), 100, 1000)
+
+    def unreadable():
+        raise RuntimeError("journal locked")
+    manager, evicted = _manager([StorageClass("cache", root, 10, lambda path: True)], pinned=unreadable)
+    assert manager.enforce() == 0
+    assert evicted == []
+
+def test_disk_pressure_empties_low_priorities_first(tmp_path):
+    temp, raw = str(tmp_path / "temp"), str(tmp_path / "raw")
+    _write(os.path.join(raw, "old.png"), 100, 1000)
+    _write(os.path.join(temp, "new.jpg"), 100, 2000)
+    manager, evicted = _manager([StorageClass("raw", raw, 0, lambda path: True, priority=2),
+                                           StorageClass("temp", temp, 0, lambda path: True, priority=0)],
+                                min_free_bytes=1000)
+    # Freed space is only seen by free_bytes(), which this test sets
+    free = {"bytes": 950}
+    manager.free_bytes = lambda: free["bytes"]
+    # Temp goes first though raw is older
+    assert not manager.ensure_free()
+    assert evicted == ["new.jpg"]
+
+    free["bytes"] = 850
+    assert not manager.ensure_free()
+    assert evicted == ["new.jpg", "old.png"]
+
+def test_totals_follow_record_without_rescanning(tmp_path):
+    root = str(tmp_path / "cache")
+    manager, _ = _manager([StorageClass("cache", root, 0, lambda path: True)])
+    path = _write(os.path.join(root, "a.png"), 100, 1000)
+    _write(os.path.join(root, "unrecorded.png"), 50, 1000)
+    manager.record(path)
+    manager.record(path)  # Recording twice doesn't count twice
+    assert manager.stats()["classes"]["cache"]["files"] == 1
+    assert manager.usage("cache") == 100
+
+    _write(path, 40, 1000)
+    manager.record(path)
+    assert manager.usage("cache") == 40
+    os.remove(path)
+    manager.record(path)
+    assert manager.usage("cache") == 0
+
+    manager.rescan()
+    assert manager.usage("cache") == 50
+
+def test_file_deleted_behind_its_back_is_dropped_without_counting_as_evicted(tmp_path):
+    root = str(tmp_path / "cache")
+    for i in range(3):
+        _write(os.path.join(root, f"{i}.png"), 100, 1000 + i)
+    manager, evicted = _manager([StorageClass("cache", root, 200, lambda path: True)])
+    os.remove(os.path.join(root, "0.png"))
+
+    assert manager.enforce() == 0
+    assert evicted == ["0.png"]
+    assert manager.usage("cache") == 200
+    assert manager.stats()["classes"]["cache"]["evicted_files"] == 0
+
+def test_measured_classes_are_never_evicted(tmp_path):
+    root = str(tmp_path / "retry")
+    _write(os.path.join(root, "a.jpg"), 100, 1000)
+    manager, evicted = _manager([StorageClass("retry", root)], min_free_bytes=1 << 62)
+    manager.enforce()
+    assert evicted == []
+    assert manager.usage("retry") == 100
@@ -0,0 +1,178 @@
+import os
+import time
+import threading
+
+import pytest
+
+pytest.importorskip("supabase")
+
+from job_journal import JobJournal, JournaledQueue
+from retry_scheduler import RetryItem, RetryScheduler
+from supabase_manager import SupabaseManager
+
+class FakeBucket:
+    def __init__(self):
+        self.files = {}
+        self.fail = False
+
+    def upload(self, path, file, file_options=None):
+        if self.fail:
+            raise ConnectionError("bucket unreachable")
+        self.files[path] = file.read()
+
+    def get_public_url(self, path):
+        return f"https://example.test/{path}"
+
+    def remove(self, paths):
+        for path in paths:
+            self.files.pop(path, None)
+
+class FakeQuery:
+    def __init__(self, client, rows):
+        self.client = client
+        self.rows = rows
+
+    def execute(self):
+        if self.client.offline:
+            raise ConnectionError("table unreachable")
+        if any(row["filename"] in self.client.rejected for row in self.rows):
+            raise ValueError("row rejected")
+        self.client.rows.extend(self.rows)
+        return self
+
+class FakeTable:
+    def __init__(self, client):
+        self.client = client
+
+    def insert(self, rows):
+        return FakeQuery(self.client, rows)
+
+class FakeClient:
+    """ Storage bucket plus photos table, enough for SupabaseManager's upload and insert paths. """
+    def __init__(self):
+        self.bucket = FakeBucket()
+        self.storage = self
+        self.rows = []
+        self.rejected = set()
+        self.offline = False
+
+    def from_(self, name):
+        return self.bucket
+
+    def table(self, name):
+        return FakeTable(self)
+
+class FakeIndex:
+    def __init__(self):
+        self.status = {}
+
+    def set_upload(self, path, status, remote_url=None):
+        self.status[path] = status
+
+@pytest.fixture
+def setup(tmp_path):
+    client = FakeClient()
+    online = {"value": True}
+    journal = JobJournal(str(tmp_path / "jobs.db"))
+    queue = JournaledQueue("upload", journal)
+    index = FakeIndex()
+    manager = SupabaseManager("https://example.test", "key", queue, threading.Event(),
+                              retry_dir=str(tmp_path / "retry"), max_insert_attempts=3, client=client,
+                              health_check=lambda: online["value"], photo_index=index)
+    return manager, client, journal, queue, index, online, tmp_path
+
+def _upload(manager, queue, tmp_path, name):
+    path = str(tmp_path / name)
+    with open(path, "wb") as f:
+        f.write(b"jpeg")
+    queue.put({"file_path": path})
+    assert manager._upload_file(path, queue.get())
+    return path
+
+def test_rejected_row_is_dead_lettered_and_others_inserted(setup):
+    manager, client, journal, queue, index, online, tmp_path = setup
+    good = _upload(manager, queue, tmp_path, "good.jpg")
+    bad = _upload(manager, queue, tmp_path, "bad.jpg")
+    client.rejected.add("bad.jpg")
+    assert index.status == {}  # Not "uploaded" before the row exists
+
+    manager._flush_rows()
+    assert [row["filename"] for row in client.rows] == ["good.jpg"]
+    assert index.status == {good: "uploaded"}
+    assert journal.counts("upload") == {"queued": 1}
+
+    for _ in range(2):
+        manager._flush_rows()
+    assert manager._pending_rows == []
+    assert index.status[bad] == "failed"
+    assert journal.counts("upload") == {"dead": 1}
+
+def test_offline_insert_keeps_rows_without_counting_attempts(setup):
+    manager, client, journal, queue, index, online, tmp_path = setup
+    path = _upload(manager, queue, tmp_path, "a.jpg")
+    client.offline = True
+    online["value"] = False
+    for _ in range(5):
+        manager._flush_rows()
+    assert [(entry[0]["filename"], entry[3]) for entry in manager._pending_rows] == [("a.jpg", 0)]
+
+    client.offline = False
+    online["value"] = True
+    manager._flush_rows()
+    assert index.status[path] == "uploaded"
+    assert journal.counts("upload") == {}
+
+def test_retry_dir_copy_is_kept_until_its_row_is_inserted(setup):
+    manager, client, journal, queue, index, online, tmp_path = setup
+    copy = os.path.join(manager.retry_dir, "old.jpg")
+    with open(copy, "wb") as f:
+        f.write(b"jpeg")
+    client.offline = True
+    assert manager._retry_upload(RetryItem(copy))
+    manager._flush_rows()
+    assert os.path.exists(copy)
+
+    client.offline = False
+    manager._flush_rows()
+    assert not os.path.exists(copy)
+    assert client.bucket.files["old.jpg"] == b"jpeg"
+
+def test_backoff_grows_exponentially_within_jitter_and_caps():
+    scheduler = RetryScheduler(lambda item: True, backoff_base=2.0, backoff_max=30.0, jitter=0.25)
+    for attempts, expected in [(1, 2.0), (2, 4.0), (3, 8.0), (4, 16.0), (10, 30.0)]:
+        for _ in range(20):
+            assert expected * 0.75 <= scheduler._delay(attempts) <= expected * 1.25
+
+def test_failed_attempt_is_rescheduled_with_backoff():
+    scheduler = RetryScheduler(lambda item: False, backoff_base=10.0, jitter=0.0)
+    scheduler.add("a.jpg")
+    item = scheduler._take_due()
+    scheduler._slots.acquire()
+    before = time.time()
+    scheduler._run(item)
+    assert item.attempts == 1
+    assert item.next_attempt_at >= before + 10.0
+    assert scheduler._take_due() is None
+    assert scheduler.stats()["failed_attempts"] == 1
+
+def test_nothing_is_attempted_until_the_health_probe_passes():
+    online = threading.Event()
+    handled = []
+    scheduler = RetryScheduler(lambda item: handled.append(item.file_path) or True,
+                               health_check=online.is_set, probe_interval=0.05)
+    shutdown = threading.Event()
+    scheduler.add("a.jpg")
+    scheduler.add("b.jpg")
+    scheduler.start(shutdown)
+    try:
+        time.sleep(0.3)
+        assert handled == []
+        assert scheduler.stats()["online"] is False
+
+        online.set()
+        deadline = time.time() + 3.0
+        while len(handled) < 2 and time.time() < deadline:
+            time.sleep(0.02)
+        assert sorted(handled) == ["a.jpg", "b.jpg"]
+    finally:
+        shutdown.set()
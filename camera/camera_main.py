@@ -1,13 +1,23 @@
-from flask import Flask, render_template, Response, request, jsonify, send_from_directory
+from flask import Flask, render_template, Response, request, jsonify, send_file, send_from_directory
+from werkzeug.security import safe_join
 from flask_cors import CORS
 import cv2
 import threading
 import time
 import os
+import sys
+import json
+
+# shared/ (modules both apps use) lives in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
 
 from filters import apply_filter
-from capture_modes import init_storage, save_single_photo, create_gif
+from capture_modes import init_storage, save_single_photo, create_animation
 from printer import print_photo
+from preview_stream import PreviewStreamer
+from capture_jobs import CaptureJobRunner
+from shared.derivatives import DerivativeStore
+from shared.photo_index import PhotoIndex, encode_cursor, parse_cursor
 
 app = Flask(__name__, static_folder='../website', static_url_path='')
 CORS(app)
@@ -16,12 +26,27 @@ CORS(app)
 camera = None
 current_filter = "NONE"
 current_mode = "SINGLE" # SINGLE, BURST
-is_capturing = False
 storage_path = "E:\\magic_booth\\photos"
+camera_lock = threading.Lock()
+derivatives = None # thumb/web/print copies of stills, created with the storage folder
+photo_index = None # SQLite index of everything saved to the storage folder
+
+# Live preview is filtered at a reduced size; captures still use full frames
+PREVIEW_SIZE = (int(os.environ.get("PREVIEW_WIDTH", 640)), int(os.environ.get("PREVIEW_HEIGHT", 360)))
+PREVIEW_FPS = float(os.environ.get("PREVIEW_FPS", 15))
+# GIF mode output: gif, webp or mp4, optionally as a forward-backward boomerang.
+# Animations are downscaled to GIF_WIDTH; 0 keeps the camera resolution
+ANIMATION_FORMAT = os.environ.get("ANIMATION_FORMAT", "gif")
+BOOMERANG = os.environ.get("BOOMERANG", "0").lower() in ("1", "true", "yes")
+GIF_WIDTH = int(os.environ.get("GIF_WIDTH", 640)) or None
+# Browser cache lifetime for /photos/<file>?size=... responses (they are also ETagged)
+DERIVATIVE_MAX_AGE = int(os.environ.get("DERIVATIVE_MAX_AGE", 86400))
 
 def init_camera():
-    global camera, storage_path
+    global camera, storage_path, derivatives, photo_index
     storage_path = init_storage("E:\\magic_booth\\photos")
+    photo_index = PhotoIndex(os.path.join(storage_path, "photos.db"))
+    derivatives = DerivativeStore(os.path.join(storage_path, ".derivatives"), on_built=photo_index.set_derivatives).start()
     # Try multiple camera indices if 0 fails
     for i in range(2):
         camera = cv2.VideoCapture(i)
@@ -29,36 +54,21 @@ def init_camera():
             # Set to 720p
             camera.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
             camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+            # Keep the driver queue short so readers get the newest frame
+            camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
             print(f"📸 Camera {i} initialized successfully.")
             return True
     print("❌ Camera initialization failed.")
     return False
 
-def generate_frames():
-    global camera, current_filter, is_capturing
-    
-    while True:
-        if not camera or not camera.isOpened():
-            time.sleep(1)
-            continue
-            
-        success, frame = camera.read()
-        if not success:
-            continue
-            
-        # Flip frame horizontally for mirror effect
-        frame = cv2.flip(frame, 1)
-        
-        # Apply current filter
-        processed_frame = apply_filter(frame, current_filter)
-        
-        # Encode as JPEG
-        ret, buffer = cv2.imencode('.jpg', processed_frame)
-        frame_bytes = buffer.tobytes()
-        
-        # Yield the frame for mjpeg stream
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+def read_camera_frame():
+    """ Serialises access to the shared capture between the preview and captures. """
+    if not camera or not camera.isOpened():
+        return False, None
+    with camera_lock:
+        return camera.read()
+
+preview = PreviewStreamer(read_camera_frame, lambda: current_filter, size=PREVIEW_SIZE, fps=PREVIEW_FPS)
 
 @app.route('/')
 def index():
@@ -71,11 +81,58 @@ def send_assets(path):
 
 @app.route('/photos/<path:path>')
 def send_photos(path):
+    # ?size=thumb|web|print serves a downscaled copy of a still; anything else gets the original
+    size = request.args.get('size')
+    original = safe_join(storage_path, path)
+    if size and derivatives and original and os.path.isfile(original):
+        try:
+            derivative = derivatives.get(original, size)
+        except Exception as e:
+            print(f"⚠️ Derivative failed for {path}: {e}")
+            derivative = None
+        if derivative:
+            file_path, etag = derivative
+            return send_file(file_path, mimetype='image/jpeg', etag=etag, conditional=True, max_age=DERIVATIVE_MAX_AGE)
     return send_from_directory(storage_path, path)
 
+@app.route('/api/gallery')
+def gallery():
+    # Newest first; pass next_cursor back as ?cursor= for the following page
+    if photo_index is None:
+        return jsonify({"status": "error", "message": "Storage not ready."}), 503
+    try:
+        limit = max(1, min(200, int(request.args.get('limit', 50))))
+        cursor = parse_cursor(request.args.get('cursor'))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid limit or cursor"}), 400
+    photos, next_cursor = photo_index.page(limit, cursor, day=request.args.get('day'), mode=request.args.get('mode'))
+    items = []
+    for photo in photos:
+        filename = os.path.relpath(photo["path"], storage_path).replace(os.sep, '/')
+        items.append({
+            "id": photo["id"],
+            "filename": filename,
+            "url": f"/photos/{filename}",
+            "thumb_url": f"/photos/{filename}?size=thumb",
+            "mode": photo["mode"],
+            "filter": photo["filter"],
+            "taken_at": photo["taken_at"],
+            "day": photo["day"],
+            "size_bytes": photo["size_bytes"],
+            "print_status": photo["print_status"],
+        })
+    return jsonify({"status": "success", "photos": items, "next_cursor": encode_cursor(next_cursor)})
+
+@app.route('/api/gallery/days')
+def gallery_days():
+    if photo_index is None:
+        return jsonify({"status": "error", "message": "Storage not ready."}), 503
+    return jsonify({"status": "success", "days": [{"day": d, "count": n} for d, n in photo_index.days()]})
+
 @app.route('/api/video_feed')
 def video_feed():
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    preview.start()
+    return Response(preview.frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/api/set_filter', methods=['POST'])
 def set_filter():
@@ -93,68 +150,128 @@ def set_mode():
     print(f"⚙️ Mode changed to: {current_mode}")
     return jsonify({"status": "success", "mode": current_mode})
 
+def run_capture(job, report):
+    """ Capture work for one job; runs on the job runner thread, never in a request. """
+    if not camera or not camera.isOpened():
+        raise RuntimeError("Camera not ready.")
+
+    if job.mode == "GIF":
+        return run_gif_capture(job, report)
+
+    frames = []
+    if job.mode == "SINGLE":
+        # Clear buffer
+        for _ in range(5):
+            read_camera_frame()
+        count, interval = 1, 0
+    elif job.mode == "BURST":
+        count, interval = 3, 0.5 # Time between bursts
+    else:
+        raise ValueError(f"Unknown mode {job.mode}")
+
+    # Grab raw frames first so filtering does not stretch the frame timing
+    for idx in range(count):
+        success, frame = read_camera_frame()
+        if success:
+            frames.append(cv2.flip(frame, 1))
+        report(progress=0.5 * (idx + 1) / count)
+        if interval and idx < count - 1:
+            time.sleep(interval)
+
+    report(state="processing")
+    processed = []
+    for idx, frame in enumerate(frames):
+        processed.append(apply_filter(frame, job.filter_type))
+        report(progress=0.5 + 0.4 * (idx + 1) / len(frames))
+
+    images = []
+    if job.mode == "BURST":
+        for idx, img in enumerate(processed):
+            filepath, filename = save_single_photo(img, f"{job.filter_type}_burst{idx}", storage_path)
+            photo_index.add(filepath, mode="burst", filter_name=job.filter_type)
+            derivatives.submit(filepath)
+            images.append(filename)
+    else:
+        for img in processed:
+            filepath, filename = save_single_photo(img, job.filter_type, storage_path)
+            photo_index.add(filepath, mode="single", filter_name=job.filter_type)
+            derivatives.submit(filepath)
+            images.append(filename)
+    return images
+
+def run_gif_capture(job, report, count=10, interval=0.1):
+    """
+    Raw frames are grabbed on the interval first, so filter time never
+    stretches the frame spacing. They are then filtered one at a time as
+    the encoder consumes them.
+    """
+    raw = []
+    next_at = time.time()
+    for idx in range(count):
+        success, frame = read_camera_frame()
+        if success:
+            raw.append(cv2.flip(frame, 1))
+        report(progress=0.5 * (idx + 1) / count)
+        next_at += interval
+        if idx < count - 1:
+            time.sleep(max(0.0, next_at - time.time()))
+
+    report(state="processing")
+
+    def frames():
+        for idx, frame in enumerate(raw):
+            yield apply_filter(frame, job.filter_type)
+            report(progress=0.5 + 0.4 * (idx + 1) / len(raw))
+
+    filepath, filename = create_animation(frames(), job.filter_type, storage_path, fmt=ANIMATION_FORMAT,
+                                          max_width=GIF_WIDTH, boomerang_loop=BOOMERANG)
+    if filepath:
+        photo_index.add(filepath, mode="gif", filter_name=job.filter_type)
+    return [filename] if filename else []
+
+capture_jobs = CaptureJobRunner(run_capture)
+
 @app.route('/api/capture', methods=['POST'])
 def capture():
-    global camera, current_filter, current_mode, storage_path, is_capturing
-    
-    if is_capturing or not camera or not camera.isOpened():
-        return jsonify({"status": "error", "message": "Camera busy or not ready."}), 400
-        
-    is_capturing = True
-    images = []
-    
-    try:
-        if current_mode == "SINGLE":
-            # Clear buffer
-            for _ in range(5):
-                camera.read()
-                
-            success, frame = camera.read()
-            if success:
-                frame = cv2.flip(frame, 1)
-                processed = apply_filter(frame, current_filter)
-                filepath, filename = save_single_photo(processed, current_filter, storage_path)
-                images.append(filename)
-                
-        elif current_mode == "BURST":
-            # Take 3 photos
-            frames_to_save = []
-            for _ in range(3):
-                success, frame = camera.read()
-                if success:
-                    frame = cv2.flip(frame, 1)
-                    processed = apply_filter(frame, current_filter)
-                    frames_to_save.append(processed)
-                time.sleep(0.5) # Time between bursts
-                
-            for idx, processed in enumerate(frames_to_save):
-                filepath, filename = save_single_photo(processed, f"{current_filter}_burst{idx}", storage_path)
-                images.append(filename)
-                
-        elif current_mode == "GIF":
-            # Take 10 frames fast
-            frames_to_save = []
-            for _ in range(10):
-                success, frame = camera.read()
-                if success:
-                    frame = cv2.flip(frame, 1)
-                    processed = apply_filter(frame, current_filter)
-                    frames_to_save.append(processed)
-                time.sleep(0.1)
-                
-            filepath, filename = create_gif(frames_to_save, current_filter, storage_path)
-            if filename:
-                images.append(filename)
-            
-    finally:
-        is_capturing = False
-        
-    # Return latest captured photo paths
+    if not camera or not camera.isOpened():
+        return jsonify({"status": "error", "message": "Camera not ready."}), 400
+
+    # Mode and filter are fixed when the guest presses the button
+    job = capture_jobs.submit(current_mode, current_filter)
+    if job is None:
+        return jsonify({"status": "error", "message": "Camera busy."}), 429
+
     return jsonify({
-        "status": "success", 
-        "images": images, 
+        "status": "queued",
+        "job_id": job["job_id"],
+        "status_url": f"/api/capture/{job['job_id']}",
+        "events_url": f"/api/capture/{job['job_id']}/events",
         "folder": storage_path
-    })
+    }), 202
+
+@app.route('/api/capture/<job_id>')
+def capture_status(job_id):
+    job = capture_jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    return jsonify(dict(job, status="success", folder=storage_path))
+
+@app.route('/api/capture/<job_id>/events')
+def capture_events(job_id):
+    if capture_jobs.get(job_id) is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+
+    def stream():
+        version = -1
+        while True:
+            job, version = capture_jobs.wait_for_update(job_id, version)
+            if job is None:
+                return
+            yield f"data: {json.dumps(job)}\n\n"
+            if job["state"] in ("done", "error"):
+                return
+
+    return Response(stream(), mimetype='text/event-stream', headers={"Cache-Control": "no-cache"})
 
 @app.route('/api/print', methods=['POST'])
 def print_file():
@@ -166,6 +283,8 @@ def print_file():
         
     filepath = os.path.join(storage_path, filename)
     success = print_photo(filepath)
+    if photo_index:
+        photo_index.set_print(filepath, "printed" if success else "failed")
     
     if success:
         return jsonify({"status": "success", "message": "Sent to printer"})
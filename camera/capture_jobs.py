@@ -0,0 +1,114 @@
+import itertools
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+
+class CaptureJob:
+    """ One capture request. Fields are only changed under the runner's lock. """
+    def __init__(self, job_id, mode, filter_type):
+        self.id = job_id
+        self.mode = mode
+        self.filter_type = filter_type
+        self.state = "queued" # queued -> capturing -> processing -> done | error
+        self.progress = 0.0
+        self.images = []
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.version = 0
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "mode": self.mode,
+            "filter": self.filter_type,
+            "state": self.state,
+            "progress": round(self.progress, 2),
+            "images": list(self.images),
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+class CaptureJobRunner:
+    """
+    Runs captures one at a time on a background thread.
+
+    submit() returns a job immediately; the request thread never sleeps
+    between frames or waits for filtering and encoding. `capture_fn(job,
+    report)` does the actual work and calls report(state=..., progress=...)
+    as it goes. Clients poll get() or follow wait_for_update() (used for
+    server-sent events). At most `max_pending` jobs wait at once and the
+    last `history` finished jobs are kept for polling.
+    """
+    def __init__(self, capture_fn, max_pending=3, history=50):
+        self.capture_fn = capture_fn
+        self.max_pending = max_pending
+        self.history = history
+
+        self._cond = threading.Condition()
+        self._jobs = OrderedDict()
+        self._pending = deque()
+        self._ids = itertools.count(1)
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run_loop, daemon=True)
+                self._thread.start()
+        return self._thread
+
+    def submit(self, mode, filter_type):
+        """ Returns the queued job, or None when too many captures are waiting. """
+        self.start()
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                return None
+            job = CaptureJob(f"{int(time.time())}-{next(self._ids)}", mode, filter_type)
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._trim()
+            self._cond.notify_all()
+            return job.to_dict()
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def wait_for_update(self, job_id, version, timeout=15.0):
+        """ Blocks until the job changes past `version`; returns (snapshot, version). """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None, version
+            self._cond.wait_for(lambda: job.version != version, timeout=timeout)
+            return job.to_dict(), job.version
+
+    def _trim(self):
+        finished = [j.id for j in self._jobs.values() if j.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def _update(self, job, **fields):
+        with self._cond:
+            for key, value in fields.items():
+                setattr(job, key, value)
+            job.version += 1
+            self._cond.notify_all()
+
+    def _run_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: bool(self._pending))
+                job = self._pending.popleft()
+
+            self._update(job, state="capturing")
+            try:
+                images = self.capture_fn(job, lambda **fields: self._update(job, **fields))
+                self._update(job, state="done", progress=1.0, images=images or [], finished_at=time.time())
+            except Exception as e:
+                traceback.print_exc()
+                self._update(job, state="error", error=str(e), finished_at=time.time())
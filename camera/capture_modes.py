@@ -2,7 +2,8 @@ import cv2
 import os
 import time
 from datetime import datetime
-from PIL import Image
+from shared.gif_encoder import StreamingGifEncoder
+from shared.animation import boomerang, get_animation_format
 
 def init_storage(base_path="E:\\magic_booth\\photos"):
     if not os.path.exists(base_path):
@@ -25,24 +26,43 @@ def save_single_photo(frame, filter_name, storage_path):
     print(f"📸 Saved photo: {filepath}")
     return filepath, filename
 
-def create_gif(frames, filter_name, storage_path):
-    if not frames:
-        return None, None
-        
+def create_gif(frames, filter_name, storage_path, duration=0.2, max_width=640):
+    """
+    Streams BGR frames (any iterable, e.g. a generator that captures as it
+    goes) into a GIF on disk; see gif_encoder.StreamingGifEncoder.
+    """
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"magic_burst_{timestamp}_{filter_name}.gif"
     filepath = os.path.join(storage_path, filename)
     
-    # Convert OpenCV BGR frames to PIL RGB Images
-    pil_frames = [Image.fromarray(cv2.cvtColor(f, cv2.COLOR_BGR2RGB)) for f in frames]
-    
-    # Save as GIF
-    pil_frames[0].save(
-        filepath,
-        save_all=True,
-        append_images=pil_frames[1:],
-        duration=200, # 200ms per frame
-        loop=0
-    )
+    with open(filepath, "wb") as f:
+        with StreamingGifEncoder(f, duration, max_width, palette_key=filter_name) as encoder:
+            for frame in frames:
+                encoder.add_frame(frame)
+                
+    if encoder.frame_count == 0:
+        os.remove(filepath)
+        return None, None
     print(f"🎞️ Saved GIF: {filepath}")
     return filepath, filename
+
+def create_animation(frames, filter_name, storage_path, fmt="gif", duration=0.2, max_width=640, boomerang_loop=False):
+    """ GIF-mode output in any format from shared/animation.py; plain GIFs keep the streaming path. """
+    anim = get_animation_format(fmt)
+    if anim.name == "gif" and not boomerang_loop:
+        return create_gif(frames, filter_name, storage_path, duration, max_width)
+        
+    frames = list(frames)
+    if boomerang_loop:
+        frames = boomerang(frames)
+    data = anim.encode(frames, duration, max_width, filter_name)
+    if not data:
+        return None, None
+        
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"magic_burst_{timestamp}_{filter_name}{anim.extension}"
+    filepath = os.path.join(storage_path, filename)
+    with open(filepath, "wb") as f:
+        f.write(data)
+    print(f"🎞️ Saved animation: {filepath}")
+    return filepath, filename
@@ -1,13 +1,19 @@
 import cv2
 import numpy as np
-import random
 
-def apply_filter(frame, filter_name):
+from shared.noise import NOISE
+
+def apply_filter(frame, filter_name, out=None):
+    """
+    Returns the filtered frame. A frame-sized uint8 `out` receives the result,
+    so a stream can reuse one buffer; always use the return value, which is a
+    new array when `out` doesn't fit and `frame` itself for unknown filters.
+    """
     if filter_name == "NONE":
         # Basic enhancement
         alpha = 1.1 # Contrast control
         beta = 10   # Brightness control
-        return cv2.convertScaleAbs(frame, alpha=alpha, beta=beta)
+        return cv2.convertScaleAbs(frame, dst=out, alpha=alpha, beta=beta)
         
     elif filter_name == "NOIR":
         # Dark dramatic B&W
@@ -15,7 +21,7 @@ def apply_filter(frame, filter_name):
         # Increase contrast heavily
         gray = cv2.convertScaleAbs(gray, alpha=1.3, beta=-30)
         # Convert back to BGR so it matches other filters' shape
-        return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+        return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=out)
         
     elif filter_name == "NEON":
         # Stranger Things glow (Red/blue tint)
@@ -33,30 +39,25 @@ def apply_filter(frame, filter_name):
         
         # Add a red-tint overlay
         overlay = np.full(frame.shape, (20, 10, 60), dtype=np.uint8) # BGR: slight red tint + blue
-        result = cv2.addWeighted(bgr, 0.8, overlay, 0.2, 0)
+        result = cv2.addWeighted(bgr, 0.8, overlay, 0.2, 0, dst=out)
         return result
         
     elif filter_name == "GLITCH":
         # Upside Down distortion
         # Shift channels and add noise
-        h, w, c = frame.shape
-        glitch_frame = frame.copy()
-        
-        # Random channel shift
-        shift = random.randint(-15, 15)
-        if shift > 0:
-            glitch_frame[:, shift:, 0] = frame[:, :-shift, 0] # Shift Blue
-            glitch_frame[:, :-shift, 2] = frame[:, shift:, 2] # Shift Red
-        else:
-            shift = abs(shift)
-            glitch_frame[:, :-shift, 0] = frame[:, shift:, 0]
-            glitch_frame[:, shift:, 2] = frame[:, :-shift, 2]
-            
-        # Add scanlines
-        for i in range(0, h, 4):
-            glitch_frame[i:i+1, :] = cv2.add(glitch_frame[i:i+1, :], np.array([-20, -20, -20], dtype=np.int16).clip(0,255))
-            
-        return glitch_frame
+        if out is None or out.shape != frame.shape or out.dtype != frame.dtype or out is frame:
+            out = np.empty_like(frame)
+        np.copyto(out, frame)
+
+        # Random channel shift: blue one way, red the other
+        shift = NOISE.integers(-15, 16)
+        if shift:
+            near, far = slice(None, -abs(shift)), slice(abs(shift), None)
+            if shift < 0:
+                near, far = far, near
+            out[:, far, 0] = frame[:, near, 0]  # Shift Blue
+            out[:, near, 2] = frame[:, far, 2]  # Shift Red
+        return out
         
     elif filter_name == "RETRO":
         # 80s film look (Warm, faded, slightly grainy)
@@ -71,8 +72,9 @@ def apply_filter(frame, filter_name):
         warm = cv2.merge([b, g, r])
         
         # Add grain
-        noise = np.random.randint(-15, 15, warm.shape, dtype='int16')
-        retro = np.clip(warm.astype('int16') + noise, 0, 255).astype('uint8')
+        # Grain from the precomputed noise bank, added with saturation
+        noise = NOISE.uniform(warm.shape, -15, 15)
+        retro = cv2.add(warm, noise, dst=out, dtype=cv2.CV_8U)
         
         return retro
         
@@ -83,7 +85,7 @@ def apply_filter(frame, filter_name):
         # Lighten the image slightly
         bright = cv2.convertScaleAbs(frame, alpha=1.1, beta=10)
         # Screen blend or add weighted
-        dreamy = cv2.addWeighted(bright, 0.6, blur, 0.5, 0)
+        dreamy = cv2.addWeighted(bright, 0.6, blur, 0.5, 0, dst=out)
         
         return dreamy
         
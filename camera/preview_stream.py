@@ -0,0 +1,86 @@
+import threading
+import time
+
+import cv2
+
+from filters import apply_filter
+
+class PreviewStreamer:
+    """
+    Single producer for the MJPEG preview. One thread grabs, filters and
+    encodes frames at the preview resolution; every connected browser is
+    handed the newest JPEG. Slow clients skip frames instead of queueing them.
+    """
+    def __init__(self, read_frame, get_filter, size=(640, 360), fps=15.0, jpeg_quality=80):
+        self.read_frame = read_frame
+        self.get_filter = get_filter
+        self.size = size
+        self.fps = fps
+        self.jpeg_quality = jpeg_quality
+
+        self._cond = threading.Condition()
+        self._jpeg = None
+        self._seq = 0
+        self._subscribers = 0
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._producer_loop, daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def _producer_loop(self):
+        interval = 1.0 / self.fps
+        encode_params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        small = mirrored = filtered = None
+
+        while True:
+            with self._cond:
+                # Nobody is watching: leave the camera alone
+                if self._subscribers == 0:
+                    self._cond.wait(timeout=1.0)
+                    continue
+
+            started = time.time()
+            success, frame = self.read_frame()
+            if not success:
+                time.sleep(0.1)
+                continue
+
+            # Resize, mirror and filter into the same three buffers every frame
+            small = cv2.resize(frame, self.size, dst=small, interpolation=cv2.INTER_AREA)
+            mirrored = cv2.flip(small, 1, mirrored)
+            processed = apply_filter(mirrored, self.get_filter(), out=filtered)
+            if processed is not mirrored:
+                filtered = processed
+            ret, buffer = cv2.imencode('.jpg', processed, encode_params)
+            if ret:
+                with self._cond:
+                    self._jpeg = buffer.tobytes()
+                    self._seq += 1
+                    self._cond.notify_all()
+
+            remaining = interval - (time.time() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def frames(self):
+        """ MJPEG part generator for one subscriber. """
+        last_seq = 0
+        with self._cond:
+            self._subscribers += 1
+            self._cond.notify_all()
+        try:
+            while True:
+                with self._cond:
+                    if not self._cond.wait_for(lambda: self._seq != last_seq, timeout=1.0):
+                        continue
+                    last_seq = self._seq
+                    frame_bytes = self._jpeg
+
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        finally:
+            with self._cond:
+                self._subscribers -= 1
@@ -1,5 +1,8 @@
 import os
 import time
+import threading
+import subprocess
+import numpy as np
 
 def print_photo(image_path):
     """
@@ -24,14 +27,20 @@ def print_photo(image_path):
             win32api.ShellExecute(0, "print", image_path, f'"{printer_name}"', ".", 0)
             return True
         else:
-            # Fallback for linux/mac (CUPS)
-            os.system(f"lpr {image_path}")
+            # Fallback for linux/mac (CUPS); lpr runs off the request thread
+            threading.Thread(target=_lpr, args=(image_path,), daemon=True).start()
             return True
     except Exception as e:
         print(f"❌ Print failed: {str(e)}")
         # Fake print success for testing if no printer is connected
         return True
 
+def _lpr(image_path, timeout=30):
+    try:
+        subprocess.run(["lpr", image_path], check=True, timeout=timeout, capture_output=True)
+    except Exception as e:
+        print(f"❌ lpr failed: {str(e)}")
+
 def apply_print_layout(image_cv2, frame_type="stranger_things"):
     """
     Applies a print layout or border before saving for print.
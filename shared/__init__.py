@@ -0,0 +1,5 @@
+"""
+Modules used by both apps (backend/ and camera/): photo index, derivative
+store, GIF and animation encoders, and the seeded noise source. Each app's
+entry point puts the repository root on sys.path so `shared` imports.
+"""
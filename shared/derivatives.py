@@ -0,0 +1,171 @@
+import os
+import queue
+import shutil
+import hashlib
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+
+# name -> (longest edge in px, JPEG quality)
+DERIVATIVE_SIZES: Dict[str, Tuple[int, int]] = {
+    "thumb": (320, 70),
+    "web": (1280, 82),
+    "print": (1800, 92),  # 6x4" at 300 dpi
+}
+STILL_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+def content_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+def is_still(path: str) -> bool:
+    return path.lower().endswith(STILL_EXTENSIONS)
+
+class DerivativeStore:
+    """
+    Downscaled JPEG copies of captured stills (thumb / web / print), so the
+    gallery doesn't download full-size photos to show a strip of thumbnails.
+
+    Derivatives are named by the SHA-256 of the original's bytes: a file's
+    name doubles as its ETag and never needs invalidating. They are built on
+    one background thread right after capture (submit), or on first request
+    for photos taken before the store existed. Animations are not handled;
+    callers serve those as they are.
+
+    on_built(original_path, content_hash, {size: path}) is called after an
+    original's missing derivatives have been written.
+    """
+    def __init__(self, root: str, sizes: Dict[str, Tuple[int, int]] = DERIVATIVE_SIZES,
+                 on_built: Optional[Callable[[str, str, Dict[str, str]], None]] = None):
+        self.root = os.path.abspath(root)
+        self.sizes = dict(sizes)
+        self.on_built = on_built
+        os.makedirs(root, exist_ok=True)
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._thread = None
+        # Serialises building, so a request and the worker never encode the same file twice
+        self._build_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        # abspath of original -> (mtime_ns, size, content hash)
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker_loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, original_path: str):
+        """ Queues an original for building; returns immediately. """
+        if is_still(original_path):
+            self.start()
+            self._queue.put(original_path)
+
+    def _worker_loop(self):
+        while True:
+            path = self._queue.get()
+            try:
+                self.ensure(path)
+            except Exception as e:
+                print(f"⚠️ Derivatives failed for {path}: {e}")
+
+    def hash_of(self, original_path: str) -> str:
+        key = os.path.abspath(original_path)
+        st = os.stat(key)
+        with self._index_lock:
+            entry = self._hashes.get(key)
+        if entry and entry[:2] == (st.st_mtime_ns, st.st_size):
+            return entry[2]
+        digest = content_hash(key)
+        with self._index_lock:
+            self._hashes[key] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    def path_for(self, digest: str, size: str) -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}_{size}.jpg")
+
+    def ensure(self, original_path: str) -> str:
+        """ Builds whatever derivatives of the original are missing; returns its content hash. """
+        digest = self.hash_of(original_path)
+        if all(os.path.exists(self.path_for(digest, size)) for size in self.sizes):
+            return digest
+        with self._build_lock:
+            missing = [size for size in self.sizes if not os.path.exists(self.path_for(digest, size))]
+            if missing:
+                image = cv2.imread(original_path, cv2.IMREAD_COLOR)
+                if image is None:
+                    raise ValueError(f"Cannot decode {original_path}")
+                for size in missing:
+                    self._build(image, original_path, digest, size)
+        if missing and self.on_built is not None:
+            self.on_built(original_path, digest, {size: self.path_for(digest, size) for size in self.sizes})
+        return digest
+
+    def _build(self, image, original_path: str, digest: str, size: str):
+        edge, quality = self.sizes[size]
+        target = self.path_for(digest, size)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = target + ".tmp"
+        h, w = image.shape[:2]
+        scale = edge / max(h, w)
+        if scale >= 1 and original_path.lower().endswith((".jpg", ".jpeg")):
+            # Already small enough: share the original's bytes instead of re-encoding
+            try:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                os.link(original_path, tmp)
+            except OSError:
+                shutil.copyfile(original_path, tmp)
+        else:
+            if scale < 1:
+                image = cv2.resize(image, (max(1, round(w * scale)), max(1, round(h * scale))),
+                                   interpolation=cv2.INTER_AREA)
+            ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                raise RuntimeError(f"JPEG encode failed for {original_path}")
+            with open(tmp, "wb") as f:
+                f.write(encoded.tobytes())
+        # Readers never see a half-written derivative
+        os.replace(tmp, target)
+
+    def get(self, original_path: str, size: str) -> Optional[Tuple[str, str]]:
+        """ (derivative path, ETag) for a still, building it if needed; None for unknown sizes or animations. """
+        if size not in self.sizes or not is_still(original_path):
+            return None
+        digest = self.ensure(original_path)
+        return self.path_for(digest, size), f"{digest}-{size}"
+
+    def evict(self, original_path: str, digest: Optional[str] = None) -> List[str]:
+        """
+        Removes an original's derivatives, before or after the original itself
+        is deleted (after, only if its hash is known here or passed as
+        `digest`). Derivatives shared with another known original (identical
+        bytes) are kept. Returns the paths removed.
+        """
+        key = os.path.abspath(original_path)
+        with self._index_lock:
+            entry = self._hashes.pop(key, None)
+        if not digest:
+            if entry is not None:
+                digest = entry[2]
+            elif os.path.exists(key):
+                digest = content_hash(key)
+            else:
+                return []
+        with self._index_lock:
+            if any(h == digest for _, _, h in self._hashes.values()):
+                return []
+        removed = []
+        with self._build_lock:
+            for size in self.sizes:
+                path = self.path_for(digest, size)
+                try:
+                    os.remove(path)
+                    removed.append(path)
+                except FileNotFoundError:
+                    pass
+        return removed
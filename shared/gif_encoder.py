@@ -0,0 +1,160 @@
+import io
+import threading
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+# Palette index 255 is kept free and marks "unchanged since the last frame"
+TRANSPARENT_INDEX = 255
+
+# Frames sampled for the palette (buffered while streaming), and the pixel stride used when sampling
+PALETTE_SAMPLE_FRAMES = 2
+PALETTE_SAMPLE_STRIDE = 2
+# Grey-only looks whose palette doesn't depend on the scene, so it is kept across GIFs
+SHARED_PALETTE_KEYS = ("bw", "noir")
+
+_palette_lock = threading.Lock()
+_palettes: Dict[str, Image.Image] = {}
+
+def _cached_palette(key: Optional[str]) -> Optional[Image.Image]:
+    if key is None or key.lower() not in SHARED_PALETTE_KEYS:
+        return None
+    with _palette_lock:
+        return _palettes.get(key.lower())
+
+def _sampled_palette(key: Optional[str], frames: List[np.ndarray]) -> Image.Image:
+    """ 255-colour palette image built from every PALETTE_SAMPLE_STRIDE-th pixel of `frames` (RGB). """
+    sample = np.concatenate([f[::PALETTE_SAMPLE_STRIDE, ::PALETTE_SAMPLE_STRIDE] for f in frames], axis=0)
+    palette = Image.fromarray(np.ascontiguousarray(sample)).quantize(colors=TRANSPARENT_INDEX,
+                                                                     method=Image.Quantize.MEDIANCUT)
+    if key is not None and key.lower() in SHARED_PALETTE_KEYS:
+        with _palette_lock:
+            palette = _palettes.setdefault(key.lower(), palette)
+    return palette
+
+class StreamingGifEncoder:
+    """
+    Writes an animated GIF one frame at a time.
+
+    Frames (BGR, as they come out of the filters) are downscaled to
+    `max_width` and mapped onto one global palette. Callers that already
+    hold the frames pass a few of them as `palette_frames` and the palette is
+    built up front; otherwise it is sampled from the first
+    PALETTE_SAMPLE_FRAMES frames, which are held until it is built. After
+    that each frame is written immediately and only the previous frame's
+    palette indices are kept in memory. Each frame after the first is stored
+    as the bounding box of the pixels that changed, with unchanged pixels
+    inside the box made transparent.
+
+    Every GIF gets its own palette, except for the grey looks named in
+    SHARED_PALETTE_KEYS: for those the palette of the first GIF with that
+    `palette_key` (the filter name) is reused and nothing is buffered.
+    """
+    def __init__(self, fp: BinaryIO, duration: float = 0.2, max_width: Optional[int] = 640,
+                 palette_key: Optional[str] = None, loop: int = 0,
+                 palette_frames: Optional[List[np.ndarray]] = None):
+        self.fp = fp
+        self.duration_ms = int(round(duration * 1000))
+        self.max_width = max_width
+        self.palette_key = palette_key
+        self.loop = loop
+        self.frame_count = 0
+        self._palette: Optional[Image.Image] = _cached_palette(palette_key)
+        self._pending: List[np.ndarray] = []
+        self._size: Optional[Tuple[int, int]] = None
+        self._prev: Optional[np.ndarray] = None
+        if self._palette is None and palette_frames:
+            self._palette = _sampled_palette(palette_key, [self._prepare(f) for f in palette_frames])
+
+    def _output_size(self, width: int, height: int) -> Tuple[int, int]:
+        if self.max_width and width > self.max_width:
+            return self.max_width, max(1, int(round(height * self.max_width / width)))
+        return width, height
+
+    def _indexed(self, indices: np.ndarray) -> Image.Image:
+        palette = self._palette.getpalette()[:TRANSPARENT_INDEX * 3]
+        im = Image.fromarray(indices)
+        im.putpalette(palette + [0] * (256 * 3 - len(palette)))
+        return im
+
+    def _prepare(self, frame: np.ndarray) -> np.ndarray:
+        """ BGR frame -> RGB at the GIF's output size (set by the first frame seen). """
+        if self._size is None:
+            self._size = self._output_size(frame.shape[1], frame.shape[0])
+        if (frame.shape[1], frame.shape[0]) != self._size:
+            frame = cv2.resize(frame, self._size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def add_frame(self, frame: np.ndarray):
+        rgb = self._prepare(frame)
+        self.frame_count += 1
+
+        if self._palette is None:
+            self._pending.append(rgb)
+            if len(self._pending) >= PALETTE_SAMPLE_FRAMES:
+                self._flush_pending()
+            return
+        self._write_frame(rgb)
+
+    def _flush_pending(self):
+        if not self._pending:
+            return
+        self._palette = _sampled_palette(self.palette_key, self._pending)
+        pending, self._pending = self._pending, []
+        for rgb in pending:
+            self._write_frame(rgb)
+
+    def _write_frame(self, rgb: np.ndarray):
+        quantized = Image.fromarray(rgb).quantize(palette=self._palette, dither=Image.Dither.NONE)
+        indices = np.asarray(quantized, dtype=np.uint8)
+
+        if self._prev is None:
+            header, _ = GifImagePlugin.getheader(self._indexed(indices), info={"loop": self.loop, "optimize": False})
+            self._write(header)
+            self._write(GifImagePlugin.getdata(self._indexed(indices), (0, 0), duration=self.duration_ms, disposal=1))
+        else:
+            changed = indices != self._prev
+            rows = np.flatnonzero(changed.any(axis=1))
+            if rows.size:
+                cols = np.flatnonzero(changed.any(axis=0))
+                y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+                patch = np.where(changed[y0:y1, x0:x1], indices[y0:y1, x0:x1], TRANSPARENT_INDEX).astype(np.uint8)
+            else:
+                # Nothing changed; a 1x1 transparent frame keeps the timing
+                y0, x0 = 0, 0
+                patch = np.full((1, 1), TRANSPARENT_INDEX, dtype=np.uint8)
+            self._write(GifImagePlugin.getdata(self._indexed(patch), (int(x0), int(y0)), duration=self.duration_ms,
+                                               disposal=1, transparency=TRANSPARENT_INDEX))
+        self._prev = indices
+
+    def close(self):
+        # Shorter than the sample: build the palette from what there is
+        self._flush_pending()
+        if self._prev is not None:
+            self.fp.write(b";")
+        self._prev = None
+
+    def _write(self, chunks):
+        for chunk in chunks:
+            self.fp.write(chunk)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def encode_gif(frames, duration: float = 0.2, max_width: Optional[int] = 640, palette_key: Optional[str] = None) -> Optional[bytes]:
+    """ Encodes an iterable of BGR frames into GIF bytes; None if there were no frames. """
+    sample = None
+    if isinstance(frames, (list, tuple)) and frames:
+        # Already in memory: sample across the whole animation instead of its start
+        step = max(1, len(frames) // PALETTE_SAMPLE_FRAMES)
+        sample = list(frames[::step][:PALETTE_SAMPLE_FRAMES])
+    with io.BytesIO() as buf:
+        with StreamingGifEncoder(buf, duration, max_width, palette_key, palette_frames=sample) as encoder:
+            for frame in frames:
+                encoder.add_frame(frame)
+        return buf.getvalue() if encoder.frame_count else None
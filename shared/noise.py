@@ -0,0 +1,94 @@
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Tiles are this many pixels larger than the frame in each direction, giving
+# (MARGIN + 1)^2 offsets per tile to sample from
+MARGIN = 64
+TILES_PER_SHAPE = 4
+MAX_TEXTURES = 16
+# Fixed so the grain texture itself is identical in every process and run
+TEXTURE_SEED = 2026
+
+TextureKey = Tuple[str, Tuple[int, ...], float, float]
+
+class NoiseBank:
+    """
+    Precomputed int8 noise textures. Generating float64 noise for every frame
+    costs more than the rest of a grain filter; instead a few frame-sized
+    tiles are made once per (shape, distribution) and each frame takes one at
+    a random offset and flip, then adds it with a single saturating cv2.add.
+
+    Tile contents are fixed (TEXTURE_SEED); what varies per frame is drawn
+    from `rng`, which seed() resets, so filtered output is reproducible.
+    """
+    def __init__(self, seed: Optional[int] = None, tiles_per_shape: int = TILES_PER_SHAPE, margin: int = MARGIN):
+        self.tiles_per_shape = tiles_per_shape
+        self.margin = margin
+        self.rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._textures: Dict[TextureKey, Tuple[np.ndarray, ...]] = {}
+        self._local = threading.local()
+
+    def seed(self, seed: Optional[int]):
+        """ Restarts the per-frame draws; None reseeds from the OS. """
+        self.rng = np.random.default_rng(seed)
+
+    def integers(self, low: int, high: int) -> int:
+        """ A draw in [low, high) from the bank's RNG, for effects that need seeded randomness. """
+        return int(self.rng.integers(low, high))
+
+    def _tiles(self, key: TextureKey, make: Callable[[np.random.Generator, Tuple[int, ...]], np.ndarray]) -> Tuple[np.ndarray, ...]:
+        tiles = self._textures.get(key)
+        if tiles is None:
+            kind, shape, a, b = key
+            tile_shape = (shape[0] + self.margin, shape[1] + self.margin) + shape[2:]
+            # Seeded from the key, so a texture doesn't depend on which one was built first
+            rng = np.random.default_rng([TEXTURE_SEED, kind == "uniform", *tile_shape,
+                                         int(a * 1000) & 0xFFFF, int(b * 1000) & 0xFFFF])
+            tiles = tuple(make(rng, tile_shape) for _ in range(self.tiles_per_shape))
+            for tile in tiles:
+                tile.setflags(write=False)
+            with self._lock:
+                if len(self._textures) >= MAX_TEXTURES:
+                    self._textures.clear()
+                tiles = self._textures.setdefault(key, tiles)
+        return tiles
+
+    def _sample(self, tiles: Tuple[np.ndarray, ...], shape: Tuple[int, ...]) -> np.ndarray:
+        rows, cols = shape[:2]
+        index, dy, dx, flip = self.rng.integers((len(tiles), self.margin + 1, self.margin + 1, 4))
+        view = tiles[index][dy:dy + rows, dx:dx + cols]
+        if flip == 3:
+            return view
+        # cv2 would copy a negative-stride view anyway, so flip into a per-thread buffer
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buffer = buffers.get(view.shape)
+        if buffer is None:
+            buffers.clear()
+            buffer = buffers[view.shape] = np.empty(view.shape, dtype=np.int8)
+        return cv2.flip(view, int(flip) - 1, dst=buffer)
+
+    def gaussian(self, shape: Tuple[int, ...], sigma: float) -> np.ndarray:
+        """ int8 noise ~ N(0, sigma), rounded. Valid until this thread's next draw. """
+        def make(rng, tile_shape):
+            tile = rng.standard_normal(tile_shape, dtype=np.float32)
+            tile *= sigma
+            return np.clip(np.rint(tile), -128, 127).astype(np.int8)
+        return self._sample(self._tiles(("gaussian", tuple(shape), sigma, 0.0), make), shape)
+
+    def uniform(self, shape: Tuple[int, ...], low: int, high: int) -> np.ndarray:
+        """ int8 noise uniform in [low, high). Valid until this thread's next draw. """
+        def make(rng, tile_shape):
+            return rng.integers(low, high, tile_shape, dtype=np.int8)
+        return self._sample(self._tiles(("uniform", tuple(shape), low, high), make), shape)
+
+NOISE = NoiseBank()
+
+def set_noise_seed(seed: Optional[int]):
+    """ Seeds the grain and glitch randomness used by the filters. """
+    NOISE.seed(seed)
@@ -0,0 +1,274 @@
+"""
+SQLite index of captured photos, and a command to rebuild it from disk:
+
+    python -m shared.photo_index reconcile
+    python -m shared.photo_index reconcile --db E:\\magic_booth\\photos\\photos.db --derivatives E:\\magic_booth\\photos\\.derivatives E:\\magic_booth\\photos
+"""
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import datetime
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MEDIA_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".mp4")
+ANIMATION_EXTENSIONS = (".gif", ".webp", ".mp4")
+DEFAULT_ROOTS = [os.path.join("storage", "local_backup")]
+
+# Backend names carry a unix timestamp (magic_burst_1760000000.jpg), camera
+# names a local date and the filter (magic_20261018_142501_NOIR_burst0.jpg)
+_UNIX_NAME = re.compile(r"^magic_(?:burst_|anim_)?(\d{9,11})\.")
+_DATED_NAME = re.compile(r"^magic_(?:burst_)?(\d{8}_\d{6})_([A-Za-z_]+?)(?:_burst\d+)?\.")
+
+Cursor = Tuple[float, int]
+
+def guess_metadata(path: str) -> Tuple[Optional[str], Optional[str], Optional[float]]:
+    """ (mode, filter, taken_at) from a capture's file name; None where the name doesn't say. """
+    name = os.path.basename(path)
+    lower = name.lower()
+    mode = "gif" if lower.endswith(ANIMATION_EXTENSIONS) else "burst" if "burst" in lower else "single"
+    match = _UNIX_NAME.match(name)
+    if match:
+        return mode, None, float(match.group(1))
+    match = _DATED_NAME.match(name)
+    if match:
+        taken_at = datetime.datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").timestamp()
+        return mode, match.group(2), taken_at
+    return mode, None, None
+
+def encode_cursor(cursor: Optional[Cursor]) -> Optional[str]:
+    return f"{cursor[0]!r}:{cursor[1]}" if cursor else None
+
+def parse_cursor(text: Optional[str]) -> Optional[Cursor]:
+    if not text:
+        return None
+    taken_at, photo_id = text.rsplit(":", 1)
+    return float(taken_at), int(photo_id)
+
+class PhotoIndex:
+    """
+    Every capture on disk, so listings and lookups never walk the storage
+    directories. SQLite in WAL mode, one row per file keyed by absolute path.
+
+    Rows carry the capture's local `day`; gallery pages are read newest
+    first with a keyset cursor over (taken_at, id) on an index, optionally
+    within one day, so a late page costs the same as the first.
+
+    The save, upload, print and derivative workers each update their own
+    columns with a single statement. A failed write is logged and dropped:
+    the index is never the only record, and reconcile() rebuilds it from disk.
+    """
+    def __init__(self, path: str = os.path.join("storage", "photos.db")):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS photos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL UNIQUE,
+                mode TEXT,
+                filter TEXT,
+                taken_at REAL NOT NULL,
+                day TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL DEFAULT 0,
+                upload_status TEXT NOT NULL DEFAULT 'none',
+                remote_url TEXT,
+                print_status TEXT NOT NULL DEFAULT 'none',
+                content_hash TEXT,
+                derivatives TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS photos_by_time ON photos (taken_at, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS photos_by_day ON photos (day, taken_at, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS photos_by_remote_url ON photos (remote_url)")
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.abspath(path)
+
+    @staticmethod
+    def _day(taken_at: float) -> str:
+        return datetime.datetime.fromtimestamp(taken_at).strftime("%Y-%m-%d")
+
+    def _write(self, sql: str, params: tuple) -> int:
+        try:
+            with self._lock:
+                return self._conn.execute(sql, params).rowcount
+        except sqlite3.Error as e:
+            print(f"[PhotoIndex] Write failed: {e}")
+            return 0
+
+    def add(self, path: str, mode: Optional[str] = None, filter_name: Optional[str] = None,
+            taken_at: Optional[float] = None, upload_status: str = "none", print_status: str = "none"):
+        """ Records a saved capture; re-adding a path refreshes its metadata but keeps its statuses. """
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            print(f"[PhotoIndex] Cannot index {path}: {e}")
+            return
+        taken_at = taken_at or st.st_mtime
+        self._write(
+            "INSERT INTO photos (path, mode, filter, taken_at, day, size_bytes, upload_status, print_status, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET mode = excluded.mode, filter = excluded.filter, taken_at = excluded.taken_at, "
+            "day = excluded.day, size_bytes = excluded.size_bytes, updated_at = excluded.updated_at",
+            (self._key(path), mode, filter_name, taken_at, self._day(taken_at), st.st_size,
+             upload_status, print_status, time.time())
+        )
+
+    def set_upload(self, path: str, status: str, remote_url: Optional[str] = None):
+        self._write("UPDATE photos SET upload_status = ?, remote_url = COALESCE(?, remote_url), updated_at = ? WHERE path = ?",
+                    (status, remote_url, time.time(), self._key(path)))
+
+    def set_print(self, path: str, status: str):
+        self._write("UPDATE photos SET print_status = ?, updated_at = ? WHERE path = ?",
+                    (status, time.time(), self._key(path)))
+
+    def set_derivatives(self, path: str, content_hash: str, derivatives: Dict[str, str]):
+        self._write("UPDATE photos SET content_hash = ?, derivatives = ?, updated_at = ? WHERE path = ?",
+                    (content_hash, json.dumps(derivatives), time.time(), self._key(path)))
+
+    def remove(self, path: str):
+        self._write("DELETE FROM photos WHERE path = ?", (self._key(path),))
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> dict:
+        photo = dict(row)
+        photo["derivatives"] = json.loads(photo["derivatives"]) if photo["derivatives"] else {}
+        return photo
+
+    def get(self, path: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM photos WHERE path = ?", (self._key(path),)).fetchone()
+        return self._row(row) if row else None
+
+    def by_remote_url(self, remote_url: str) -> Optional[dict]:
+        """ The capture that was uploaded to `remote_url`, if it is still indexed. """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM photos WHERE remote_url = ? ORDER BY id DESC LIMIT 1",
+                                     (remote_url,)).fetchone()
+        return self._row(row) if row else None
+
+    def page(self, limit: int = 50, cursor: Optional[Cursor] = None, day: Optional[str] = None,
+             mode: Optional[str] = None) -> Tuple[List[dict], Optional[Cursor]]:
+        """ Newest-first page of photos older than `cursor`; returns (photos, cursor of the next page or None). """
+        clauses, params = [], []
+        if day:
+            clauses.append("day = ?")
+            params.append(day)
+        if mode:
+            clauses.append("mode = ?")
+            params.append(mode)
+        if cursor:
+            # Row-value comparison, so SQLite walks the index instead of sorting
+            clauses.append("(taken_at, id) < (?, ?)")
+            params += [cursor[0], cursor[1]]
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM photos {where} ORDER BY taken_at DESC, id DESC LIMIT ?", (*params, limit + 1)
+            ).fetchall()
+        photos = [self._row(row) for row in rows[:limit]]
+        next_cursor = (photos[-1]["taken_at"], photos[-1]["id"]) if len(rows) > limit else None
+        return photos, next_cursor
+
+    def days(self) -> List[Tuple[str, int]]:
+        """ (day, photo count), newest day first. """
+        with self._lock:
+            rows = self._conn.execute("SELECT day, COUNT(*) FROM photos GROUP BY day ORDER BY day DESC").fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+    def counts(self) -> dict:
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM photos").fetchone()[0]
+            upload = self._conn.execute("SELECT upload_status, COUNT(*) FROM photos GROUP BY upload_status").fetchall()
+            printed = self._conn.execute("SELECT print_status, COUNT(*) FROM photos GROUP BY print_status").fetchall()
+        return {"photos": total, "upload": {r[0]: r[1] for r in upload}, "print": {r[0]: r[1] for r in printed}}
+
+    def reconcile(self, roots: Iterable[str], derivatives=None) -> dict:
+        """
+        Rebuilds the rows under `roots` from what is on disk, in one
+        transaction: files missing from the index are added (metadata from
+        their names), rows whose file is gone are dropped, and upload/print
+        statuses of surviving rows are kept. With a DerivativeStore, each
+        file's existing derivatives are recorded too (this reads every file).
+        Dot-directories (e.g. .derivatives) are skipped.
+        """
+        roots = [self._key(root) for root in roots]
+        found: Dict[str, os.stat_result] = {}
+        for root in roots:
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+                for filename in filenames:
+                    if filename.lower().endswith(MEDIA_EXTENSIONS):
+                        path = os.path.join(dirpath, filename)
+                        found[path] = os.stat(path)
+
+        now = time.time()
+        rows = []
+        for path, st in found.items():
+            mode, filter_name, taken_at = guess_metadata(path)
+            taken_at = taken_at or st.st_mtime
+            content_hash, paths = None, None
+            if derivatives is not None:
+                content_hash = derivatives.hash_of(path)
+                paths = {size: derivatives.path_for(content_hash, size) for size in derivatives.sizes}
+                paths = json.dumps({size: p for size, p in paths.items() if os.path.exists(p)})
+            rows.append((path, mode, filter_name, taken_at, self._day(taken_at), st.st_size, content_hash, paths, now))
+
+        with self._lock:
+            existing = [row[0] for row in self._conn.execute("SELECT path FROM photos").fetchall()]
+            stale = [(p,) for p in existing
+                     if p not in found and any(p.startswith(root + os.sep) for root in roots)]
+            known = set(existing)
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("DELETE FROM photos WHERE path = ?", stale)
+                self._conn.executemany(
+                    "INSERT INTO photos (path, mode, filter, taken_at, day, size_bytes, content_hash, derivatives, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET size_bytes = excluded.size_bytes, "
+                    "content_hash = COALESCE(excluded.content_hash, content_hash), "
+                    "derivatives = COALESCE(excluded.derivatives, derivatives), updated_at = excluded.updated_at",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        added = sum(1 for path in found if path not in known)
+        return {"files": len(found), "added": added, "removed": len(stale)}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Photo index maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("reconcile", help="Rebuild the index from the files on disk")
+    rec.add_argument("roots", nargs="*", default=DEFAULT_ROOTS, help=f"Directories to scan (default: {', '.join(DEFAULT_ROOTS)})")
+    rec.add_argument("--db", default=os.path.join("storage", "photos.db"))
+    rec.add_argument("--derivatives", default=None, help="DerivativeStore root whose files should be recorded")
+    args = parser.parse_args(argv)
+
+    index = PhotoIndex(args.db)
+    store = None
+    if args.derivatives:
+        from .derivatives import DerivativeStore
+        store = DerivativeStore(args.derivatives)
+    roots = [root for root in args.roots if os.path.isdir(root)]
+    started = time.perf_counter()
+    result = index.reconcile(roots, store)
+    print(f"Reconciled {result['files']} files in {', '.join(roots) or 'no directories'}: "
+          f"{result['added']} added, {result['removed']} removed ({time.perf_counter() - started:.2f}s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
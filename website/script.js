@@ -10,6 +10,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const galleryTimeline = document.getElementById('galleryTimeline');
     const photoModal = document.getElementById('photoModal');
     const modalImage = document.getElementById('modalImage');
+    const modalVideo = document.getElementById('modalVideo');
     const closeBtn = document.querySelector('.close-btn');
     const printBtn = document.getElementById('printBtn');
     const printIndicator = document.getElementById('printIndicator');
@@ -100,9 +101,16 @@ document.addEventListener('DOMContentLoaded', () => {
         try {
             captureBtn.innerHTML = 'PROCESSING...';
             const res = await fetch(`${apiBase}/api/capture`, { method: 'POST' });
-            const data = await res.json();
+            const queued = await res.json();
+            if (!res.ok) {
+                alert(queued.message || "Camera busy, try again.");
+                return;
+            }
+
+            // Capture runs in the background; poll until the job finishes
+            const data = await waitForCapture(queued.job_id);
 
-            if (data.status === 'success' && data.images.length > 0) {
+            if (data.state === 'done' && data.images.length > 0) {
                 // Add new photos to gallery
                 data.images.forEach(filename => {
                     addGalleryItem(filename);
@@ -119,14 +127,34 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    async function waitForCapture(jobId) {
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 300));
+            const res = await fetch(`${apiBase}/api/capture/${jobId}`);
+            const job = await res.json();
+            if (!res.ok || job.state === 'error') {
+                throw new Error(job.error || job.message || 'Capture failed');
+            }
+            if (job.state === 'done') {
+                return job;
+            }
+            captureBtn.innerHTML = job.state === 'processing' ? 'PROCESSING...' : 'CAPTURING...';
+        }
+    }
+
     function addGalleryItem(filename) {
         const item = document.createElement('div');
         item.className = 'timeline-item';
 
-        const img = document.createElement('img');
-        img.src = `${apiBase}/photos/${filename}`;
+        // MP4 animations need a video element; everything else is an image
+        const media = document.createElement(isVideo(filename) ? 'video' : 'img');
+        if (isVideo(filename)) {
+            Object.assign(media, { autoplay: true, loop: true, muted: true, playsInline: true });
+        }
+        // Stills load a small thumbnail; the server ignores ?size for animations
+        media.src = `${apiBase}/photos/${filename}?size=thumb`;
 
-        item.appendChild(img);
+        item.appendChild(media);
 
         // Add to top of timeline
         galleryTimeline.insertBefore(item, galleryTimeline.firstChild);
@@ -144,7 +172,16 @@ document.addEventListener('DOMContentLoaded', () => {
 
     function openModal(filename) {
         currentModalFile = filename;
-        modalImage.src = `${apiBase}/photos/${filename}`;
+        const src = `${apiBase}/photos/${filename}?size=web`;
+        if (isVideo(filename)) {
+            modalVideo.src = src;
+            modalImage.classList.add('hidden');
+            modalVideo.classList.remove('hidden');
+        } else {
+            modalImage.src = src;
+            modalVideo.classList.add('hidden');
+            modalImage.classList.remove('hidden');
+        }
         photoModal.classList.remove('hidden');
         printIndicator.classList.add('hidden');
         printBtn.style.display = 'block';
@@ -153,6 +190,11 @@ document.addEventListener('DOMContentLoaded', () => {
     function closeModal() {
         photoModal.classList.add('hidden');
         modalImage.src = '';
+        modalVideo.removeAttribute('src');
+    }
+
+    function isVideo(filename) {
+        return filename.toLowerCase().endsWith('.mp4');
     }
 
     async function triggerPrint() {